@@ -0,0 +1,321 @@
+"""
+End-to-end offline benchmark of `infiv build`.
+
+Every spider is pointed to the recorded pages of `benchmarks/fixtures/build`,
+replayed by `replay_server.py` with a configurable latency, and the embeddings
+come from `FakeEmbedder`, so no network or api key is needed. `build.main` is
+run at each scale (the total number of fetched items) in a fresh process and
+working directory, first with empty caches (cold) and then again on the caches
+left by the first run (warm).
+
+The wall time of each stage, the busy time of the stages streamed during the
+fetch, the peak RSS and the throughput of every run are written as a JSON
+artifact, tagged with the commit, so two artifacts of different commits can be
+compared with `--compare`.
+
+usage: python benchmarks/bench_build.py [--scales 100 1000 10000] [--output bench_build.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+## share of each spider in the fetched items
+SOURCE_SHARES = {
+    "arxiv": 0.4,
+    "cool_paper": 0.25,
+    "rss": 0.15,
+    "biorxiv": 0.1,
+    "zhihu": 0.05,
+    "bilibili": 0.05,
+}
+
+STAGES = ("config", "fetch", "filter", "merge", "rank", "render", "state", "archive")
+## the streamed stages, overlapping the fetch, reported by their busy time
+STREAMED_STAGES = ("filter", "embed")
+
+
+def source_counts(scale: int) -> Dict[str, int]:
+    counts = {name: int(scale * share) for name, share in SOURCE_SHARES.items()}
+    counts["arxiv"] += scale - sum(counts.values())
+    return counts
+
+
+def source_config(counts: Dict[str, int], parse_processes: Optional[int] = None) -> dict:
+    from replay_server import SOURCE_URLS
+
+    ## no politeness delay against the local server, only its latency
+    budget = {"max_in_flight": 8, "min_interval": 0.0}
+    sources = [
+        {"func": "infiv.spiders.arxiv.iter_info", "url": SOURCE_URLS["arxiv"], "subject": "paper"},
+        {"func": "infiv.spiders.rsshub.cool_paper_arxiv.get_info", "url": SOURCE_URLS["cool_paper"], "subject": "paper"},
+        {"func": "infiv.spiders.rsshub.default.get_info", "url": SOURCE_URLS["rss"], "subject": "news"},
+        {
+            "func": "infiv.spiders.bioxriv.iter_info", "url": SOURCE_URLS["biorxiv"], "subject": "preprint",
+            "kwargs": {"max_items": counts["biorxiv"], **budget},
+        },
+        {
+            "func": "infiv.spiders.zhihu.get_info", "url": SOURCE_URLS["zhihu"], "subject": "feed",
+            "kwargs": {"max_items": counts["zhihu"]},
+        },
+        {
+            "func": "infiv.spiders.bilibili.get_info", "url": SOURCE_URLS["bilibili"], "subject": "feed",
+            "kwargs": {"max_items": counts["bilibili"], **budget},
+        },
+    ]
+    return {
+        "sources": [source for source in sources if counts[source_name(source)] > 0],
+        "retry": {"max_retries": 1, "base_delay": 0},
+        "http": {"pool_maxsize": 32},
+        "parser": {"processes": parse_processes},
+        "embedder": {"func": "infiv.embedders.fake.FakeEmbedder"},
+        "rerank": {"likes": ["efficient vision transformer"], "dislikes": ["protein sequencing"], "top_k": 1000},
+        "state": {"enable": False},  # every run delivers the same items
+        "metrics": {"history": None},
+    }
+
+
+def source_name(source: dict) -> str:
+    from replay_server import SOURCE_URLS
+
+    return next(name for name, url in SOURCE_URLS.items() if url == source["url"])
+
+
+## worker: a single build in the current process
+
+
+def use_replay_server(base_url: str):
+    """
+    send the requests of the build http client to the replay server
+    """
+    import infiv.http
+    from replay_server import ReplayAdapter
+
+    ## imported by `build.main` when it runs
+    configure_client = infiv.http.configure_client
+
+    def replay_configure_client(**kwargs):
+        client = configure_client(**kwargs)
+        adapter = ReplayAdapter(base_url, pool_connections=4, pool_maxsize=kwargs.get("pool_maxsize", 10))
+        client.session.mount("http://", adapter)
+        client.session.mount("https://", adapter)
+        return client
+
+    infiv.http.configure_client = replay_configure_client
+
+
+def run_worker(args: argparse.Namespace):
+    os.environ.setdefault("ZHIHU_COOKIE", "bench")
+    os.environ.setdefault("BILIBILI_COOKIE", "bench")
+    os.environ.pop("EXPIRED_DAYTIME", None)
+    import logging
+
+    logging.basicConfig(level=logging.WARNING)
+
+    import infiv.build
+    import infiv.spiders.arxiv
+    from infiv.ratelimit import TokenBucket
+
+    ## the arxiv api asks for 3 seconds between requests, the replay server does not
+    infiv.spiders.arxiv._api_bucket = TokenBucket(rate_per_minute=60_000)
+
+    use_replay_server(args.base_url)
+
+    start = time.perf_counter()
+    infiv.build.main(argparse.Namespace(src_config=args.config, use_embed=True, threads=8))
+    total = time.perf_counter() - start
+
+    ## the stage timings and item counts from the metrics of the build
+    with open("metrics.json", "r") as f:
+        metrics = json.load(f)["metrics"]
+
+    def samples(name: str, label: str) -> Dict[str, float]:
+        return {sample["labels"][label]: sample["value"] for sample in metrics.get(name, {}).get("samples", [])}
+
+    stage_seconds = samples("infiv_stage_seconds", "stage")
+    stage_items = samples("infiv_stage_items", "stage")
+    stage_busy = samples("infiv_stage_busy_seconds", "stage")
+    stages = {stage: round(stage_seconds.get(stage, 0.0), 4) for stage in STAGES}
+    stages["other"] = round(total - sum(stage_seconds.values()), 4)
+    items_fetched = int(stage_items.get("fetch", 0))
+    print(json.dumps({
+        "total_s": round(total, 4),
+        "stages_s": stages,
+        "busy_s": {stage: round(stage_busy.get(stage, 0.0), 4) for stage in STREAMED_STAGES},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "items_fetched": items_fetched,
+        "items_rendered": int(stage_items.get("rank", 0)),
+        "items_per_s": round(items_fetched / total, 1) if total > 0 else None,
+        "output_bytes": os.path.getsize("output.md"),
+        "source_seconds": samples("infiv_source_seconds", "source"),
+    }))
+
+
+## driver: a replay server and the worker processes of each scale
+
+
+def server_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/__stats__") as resp:
+        return json.load(resp)
+
+
+def run_scale(scale: int, args: argparse.Namespace) -> List[dict]:
+    counts = source_counts(scale)
+    server = subprocess.Popen(
+        [
+            sys.executable, os.path.join(BENCHMARK_DIR, "replay_server.py"),
+            "--counts", json.dumps(counts), "--latency", str(args.latency),
+            "--jitter", str(args.jitter), "--seed", str(args.seed),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    base_url = f"http://127.0.0.1:{int(server.stdout.readline())}"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, BENCHMARK_DIR, os.environ.get("PYTHONPATH")]))}
+
+    results = []
+    try:
+        for repeat in range(args.repeat):
+            with tempfile.TemporaryDirectory(prefix="infiv-bench-") as workdir:
+                config_path = os.path.join(workdir, "source.json")  # json is also yaml
+                with open(config_path, "w") as f:
+                    json.dump(source_config(counts, args.parse_processes), f)
+                for run in ("cold", "warm"):
+                    before = server_stats(base_url)
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--worker", "--config", config_path, "--base_url", base_url],
+                        cwd=workdir, env=env, stdout=subprocess.PIPE, text=True,
+                    )
+                    if proc.returncode != 0:
+                        raise RuntimeError(f"the build of scale {scale} ({run}) failed")
+                    after = server_stats(base_url)
+                    result = json.loads(proc.stdout.strip().splitlines()[-1])
+                    result.update(
+                        scale=scale,
+                        run=run,
+                        repeat=repeat,
+                        requests=after["requests"] - before["requests"],
+                        not_modified=after["not_modified"] - before["not_modified"],
+                        bytes_served=after["bytes"] - before["bytes"],
+                    )
+                    print(
+                        f"scale {scale:>6} {run:<4} #{repeat}: {result['total_s']:8.2f} s, "
+                        f"{result['items_per_s']} items/s, {result['peak_rss_mb']} MB, "
+                        + ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in result["stages_s"].items())
+                        + "".join(f", {stage} busy {seconds:.2f}" for stage, seconds in result["busy_s"].items()),
+                        file=sys.stderr,
+                    )
+                    results.append(result)
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def summarize(results: List[dict]) -> List[dict]:
+    """
+    the median of the repeats of each (scale, run)
+    """
+    groups = defaultdict(list)
+    for result in results:
+        groups[(result["scale"], result["run"])].append(result)
+    summary = []
+    for (scale, run), group in groups.items():
+        summary.append({
+            "scale": scale,
+            "run": run,
+            "total_s": statistics.median(result["total_s"] for result in group),
+            "stages_s": {
+                stage: statistics.median(result["stages_s"][stage] for result in group)
+                for stage in group[0]["stages_s"]
+            },
+            "peak_rss_mb": max(result["peak_rss_mb"] for result in group),
+            "items_per_s": statistics.median(result["items_per_s"] for result in group),
+        })
+    return summary
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=REPO_DIR, stdout=subprocess.PIPE, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def compare(summary: List[dict], baseline_path: str):
+    with open(baseline_path, "r") as f:
+        baseline = {(result["scale"], result["run"]): result for result in json.load(f)["summary"]}
+    print(f"{'scale':>6} {'run':<4} {'stage':<8} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for result in summary:
+        old = baseline.get((result["scale"], result["run"]))
+        if old is None:
+            continue
+        rows = [("total", old["total_s"], result["total_s"])]
+        rows += [(stage, old["stages_s"].get(stage, 0.0), seconds) for stage, seconds in result["stages_s"].items()]
+        rows += [("rss_mb", old["peak_rss_mb"], result["peak_rss_mb"])]
+        for name, old_value, value in rows:
+            ratio = f"{value / old_value:7.2f}" if old_value else f"{'-':>7}"
+            print(f"{result['scale']:>6} {result['run']:<4} {name:<8} {old_value:>10.3f} {value:>10.3f} {ratio}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="end-to-end offline benchmark of infiv build")
+    parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000], help="total fetched items of each run")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each scale, the median is reported")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds of the replayed responses")
+    parser.add_argument("--jitter", type=float, default=0.01, help="uniform +- seconds around the latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parse_processes", type=int, default=None, help="processes of the parse pool, default to the number of cpus")
+    parser.add_argument("--output", type=str, default="bench_build.json", help="the JSON artifact")
+    parser.add_argument("--compare", type=str, default=None, help="a previous JSON artifact to compare with")
+    ## internal, a single build run by the driver
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--config", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--base_url", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = []
+    for scale in args.scales:
+        results += run_scale(scale, args)
+    summary = summarize(results)
+
+    artifact = {
+        "benchmark": "bench_build",
+        **git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {
+            "latency": args.latency, "jitter": args.jitter, "seed": args.seed,
+            "parse_processes": args.parse_processes,
+            "repeat": args.repeat, "source_shares": SOURCE_SHARES,
+        },
+        "summary": summary,
+        "runs": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(artifact, f, indent=2)
+    print(f"write {args.output}", file=sys.stderr)
+
+    if args.compare:
+        compare(summary, args.compare)
+
+
+if __name__ == "__main__":
+    main()
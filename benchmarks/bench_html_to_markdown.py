@@ -0,0 +1,43 @@
+"""
+Micro-benchmark of `infiv.utils.html_to_info_item_markdown` over the recorded
+html fixtures in `benchmarks/fixtures/html`.
+
+usage: python benchmarks/bench_html_to_markdown.py [--repeat 200]
+"""
+import argparse
+import glob
+import os
+import timeit
+
+from infiv.utils import HtmlToMarkdownConverter
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="html to markdown micro-benchmark")
+    parser.add_argument("--repeat", type=int, default=200, help="conversions per fixture")
+    args = parser.parse_args()
+
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))):
+        with open(path, "r") as f:
+            fixtures[os.path.basename(path)] = f.read()
+
+    converters = {
+        "html.parser, no cache": HtmlToMarkdownConverter(backend="html.parser", cache_size=0),
+        "lxml, no cache": HtmlToMarkdownConverter(backend="lxml", cache_size=0),
+        "html.parser, cached": HtmlToMarkdownConverter(backend="html.parser"),
+    }
+
+    print(f"{'fixture':<28}" + "".join(f"{name:>24}" for name in converters))
+    for fixture_name, html in fixtures.items():
+        row = f"{fixture_name:<28}"
+        for converter in converters.values():
+            seconds = timeit.timeit(lambda: converter.convert(html), number=args.repeat)
+            row += f"{seconds / args.repeat * 1e6:>21.1f} us"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
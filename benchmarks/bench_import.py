@@ -0,0 +1,141 @@
+"""
+Startup benchmark of the `python -m infiv` commands.
+
+Each case runs in a fresh interpreter `--repeat` times and its median wall time
+is reported next to the bare interpreter startup. A last run with
+`-X importtime` tells which heavy dependencies each case imports and the
+slowest imports, so an eager import slipping back in shows up by name.
+
+The results are written as a JSON artifact tagged with the commit, like
+`bench_build.py`, and two artifacts can be compared with `--compare`.
+
+usage: python benchmarks/bench_import.py [--repeat 10] [--output bench_import.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from bench_build import REPO_DIR, git_revision
+
+## the dependencies a light command should not import
+HEAVY_MODULES = ("numpy", "yaml", "requests", "bs4", "markdownify", "feedparser", "jinja2", "google.generativeai", "lxml")
+
+SAMPLE_MARKDOWN = "# Daily News\n\n## paper\n\n### a title\n[src](http://example.org)\n\nsome content\n"
+
+
+def cases(workdir: str) -> Dict[str, List[str]]:
+    config_path = os.path.join(REPO_DIR, "configs", "source.yaml")
+    markdown_path = os.path.join(workdir, "output.md")
+    with open(markdown_path, "w") as f:
+        f.write(SAMPLE_MARKDOWN)
+    return {
+        "python": ["-c", "pass"],
+        "help": ["-m", "infiv", "--help"],
+        "md2json": ["-m", "infiv", "md2json", "--input", markdown_path],
+        "check": ["-m", "infiv", "check", "--src_config", config_path],
+        "import spiders": ["-c", "import infiv.spiders"],
+        "import build": ["-c", "import infiv.build"],
+        ## what `unitrun` loads before it fetches
+        "import rsshub": ["-c", "import infiv.spiders.rsshub.cool_paper_arxiv"],
+    }
+
+
+def run_case(argv: List[str], workdir: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")]))}
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + argv
+    return subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """
+    the cumulative microseconds of each imported module from `-X importtime`
+    """
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            result[module.strip()] = int(cumulative)
+    return result
+
+
+def measure(name: str, argv: List[str], workdir: str, repeat: int) -> Optional[dict]:
+    """
+    :return: None if the case fails, e.g. a command missing in an older commit
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = run_case(argv, workdir)
+        seconds.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            print(f"{name} fails, skip it:\n{process.stderr}", file=sys.stderr)
+            return None
+    imports = parse_importtime(run_case(argv, workdir, importtime=True).stderr)
+    slowest = sorted((module for module in imports if "." not in module), key=imports.get, reverse=True)[:5]
+    result = {
+        "case": name,
+        "median_ms": statistics.median(seconds) * 1000,
+        "min_ms": min(seconds) * 1000,
+        "heavy_modules": [module for module in HEAVY_MODULES if module in imports],
+        "slowest_imports_ms": {module: imports[module] / 1000 for module in slowest},
+    }
+    print(
+        f"{name:<16} {result['median_ms']:8.1f} ms  heavy: {', '.join(result['heavy_modules']) or '-'}",
+        file=sys.stderr,
+    )
+    return result
+
+
+def compare(results: List[dict], baseline_path: str):
+    with open(baseline_path, "r") as f:
+        baseline = {result["case"]: result for result in json.load(f)["results"]}
+    print(f"{'case':<16} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for result in results:
+        old = baseline.get(result["case"])
+        if old is None:
+            continue
+        print(
+            f"{result['case']:<16} {old['median_ms']:>10.1f} {result['median_ms']:>10.1f}"
+            f" {result['median_ms'] / old['median_ms']:7.2f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="startup benchmark of the infiv commands")
+    parser.add_argument("--repeat", type=int, default=10, help="runs of each case, the median is reported")
+    parser.add_argument("--output", type=str, default="bench_import.json", help="the JSON artifact")
+    parser.add_argument("--compare", type=str, default=None, help="a previous JSON artifact to compare with")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="infiv-bench-import-") as workdir:
+        results = [measure(name, case_argv, workdir, args.repeat) for name, case_argv in cases(workdir).items()]
+    results = [result for result in results if result is not None]
+
+    artifact = {
+        "benchmark": "bench_import",
+        **git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {"repeat": args.repeat},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(artifact, f, indent=2)
+    print(f"write {args.output}", file=sys.stderr)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark of the item archive and of `python -m infiv rerender`.
+
+A month of synthetic builds (titles, markdown contents and embeddings) is
+written to a fresh item archive, then the time of reading a column projection
+of the month (titles and scores), of loading all its tables and of
+re-rendering all its digests with `infiv.rerender.main` is measured. The
+results are written as a JSON artifact tagged with the commit, like
+`bench_build.py`, and two artifacts can be compared with `--compare`.
+
+usage: python benchmarks/bench_rerender.py [--days 30] [--daily 2000] [--dim 768] [--output bench_rerender.json] [--compare old.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+
+from bench_build import REPO_DIR, git_revision
+
+sys.path.insert(0, REPO_DIR)
+
+from infiv.archive.items import ItemArchive  # noqa: E402
+from infiv.table import ItemTable  # noqa: E402
+
+## ~1.5 KB of markdown per item, like an arxiv abstract
+CONTENT = "We study the scaling of **vision transformers** trained with [masked modeling](http://example.org). " * 15
+
+
+def make_build(rng: np.random.Generator, built_at: datetime, n_items: int, dim: int) -> ItemTable:
+    items = [
+        {
+            "title": f"A title of the item {i} of {built_at:%Y-%m-%d}",
+            "content": CONTENT,
+            "links": [{"src": f"http://example.org/{built_at:%Y%m%d}/{i}"}, "http://example.org/"],
+            "pub_datetime": built_at - timedelta(minutes=i),
+            "tags": ["paper"],
+            "subject": ["paper", "feed", "coding"][i % 3],
+        }
+        for i in range(n_items)
+    ]
+    table = ItemTable.from_items(items, source="bench")
+    table.embeddings = rng.standard_normal((n_items, dim)).astype(np.float32)
+    table.score = table.embeddings[:, 0].copy()
+    return table
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="benchmark of the item archive and the re-rendering")
+    parser.add_argument("--days", type=int, default=30, help="daily builds in the archive")
+    parser.add_argument("--daily", type=int, default=2000, help="items of each build")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the embeddings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="bench_rerender.json", help="the JSON artifact")
+    parser.add_argument("--compare", type=str, default=None, help="a previous JSON artifact to compare with")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    from infiv import rerender
+
+    rng = np.random.default_rng(args.seed)
+    first_day = datetime(2026, 1, 1, 5)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="infiv-bench-rerender-") as workdir:
+        archive_path = os.path.join(workdir, "archive")
+        archive = ItemArchive(os.path.join(archive_path, "items"))
+        write_seconds = 0.0
+        for day in range(args.days):
+            table = make_build(rng, first_day + timedelta(days=day), args.daily, args.dim)
+            start = time.perf_counter()
+            archive.write(table, first_day + timedelta(days=day), model="bench")
+            write_seconds += time.perf_counter() - start
+        results["write_s"] = write_seconds
+        results["archive_mb"] = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(archive_path) for name in names
+        ) / 2 ** 20
+
+        start = time.perf_counter()
+        n_titles = sum(len(part.columns(["title", "score"])["title"]) for part in archive.parts())
+        results["projection_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        n_items = sum(len(part.table()) for part in archive.parts())
+        results["tables_s"] = time.perf_counter() - start
+        assert n_titles == n_items == args.days * args.daily
+
+        config_path = os.path.join(workdir, "source.json")  # json is also yaml
+        with open(config_path, "w") as f:
+            json.dump({"archive": {"path": archive_path}, "rerank": {"top_k": 100}, "render": {"bytecode_cache_dir": None}}, f)
+        start = time.perf_counter()
+        rerender.main(argparse.Namespace(
+            src_config=config_path, since=None, until=None, output_dir=os.path.join(workdir, "digests"), rerank=False,
+        ))
+        results["rerender_s"] = time.perf_counter() - start
+    print(
+        f"{args.days} builds of {args.daily} items, {results['archive_mb']:.0f} MB: write {results['write_s']:.2f} s, "
+        f"titles and scores {results['projection_s']:.2f} s, tables {results['tables_s']:.2f} s, "
+        f"rerender {results['rerender_s']:.2f} s",
+        file=sys.stderr,
+    )
+
+    artifact = {
+        "benchmark": "bench_rerender",
+        **git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(artifact, f, indent=2)
+    print(f"write {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        print(f"{'case':<14} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for name, value in results.items():
+            if name in baseline and baseline[name]:
+                print(f"{name:<14} {baseline[name]:>10.3f} {value:>10.3f} {value / baseline[name]:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark of the search index of the archive.
+
+Synthetic items (titles and contents drawn from a Zipf vocabulary, random unit
+embeddings) are appended day by day to a fresh `SearchIndex`, as the daily
+builds do, then random keyword and semantic queries are timed, without and with
+a date filter. The time of the daily appends, the size of the index and the
+latency percentiles of the queries are written as a JSON artifact tagged with
+the commit, like `bench_build.py`, and two artifacts can be compared with `--compare`.
+
+usage: python benchmarks/bench_search.py [--days 365] [--daily 1000] [--dim 768] [--output bench_search.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+
+from bench_build import REPO_DIR, git_revision
+
+sys.path.insert(0, REPO_DIR)
+
+from infiv.archive.index import SearchIndex  # noqa: E402
+from infiv.table import ItemTable  # noqa: E402
+
+VOCABULARY_SIZE = 50000
+
+
+def make_words(rng: np.random.Generator, n: int) -> np.ndarray:
+    ## the index of a word follows a Zipf law, like the words of real titles
+    return np.minimum(rng.zipf(1.2, size=n), VOCABULARY_SIZE)
+
+
+def word(index: int) -> str:
+    return f"w{index}"
+
+
+def make_day(rng: np.random.Generator, day: datetime, n_items: int, dim: int, offset: int) -> ItemTable:
+    items = []
+    title_words = make_words(rng, n_items * 10).reshape(n_items, 10)
+    content_words = make_words(rng, n_items * 60).reshape(n_items, 60)
+    for i in range(n_items):
+        items.append({
+            "title": " ".join(word(index) for index in title_words[i]),
+            "content": " ".join(word(index) for index in content_words[i]),
+            "links": [f"http://example.org/{offset + i}"],
+            "pub_datetime": day + timedelta(seconds=i),
+            "tags": [],
+        })
+    table = ItemTable.from_items(items, subject="paper", source="bench")
+    embeddings = rng.standard_normal((n_items, dim)).astype(np.float32)
+    table.embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return table
+
+
+def percentiles(seconds: List[float]) -> dict:
+    return {
+        "p50_ms": statistics.median(seconds) * 1000,
+        "p95_ms": float(np.percentile(seconds, 95)) * 1000,
+        "max_ms": max(seconds) * 1000,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="benchmark of the search index of the archive")
+    parser.add_argument("--days", type=int, default=365, help="daily builds appended to the index")
+    parser.add_argument("--daily", type=int, default=1000, help="new items of each build")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the embeddings")
+    parser.add_argument("--queries", type=int, default=50, help="queries of each kind")
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="bench_search.json", help="the JSON artifact")
+    parser.add_argument("--compare", type=str, default=None, help="a previous JSON artifact to compare with")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    first_day = datetime(2020, 1, 1)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="infiv-bench-search-") as workdir:
+        path = os.path.join(workdir, "archive")
+        add_seconds = []
+        for day in range(args.days):
+            table = make_day(rng, first_day + timedelta(days=day), args.daily, args.dim, day * args.daily)
+            start = time.perf_counter()
+            ## a build opens the index, appends its items and closes it
+            index = SearchIndex(path)
+            index.add(table, model="bench")
+            index.close()
+            add_seconds.append(time.perf_counter() - start)
+        results["add"] = {"items": args.days * args.daily, **percentiles(add_seconds)}
+        results["index_mb"] = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2 ** 20
+        print(
+            f"add {args.days} days of {args.daily} items: p50 {results['add']['p50_ms']:.1f} ms, "
+            f"index {results['index_mb']:.0f} MB",
+            file=sys.stderr,
+        )
+
+        index = SearchIndex(path)
+        since = (first_day + timedelta(days=args.days * 3 // 4)).date().isoformat()
+        queries = {
+            "keyword": lambda: index.search_keywords(
+                " ".join(word(index) for index in make_words(rng, 2) + 10), args.top_k
+            ),
+            "keyword since": lambda: index.search_keywords(
+                " ".join(word(index) for index in make_words(rng, 2) + 10), args.top_k, since=since
+            ),
+            "semantic": lambda: index.search_vectors(rng.standard_normal(args.dim), args.top_k),
+            "semantic since": lambda: index.search_vectors(rng.standard_normal(args.dim), args.top_k, since=since),
+        }
+        for name, query in queries.items():
+            query()  # warm the page cache
+            seconds = []
+            for _ in range(args.queries):
+                start = time.perf_counter()
+                query()
+                seconds.append(time.perf_counter() - start)
+            results[name] = percentiles(seconds)
+            print(f"{name:<16} p50 {results[name]['p50_ms']:8.1f} ms  p95 {results[name]['p95_ms']:8.1f} ms", file=sys.stderr)
+        index.close()
+
+    artifact = {
+        "benchmark": "bench_search",
+        **git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(artifact, f, indent=2)
+    print(f"write {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        print(f"{'case':<16} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for name, result in results.items():
+            if not isinstance(result, dict) or name not in baseline:
+                continue
+            old, new = baseline[name]["p50_ms"], result["p50_ms"]
+            print(f"{name:<16} {old:>10.1f} {new:>10.1f} {new / old:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
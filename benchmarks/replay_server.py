@@ -0,0 +1,346 @@
+"""
+A local stand-in of the sites crawled by the spiders, replaying the recorded
+pages in `benchmarks/fixtures/build` with a configurable latency and jitter.
+
+The recorded pages are templates: the listing pages and feeds are expanded to
+the requested number of items, each with a distinct id and title, so a same
+fixture set serves any scale. Every request is answered after
+`latency +- jitter` seconds, and the responses carry an ETag so the
+conditional requests of a warm run get 304.
+
+The spiders keep their real urls. `ReplayAdapter` is mounted on the http
+client and rewrites `https://host/path?query` into
+`http://127.0.0.1:port/host/path?query` before sending.
+
+usage: python benchmarks/replay_server.py --counts '{"arxiv": 100, "rss": 50}' [--port 0] [--latency 0.02] [--jitter 0.01]
+the bound port is printed on the first line of stdout.
+"""
+import argparse
+import email.utils
+import hashlib
+import html
+import json
+import os
+import random
+import string
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures", "build")
+HTML_FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures", "html")
+
+## the source urls of the spiders, as written in the source config
+SOURCE_URLS = {
+    "arxiv": "cs.CV",
+    "cool_paper": "http://localhost:1200/papers/arxiv/cs.CV",
+    "rss": "https://wechat2rss.xlab.app/feed/recorded.xml",
+    "biorxiv": "https://www.biorxiv.org/collection/bioinformatics",
+    "zhihu": "https://www.zhihu.com/",
+    "bilibili": "https://www.bilibili.com/",
+}
+
+BIORXIV_PAGE_SIZE = 10
+ZHIHU_PAGE_SIZE = 10
+
+_WORDS = (
+    "learning vision language model diffusion transformer efficient scalable robust sparse "
+    "attention graph neural protein cell single sequencing generative contrastive retrieval "
+    "benchmark dataset agent reasoning multimodal video segmentation detection tracking "
+    "depth pose reconstruction radiance field policy robot control latent alignment "
+    "calibration uncertainty federated privacy compression quantization distillation"
+).split()
+
+Route = Callable[[str, Dict[str, str], int], Optional[Tuple[bytes, str]]]
+
+
+def _load(name: str, directory: str = FIXTURE_DIR) -> string.Template:
+    with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+        return string.Template(f.read())
+
+
+def _load_text(name: str) -> str:
+    with open(os.path.join(HTML_FIXTURE_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def make_title(kind: str, index: int) -> str:
+    rng = random.Random(f"{kind}:{index}")
+    words = rng.sample(_WORDS, rng.randint(6, 12))
+    return " ".join(words).capitalize() + f" ({kind} {index})"
+
+
+def arxiv_id(index: int) -> str:
+    return f"2405.{index:05d}"
+
+
+def bilibili_id(index: int) -> str:
+    alphabet = string.digits + string.ascii_letters
+    digits = ""
+    for _ in range(9):
+        index, rest = divmod(index, len(alphabet))
+        digits = alphabet[rest] + digits
+    return "BV1" + digits
+
+
+class FixtureSite:
+    """
+    the pages of all the replayed sites for the given numbers of items per spider.
+
+    :param counts: number of items of each spider in `SOURCE_URLS`
+    :param overlap: fraction of the cool paper items that are also in the arxiv api, to exercise the merging
+    """
+
+    def __init__(self, counts: Dict[str, int], overlap: float = 0.5):
+        self.counts = counts
+        self.overlap = overlap
+        self.now = datetime.now().replace(microsecond=0)
+        self.templates = {
+            name[:-len(ext)]: _load(name)
+            for name in os.listdir(FIXTURE_DIR)
+            for ext in (".xml", ".html")
+            if name.endswith(ext)
+        }
+        self.rss_summary = _load_text("wechat_rss_summary.html")
+        self.biorxiv_abstract = _load_text("biorxiv_abstract.html")
+        self.bilibili_desc = _load_text("bilibili_desc.html")
+        self._listing_counts = {}  # type: Dict[str, int]
+        self._lock = threading.Lock()
+        self.routes = {
+            ("export.arxiv.org", "/api/query"): self.arxiv_page,
+            ("localhost:1200", "/papers/arxiv/cs.CV"): self.cool_paper_feed,
+            ("wechat2rss.xlab.app", "/feed/recorded.xml"): self.rss_feed,
+            ("www.biorxiv.org", "/collection/bioinformatics"): self.biorxiv_listing,
+            ("www.zhihu.com", "/"): self.zhihu_feed,
+            ("www.bilibili.com", "/"): self.bilibili_home,
+        }  # type: Dict[Tuple[str, str], Route]
+        self.prefix_routes = {
+            ("www.biorxiv.org", "/content/10.1101/"): self.biorxiv_article,
+            ("www.bilibili.com", "/video/"): self.bilibili_video,
+        }  # type: Dict[Tuple[str, str], Route]
+
+    def route(self, host: str, path: str, query: Dict[str, str]) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            n_requests = self._listing_counts.get(host + path, 0)
+            self._listing_counts[host + path] = n_requests + 1
+        handler = self.routes.get((host, path))
+        if handler is not None:
+            return handler(path, query, n_requests)
+        for (prefix_host, prefix), handler in self.prefix_routes.items():
+            if host == prefix_host and path.startswith(prefix):
+                return handler(path[len(prefix):].strip("/"), query, n_requests)
+        return None
+
+    ## arxiv api and cool paper
+
+    def arxiv_page(self, path: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        total = self.counts.get("arxiv", 0)
+        start = int(query.get("start", 0))
+        per_page = int(query.get("max_results", 1000))
+        published = (self.now - timedelta(hours=1)).strftime(r"%Y-%m-%dT%H:%M:%SZ")
+        entries = "".join(
+            self.templates["arxiv_api_entry"].substitute(
+                arxiv_id=arxiv_id(i), published=published, title=make_title("paper", i)
+            )
+            for i in range(start, min(start + per_page, total))
+        )
+        body = self.templates["arxiv_api_feed"].substitute(
+            updated=published, total=total, start=start, per_page=per_page, entries=entries
+        )
+        return body.encode("utf-8"), "application/atom+xml; charset=utf-8"
+
+    def cool_paper_feed(self, path: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        total = self.counts.get("cool_paper", 0)
+        ## the first items are the same papers as the arxiv api ones
+        n_shared = min(int(total * self.overlap), self.counts.get("arxiv", 0))
+        indices = list(range(n_shared)) + list(range(10 ** 5 - (total - n_shared), 10 ** 5))
+        items = "".join(
+            self.templates["cool_paper_item"].substitute(arxiv_id=arxiv_id(i), title=make_title("paper", i))
+            for i in indices
+        )
+        body = self.templates["cool_paper_feed"].substitute(updated=email.utils.format_datetime(self.now), items=items)
+        return body.encode("utf-8"), "application/rss+xml; charset=utf-8"
+
+    ## rss
+
+    def rss_feed(self, path: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        items = "".join(
+            self.templates["rss_item"].substitute(
+                title=make_title("post", i),
+                post_id=f"post{i:06d}",
+                summary=self.rss_summary,
+                pub_date=email.utils.format_datetime(self.now - timedelta(minutes=i)),
+            )
+            for i in range(self.counts.get("rss", 0))
+        )
+        body = self.templates["rss_feed"].substitute(updated=email.utils.format_datetime(self.now), items=items)
+        return body.encode("utf-8"), "application/rss+xml; charset=utf-8"
+
+    ## biorxiv
+
+    def biorxiv_listing(self, path: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        page = int(query.get("page", 0))
+        start = page * BIORXIV_PAGE_SIZE
+        end = min(start + BIORXIV_PAGE_SIZE, self.counts.get("biorxiv", 0))
+        citations = "".join(
+            self.templates["biorxiv_citation"].substitute(
+                doi=f"2024.05.01.{i:06d}v1", title=html.escape(make_title("preprint", i))
+            )
+            for i in range(start, end)
+        )
+        body = self.templates["biorxiv_listing"].substitute(citations=citations, next_page=page + 1)
+        return body.encode("utf-8"), "text/html; charset=utf-8"
+
+    def biorxiv_article(self, doi: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        index = int(doi.split(".")[-1].split("v")[0])
+        body = self.templates["biorxiv_article"].substitute(
+            title=html.escape(make_title("preprint", index)),
+            abstract=self.biorxiv_abstract,
+            posted=self.now.strftime("%B %d, %Y").replace(" 0", " "),
+        )
+        return body.encode("utf-8"), "text/html; charset=utf-8"
+
+    ## zhihu, a new batch of recommendations on each refresh
+
+    def zhihu_feed(self, path: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        start = n_requests * ZHIHU_PAGE_SIZE
+        cards = "".join(
+            self.templates["zhihu_card"].substitute(
+                question_id=600000000 + i, answer_id=3000000000 + i, title=html.escape(make_title("question", i))
+            )
+            for i in range(start, start + ZHIHU_PAGE_SIZE)
+        )
+        body = self.templates["zhihu_feed"].substitute(cards=cards)
+        return body.encode("utf-8"), "text/html; charset=utf-8"
+
+    ## bilibili
+
+    def bilibili_home(self, path: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        cards = "".join(
+            self.templates["bilibili_card"].substitute(bvid=bilibili_id(i), title=html.escape(make_title("video", i)))
+            for i in range(self.counts.get("bilibili", 0))
+        )
+        body = self.templates["bilibili_home"].substitute(cards=cards)
+        return body.encode("utf-8"), "text/html; charset=utf-8"
+
+    def bilibili_video(self, bvid: str, query: Dict[str, str], n_requests: int) -> Tuple[bytes, str]:
+        body = self.templates["bilibili_video"].substitute(
+            title=html.escape(make_title("video", self._bilibili_index(bvid))), desc=self.bilibili_desc
+        )
+        return body.encode("utf-8"), "text/html; charset=utf-8"
+
+    @staticmethod
+    def _bilibili_index(bvid: str) -> int:
+        alphabet = string.digits + string.ascii_letters
+        index = 0
+        for char in bvid[3:]:
+            index = index * len(alphabet) + alphabet.index(char)
+        return index
+
+
+def make_handler(site: FixtureSite, latency: float, jitter: float, seed: int = 0):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"requests": 0, "bytes": 0, "not_modified": 0, "not_found": 0}
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real sites
+
+        def do_GET(self):
+            split = urlsplit(self.path)
+            if split.path == "/__stats__":
+                self._send(200, json.dumps(stats).encode("utf-8"), "application/json")
+                return
+
+            with rng_lock:
+                delay = max(0.0, rng.uniform(latency - jitter, latency + jitter))
+                stats["requests"] += 1
+            time.sleep(delay)
+
+            host, _, path = split.path.lstrip("/").partition("/")
+            query = {key: values[-1] for key, values in parse_qs(split.query).items()}
+            result = site.route(host, "/" + path, query)
+            if result is None:
+                with rng_lock:
+                    stats["not_found"] += 1
+                self._send(404, b"not found", "text/plain")
+                return
+
+            body, content_type = result
+            etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                with rng_lock:
+                    stats["not_modified"] += 1
+                self._send(304, b"", content_type, etag)
+                return
+            with rng_lock:
+                stats["bytes"] += len(body)
+            self._send(200, body, content_type, etag)
+
+        def _send(self, status: int, body: bytes, content_type: str, etag: Optional[str] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if etag is not None:
+                self.send_header("ETag", etag)
+            if status != 304:
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if status != 304:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    send every request to the replay server at `base_url`, with the original host as the first path segment
+    """
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        split = urlsplit(request.url)
+        request.url = f"{self.base_url}/{split.netloc}{split.path or '/'}" + (f"?{split.query}" if split.query else "")
+        return super().send(request, **kwargs)
+
+
+def serve(counts: Dict[str, int], port: int = 0, latency: float = 0.02, jitter: float = 0.01, seed: int = 0) -> ThreadingHTTPServer:
+    """
+    :return: the started server, serving in a daemon thread
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(FixtureSite(counts), latency, jitter, seed))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay the recorded spider fixtures")
+    parser.add_argument("--counts", type=str, required=True, help="json of the number of items per spider")
+    parser.add_argument("--port", type=int, default=0, help="0 for a free port")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.01, help="uniform +- seconds around the latency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(json.loads(args.counts), args.port, args.latency, args.jitter, args.seed)
+    print(server.server_address[1], flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
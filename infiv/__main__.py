@@ -21,13 +21,68 @@ def parse_args():
         default=False
     )
 
+    # subcommand - check - used to validate the source config without fetching
+    sub_parser = sub_parsers.add_parser(
+        "check", help="validate the source config without importing the spiders"
+    )
+    sub_parser.add_argument(
+        "--src_config", type=str, help="the path of the source config file",
+        default="./configs/source.yaml"
+    )
+
+    # subcommand - search - used to query the items of the past builds
+    sub_parser = sub_parsers.add_parser(
+        "search", help="search the items of the past builds in the archive"
+    )
+    sub_parser.add_argument("query", type=str, help="the words to look for, or a text to compare with --semantic")
+    sub_parser.add_argument(
+        "--src_config", type=str, help="the path of the source config file, for the archive path and the embedder",
+        default="./configs/source.yaml"
+    )
+    sub_parser.add_argument("--top_k", type=int, help="number of results", default=10)
+    sub_parser.add_argument(
+        "--semantic", action="store_true", help="rank by embedding similarity instead of keywords",
+        default=False
+    )
+    sub_parser.add_argument("--since", type=str, help="published at or after this iso date", default=None)
+    sub_parser.add_argument("--until", type=str, help="published before this iso date", default=None)
+    sub_parser.add_argument("--subject", type=str, help="only the items of this subject", default=None)
+    sub_parser.add_argument("--json", action="store_true", help="print the results as json", default=False)
+
+    # subcommand - rerender - used to render the digests of the past builds again
+    sub_parser = sub_parsers.add_parser(
+        "rerender", help="render the digests of the past builds again from the item archive, without network"
+    )
+    sub_parser.add_argument(
+        "--src_config", type=str, help="the path of the source config file, for the archive, rerank and render configs",
+        default="./configs/source.yaml"
+    )
+    sub_parser.add_argument("--since", type=str, help="the first date of the builds, YYYY-MM-DD", default=None)
+    sub_parser.add_argument("--until", type=str, help="the date after the last build, YYYY-MM-DD", default=None)
+    sub_parser.add_argument(
+        "--output_dir", type=str, help="where to write the digests, one per build",
+        default="./digests"
+    )
+    sub_parser.add_argument(
+        "--rerank", action="store_true", help="score the archived embeddings again with the rerank config",
+        default=False
+    )
+
     # subcommand - unitrun - used to check the single processing function
     sub_parser = sub_parsers.add_parser(
         "unitrun", help="run the unit test for a single spider"
     )
     # subcommand - md2json - used to convert the markdown file to json file
     sub_parser = sub_parsers.add_parser(
-        "md2json", help="convert the markdown file to json file"
+        "md2json", help="convert the markdown file to json files output-1.json ... output-N.json"
+    )
+    sub_parser.add_argument(
+        "--input", type=str, help="the path of the markdown file",
+        default="output.md"
+    )
+    sub_parser.add_argument(
+        "--max_chars", type=int, help="max characters of the body of each json file",
+        default=65000
     )
     return parser.parse_args()
 
@@ -41,6 +96,18 @@ def main(args: argparse.Namespace):
     elif args.command == "build":
         from infiv.build import main
 
+        main(args)
+    elif args.command == "check":
+        from infiv.check import main
+
+        main(args)
+    elif args.command == "search":
+        from infiv.search import main
+
+        main(args)
+    elif args.command == "rerender":
+        from infiv.rerender import main
+
         main(args)
     elif args.command == "md2json":
         from infiv.md_to_json import main
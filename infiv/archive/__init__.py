@@ -0,0 +1,9 @@
+"""
+The archive of the past builds.
+
+The digest of a build only lives in `output.md`, so every build also appends
+its items to the archive kept next to the other build caches:
+
+- `infiv.archive.index`, a search index of the items, queried by `python -m infiv search`
+- `infiv.archive.items`, the items of each build as rendered, re-rendered by `python -m infiv rerender`
+"""
@@ -0,0 +1,322 @@
+"""
+Search index of the archived items.
+
+The index is a directory holding
+
+- `index.sqlite`: one row per item (its id, title, link, subject, source and
+  dates) with the row of its vector, and an FTS5 inverted index of the words of
+  the titles and contents
+- `vectors.f32`: a memory-mapped float32 matrix of the unit item embeddings,
+  grown by doubling, see `infiv.vectors.VectorFile`
+
+A build only appends its new items, nothing is rebuilt. A keyword query is a
+lookup of the inverted index ranked by BM25, a semantic query is a scan of the
+memory-mapped vectors block by block keeping the top k, both well under a
+second for years of daily builds.
+"""
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from infiv.vectors import VectorFile
+
+if TYPE_CHECKING:
+    from infiv.table import ItemTable
+
+logger = logging.getLogger(__name__)
+
+## the scripts written without spaces between the words are indexed by overlapping character bigrams
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+")
+## the urls of the markdown links and images are not words of the content
+_URL = re.compile(r"\]\([^)]*\)|https?://\S+")
+
+
+def _bigrams(match: "re.Match") -> str:
+    run = match.group(0)
+    if len(run) == 1:
+        return f" {run} "
+    return " " + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + " "
+
+
+def keyword_text(text: str) -> str:
+    """
+    the text as given to the `unicode61` tokenizer of FTS5, with the CJK runs split into bigrams
+    """
+    return _CJK_RUN.sub(_bigrams, _URL.sub(" ", text))
+
+
+def keyword_query(query: str) -> str:
+    """
+    the FTS5 query of the items containing all the words of `query`,
+    each word is quoted so the FTS5 operators in a query are literal
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in keyword_text(query).split())
+
+
+class SearchIndex:
+    """
+    On-disk search index of the items of all the builds.
+
+    The vectors of an index come from a single embedding model, the first one
+    added; the items embedded by another model are only indexed by keywords.
+
+    :param path: directory to store `index.sqlite` and `vectors.f32`
+    :param block_size: vectors scored at once by a semantic query
+    """
+
+    def __init__(self, path: str, block_size: int = 65536):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.block_size = block_size
+
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"))
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                item_id TEXT UNIQUE NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT,
+                subject TEXT,
+                source TEXT,
+                pub_datetime TEXT,
+                archived TEXT NOT NULL,
+                rerank_score REAL,
+                vector_row INTEGER UNIQUE
+            );
+            CREATE INDEX IF NOT EXISTS items_pub_datetime ON items (pub_datetime);
+            CREATE VIRTUAL TABLE IF NOT EXISTS keywords USING fts5(
+                title, content, content='', tokenize='unicode61 remove_diacritics 2'
+            );
+            """
+        )
+        self.model = self._get_meta("model")
+        self.dim = int(self._get_meta("dim") or 0)
+        self.n_vectors = int(self._get_meta("n_vectors") or 0)
+
+        self._vector_file = VectorFile(
+            os.path.join(path, "vectors.f32"), self.dim, int(self._get_meta("capacity") or 0)
+        )
+
+    def _get_meta(self, name: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, name: str, value: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def _grow(self, min_capacity: int):
+        if self._vector_file.grow(min_capacity):
+            self._set_meta("capacity", str(self._vector_file.capacity))
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    ## update
+
+    def _known_ids(self, item_ids: Sequence[str]) -> set:
+        known = set()
+        for i in range(0, len(item_ids), 500):  # keep under the sqlite variable limit
+            chunk = item_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            known.update(
+                row[0] for row in self._conn.execute(
+                    f"SELECT item_id FROM items WHERE item_id IN ({placeholders})", chunk
+                )
+            )
+        return known
+
+    def add(self, table: "ItemTable", model: Optional[str] = None, archived: Optional[datetime] = None) -> int:
+        """
+        append the items not indexed yet, an item is known by its `infiv.state.item_id`
+
+        :param table: the items of a build, with their embeddings if any
+        :param model: the embedding model of `table.embeddings`
+        :param archived: the time of the build, default to now
+        :return: the number of new items
+        """
+        item_ids = table.item_ids().tolist()
+        known = self._known_ids(item_ids)
+        rows = []  # type: List[int]
+        for row, id_ in enumerate(item_ids):
+            if id_ not in known:
+                known.add(id_)
+                rows.append(row)
+        if not rows:
+            return 0
+        rows = np.array(rows, dtype=np.int64)
+
+        ## the unit vectors of the new items, the failed embeddings (zero vectors) are left out
+        vector_rows = np.full(len(rows), -1, dtype=np.int64)
+        if table.embeddings is not None and model is not None:
+            if self.model is None:
+                self.model, self.dim = model, table.embeddings.shape[1]
+                self._vector_file.dim = self.dim  # still empty
+                self._set_meta("model", model)
+                self._set_meta("dim", str(self.dim))
+            if model == self.model:
+                vectors = np.asarray(table.embeddings[rows], dtype=np.float32)
+                norms = np.linalg.norm(vectors, axis=1)
+                embedded = norms > 0
+                n_embedded = int(embedded.sum())
+                self._grow(self.n_vectors + n_embedded)
+                vector_rows[embedded] = np.arange(self.n_vectors, self.n_vectors + n_embedded)
+                if n_embedded:
+                    new_rows = slice(self.n_vectors, self.n_vectors + n_embedded)
+                    self._vector_file.array[new_rows] = vectors[embedded] / norms[embedded, None]
+                    self._vector_file.flush()
+                self.n_vectors += n_embedded
+                self._set_meta("n_vectors", str(self.n_vectors))
+            else:
+                logger.warning(
+                    f"Search index {self.path} holds the vectors of {self.model}, "
+                    f"the items embedded by {model} are only indexed by keywords"
+                )
+
+        archived = (archived or datetime.now()).isoformat(timespec="seconds")
+        pub_datetimes = np.datetime_as_string(table.pub_datetime[rows], unit="s")
+        first_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM items").fetchone()[0]
+        records, keywords = [], []
+        for offset, (row, vector_row, pub_datetime) in enumerate(zip(rows.tolist(), vector_rows.tolist(), pub_datetimes)):
+            id_ = item_ids[row]
+            score = float(table.score[row])
+            records.append((
+                first_id + offset,
+                id_,
+                table.title[row],
+                None if id_.startswith("title:") else id_,
+                table.subjects.names[table.subject_codes[row]],
+                table.sources.names[table.source_codes[row]],
+                str(pub_datetime),
+                archived,
+                None if np.isnan(score) else score,
+                None if vector_row < 0 else vector_row,
+            ))
+            keywords.append((first_id + offset, keyword_text(table.title[row]), keyword_text(table.content[row] or "")))
+        self._conn.executemany(
+            """
+            INSERT INTO items (id, item_id, title, url, subject, source, pub_datetime, archived, rerank_score, vector_row)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            records,
+        )
+        self._conn.executemany("INSERT INTO keywords (rowid, title, content) VALUES (?, ?, ?)", keywords)
+        self._conn.commit()
+        return len(records)
+
+    ## queries
+
+    @staticmethod
+    def _filters(
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> Tuple[str, list]:
+        """
+        :param since: the items published at or after it, an iso date or datetime
+        :param until: the items published before it, an iso date or datetime
+        :param subject: the items of this subject
+        :return: the sql conditions on the `items` table and their parameters
+        """
+        clauses, params = [], []
+        if since:
+            clauses.append("items.pub_datetime >= ?")
+            params.append(since)
+        if until:
+            clauses.append("items.pub_datetime < ?")
+            params.append(until)
+        if subject:
+            clauses.append("items.subject = ?")
+            params.append(subject)
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    def search_keywords(self, query: str, top_k: int = 10, **filters) -> List[dict]:
+        """
+        the items containing all the words of `query`, ranked by BM25 with the title weighted over the content
+
+        :param filters: `since`, `until` and `subject`, see `_filters`
+        :return: the items as dicts, with their `score` (higher is better)
+        """
+        match = keyword_query(query)
+        if not match:
+            return []
+        conditions, params = self._filters(**filters)
+        rows = self._conn.execute(
+            f"""
+            SELECT items.*, -bm25(keywords, 5.0, 1.0) AS score
+            FROM keywords JOIN items ON items.id = keywords.rowid
+            WHERE keywords MATCH ?{conditions}
+            ORDER BY bm25(keywords, 5.0, 1.0) LIMIT ?
+            """,
+            [match, *params, top_k],
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_vectors(self, vector: np.ndarray, top_k: int = 10, **filters) -> List[dict]:
+        """
+        the items the most similar to `vector`, by cosine similarity
+
+        :param vector: the query embedding, by the model of the index
+        :param filters: `since`, `until` and `subject`, see `_filters`
+        :return: the items as dicts, with their `score` (higher is better)
+        """
+        vectors = self._vector_file.array
+        if vectors is None or self.n_vectors == 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        conditions, params = self._filters(**filters)
+        candidates = None  # type: Optional[np.ndarray]
+        if conditions:
+            candidates = np.array(
+                [row[0] for row in self._conn.execute(
+                    f"SELECT vector_row FROM items WHERE vector_row IS NOT NULL{conditions} ORDER BY vector_row",
+                    params,
+                )],
+                dtype=np.int64,
+            )
+        n_candidates = len(candidates) if candidates is not None else self.n_vectors
+
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, n_candidates, self.block_size):
+            stop = min(start + self.block_size, n_candidates)
+            if candidates is not None:
+                block_rows = candidates[start:stop]
+                low, high = block_rows[0], block_rows[-1] + 1
+                if high - low <= 2 * len(block_rows):
+                    ## mostly contiguous, e.g. a date range of the items appended in time order
+                    scores = (vectors[low:high] @ query)[block_rows - low]
+                else:
+                    scores = vectors[block_rows] @ query
+            else:
+                block_rows = np.arange(start, stop)
+                scores = vectors[start:stop] @ query
+            best_rows = np.concatenate([best_rows, block_rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k)[:top_k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores, kind="stable")
+        scores = dict(zip(best_rows[order].tolist(), best_scores[order].tolist()))
+        placeholders = ",".join("?" * len(scores))
+        items = {
+            row["vector_row"]: dict(row)
+            for row in self._conn.execute(f"SELECT * FROM items WHERE vector_row IN ({placeholders})", list(scores))
+        }
+        return [{**items[row], "score": score} for row, score in scores.items() if row in items]
+
+    def close(self):
+        self._vector_file.close()
+        self._conn.close()
@@ -0,0 +1,189 @@
+"""
+Columnar archive of the items of every build.
+
+A build writes the columns of its `ItemTable` (the merged and scored items as
+rendered, with their subject, source, score and embeddings) to a part of a
+date-partitioned directory
+
+    {path}/2026-10-18/045012/ the build time, suffixed by -1, -2... for the other builds of that second
+        meta.json             schema version, build time, embedding model and the category names
+        title.json.gz         the text columns, gzip compressed json lists
+        content.json.gz
+        link_names.json.gz
+        link_urls.json.gz
+        pub_datetime.npy      the numeric columns, memory-mapped when read
+        score.npy
+        embeddings.npy
+        ...
+
+so an old digest can be re-ranked or re-rendered without crawling it again. A
+reader lists the parts of a date range without opening them and loads only the
+columns it asks for, the `.npy` columns without a copy.
+"""
+import gzip
+import itertools
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from infiv.table import Categories, ItemTable
+
+logger = logging.getLogger(__name__)
+
+## bumped on an incompatible change of the layout, a reader refuses the parts of a newer schema
+SCHEMA_VERSION = 1
+
+## the columns of `ItemTable`, the text ones are stored as compressed json
+TEXT_COLUMNS = ("title", "content", "link_names", "link_urls")
+ARRAY_COLUMNS = (
+    "pub_datetime", "subject_codes", "source_codes", "tag_offsets", "tag_codes", "link_offsets", "score", "embeddings",
+)
+
+
+class ArchivePart:
+    """
+    The items of one build, read lazily column by column.
+
+    :param path: directory of the part
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)  # type: dict
+        if self.meta["schema_version"] > SCHEMA_VERSION:
+            raise ValueError(
+                f"{path} has the schema version {self.meta['schema_version']}, "
+                f"this infiv reads up to {SCHEMA_VERSION}, please upgrade it"
+            )
+        self.built_at = datetime.fromisoformat(self.meta["built_at"])
+        self.model = self.meta.get("model")  # type: Optional[str]
+
+    def __repr__(self) -> str:
+        return f"ArchivePart({self.path!r})"
+
+    def __len__(self) -> int:
+        return self.meta["n_items"]
+
+    def column(self, name: str) -> Optional[np.ndarray]:
+        """
+        :return: a column of `ItemTable`, None for the embeddings of a build without them
+        """
+        if name in TEXT_COLUMNS:
+            with gzip.open(os.path.join(self.path, f"{name}.json.gz"), "rt", encoding="utf-8") as f:
+                values = json.load(f)
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            return column
+        if name not in ARRAY_COLUMNS:
+            raise KeyError(f"unknown column {name}")
+        path = os.path.join(self.path, f"{name}.npy")
+        if not os.path.exists(path):
+            return None
+        ## an empty array can't be memory-mapped
+        return np.load(path, mmap_mode="r" if len(self) else None)
+
+    def columns(self, names: Iterable[str]) -> Dict[str, Optional[np.ndarray]]:
+        """
+        the projection of the part on some columns, e.g. `["title", "score"]`
+        """
+        return {name: self.column(name) for name in names}
+
+    def table(self) -> ItemTable:
+        """
+        all the columns of the part as a table, with its own categories
+        """
+        return ItemTable(
+            **self.columns(TEXT_COLUMNS + ARRAY_COLUMNS),
+            subjects=Categories(self.meta["subjects"]),
+            sources=Categories(self.meta["sources"]),
+            tags=Categories(self.meta["tags"]),
+        )
+
+
+class ItemArchive:
+    """
+    The date-partitioned archive of the builds.
+
+    :param path: root directory of the parts
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, table: ItemTable, built_at: datetime, model: Optional[str] = None) -> str:
+        """
+        write the items of a build as a new part, in a temporary directory renamed once complete
+
+        :param built_at: the start time of the build, the date partition and the name of the part,
+            suffixed by a counter if another build of the same second is archived, e.g. `045012-1`
+        :param model: the embedding model of `table.embeddings`
+        :return: the directory of the part
+        """
+        date_dir = os.path.join(self.path, built_at.strftime("%Y-%m-%d"))
+        tmp = os.path.join(date_dir, f"{built_at:%H%M%S}.tmp-{os.getpid()}")
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            for name in TEXT_COLUMNS:
+                with gzip.open(os.path.join(tmp, f"{name}.json.gz"), "wt", encoding="utf-8", compresslevel=6) as f:
+                    json.dump(getattr(table, name).tolist(), f, ensure_ascii=False)
+            for name in ARRAY_COLUMNS:
+                column = getattr(table, name)
+                if column is not None:
+                    np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(column))
+            meta = {
+                "schema_version": SCHEMA_VERSION,
+                "built_at": built_at.isoformat(),
+                "n_items": len(table),
+                "model": model if table.embeddings is not None else None,
+                "subjects": table.subjects.names,
+                "sources": table.sources.names,
+                "tags": table.tags.names,
+            }
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            for n in itertools.count():
+                part = os.path.join(date_dir, f"{built_at:%H%M%S}-{n}" if n else f"{built_at:%H%M%S}")
+                try:
+                    os.rename(tmp, part)
+                    break
+                except OSError:
+                    ## taken by another build of the same second, the rename fails on a non-empty directory
+                    if not os.path.isdir(part):
+                        raise
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return part
+
+    def parts(self, since: Optional[str] = None, until: Optional[str] = None) -> List[ArchivePart]:
+        """
+        the parts of the builds in a date range, in time order, only their `meta.json` is read
+
+        :param since: the first date, "YYYY-MM-DD", None for no limit
+        :param until: the date after the last one, "YYYY-MM-DD", None for no limit
+        """
+        if not os.path.isdir(self.path):
+            return []
+        parts = []
+        for date in sorted(os.listdir(self.path)):
+            if (since and date < since) or (until and date >= until):
+                continue
+            date_dir = os.path.join(self.path, date)
+            if not os.path.isdir(date_dir):
+                continue
+            ## the temporary directories of the interrupted writes have a `.tmp-` suffix
+            names = [name for name in os.listdir(date_dir) if name.partition("-")[0].isdigit()]
+            for name in sorted(names, key=_part_order):
+                parts.append(ArchivePart(os.path.join(date_dir, name)))
+        return parts
+
+
+def _part_order(name: str) -> tuple:
+    time, _, n = name.partition("-")
+    return time, int(n or 0)
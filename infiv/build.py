@@ -1,28 +1,34 @@
 import functools
 import importlib
 import inspect
-import itertools
 import json
 import logging
 import os
-import random
-import time
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import TYPE_CHECKING, Callable, List
+from typing import TYPE_CHECKING, List, Optional
 
-import numpy as np
-import yaml
+from infiv.metrics import get_metrics, reset_metrics
+from infiv.spiders import LazySource, get_spider, validate_sources
+from infiv.state import SourceState, StateStore, env_expired_datetime
 
 if TYPE_CHECKING:
     import argparse
 
+    import numpy as np
+
+    from infiv.embed_cache import EmbeddingCache
+    from infiv.embedders import Embedder
+    from infiv.table import ItemTable
     from infiv.types import InfoItem
 
 logger = logging.getLogger(__name__)
 
 
-def bind_params(func, kwargs_dict):
+def bind_params(func, kwargs_dict, injected=None):
+    """
+    bind the `kwargs_dict` to `func`, the values in `injected` (e.g. the shared
+    http client) are only bound if `func` accepts them.
+    """
     # Get the function signature
     sig = inspect.signature(func)
     func_name = func.__name__
@@ -55,6 +61,10 @@ def bind_params(func, kwargs_dict):
         if param in kwargs_dict:
             bound_args[param] = kwargs_dict[param]
 
+    for param, value in (injected or {}).items():
+        if param in sig.parameters and param not in kwargs_dict:
+            bound_args[param] = value
+
     # Log if there are unused kwargs
     unused_kwargs = set(kwargs_dict) - set(required_params) - set(optional_params)
     if unused_kwargs:
@@ -85,260 +95,347 @@ def import_function_by_full_path(full_path: str):
     return func
 
 
-def retry_with_timeout_decorator(
-    max_retries: int = 3,
-    base_delay: int = 10,
-    factor: int = 2,
-    jitter: bool = True,
-):
+def load_embedder(src_config_data: dict) -> "Embedder":
+    """
+    the embedder of the `embedder` section of a source config, default to google gemini
+    """
+    embedder_config = src_config_data.get("embedder", {})  # type: dict
+    return bind_params(
+        import_function_by_full_path(
+            embedder_config.get("func", "infiv.embedders.gemini.GeminiEmbedder")
+        ),
+        embedder_config.get("kwargs", {}),
+    )()
+
+
+def load_embedding_cache(src_config_data: dict, embedder: "Embedder") -> Optional["EmbeddingCache"]:
+    """
+    the embedding cache of the `embedding_cache` section of a source config, None if it is disabled
+    """
+    embedding_cache_config = src_config_data.get("embedding_cache", {})  # type: dict
+    if not embedding_cache_config.get("enable", True):
+        return None
+
+    from infiv.embed_cache import EmbeddingCache
+
+    return EmbeddingCache(
+        dim=embedder.dim,
+        path=embedding_cache_config.get("path", "./.cache/embeddings"),
+        max_items=embedding_cache_config.get("max_items", 200000),
+        max_age_days=embedding_cache_config.get("max_age_days", 30),
+    )
+
+
+def get_embeddings(
+    texts: List[str],
+    embedder: "Embedder",
+    cache: Optional["EmbeddingCache"] = None,
+) -> "np.ndarray":
     """
-    A retry decorator with exponentially increasing timeout.
+    get the embedding of texts, one row per text.
 
-    :param max_retries: Maximum number of retries
-    :param base_delay: Base delay time in seconds
-    :param factor: Factor by which to increase the delay
-    :param jitter: If True, add jitter to the delay
-    :return: the decorator that wraps the function
+    identical texts are only embedded once and the vectors found in `cache`
+    are not requested again. Failed requests get zero vectors which are not cached.
     """
+    import numpy as np
+
+    from infiv.embed_cache import embedding_cache_key
+
+    unique_texts = list(dict.fromkeys(texts))
+    keys = [embedding_cache_key(embedder.model, embedder.task_type, text) for text in unique_texts]
+    cached = cache.get_many(keys) if cache is not None else {}
+    missing = [(key, text) for key, text in zip(keys, unique_texts) if key not in cached]
+    get_metrics().inc("infiv_embed_cache_hits_total", len(unique_texts) - len(missing), model=embedder.model)
+    get_metrics().inc("infiv_embed_cache_misses_total", len(missing), model=embedder.model)
+    logger.info(
+        f"Embedding {len(texts)} texts: {len(unique_texts)} unique, {len(unique_texts) - len(missing)} cached"
+    )
+
+    fetched = embedder.embed([text for _, text in missing])
+    new_vectors = {key: vector for (key, _), vector in zip(missing, fetched)}
+    if cache is not None:
+        cache.put_many({key: vector for key, vector in new_vectors.items() if vector.any()})
+
+    vectors = {**cached, **new_vectors}
+    text_to_key = dict(zip(unique_texts, keys))
+    matrix = np.zeros((len(texts), embedder.dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        matrix[i] = vectors[text_to_key[text]]
+    return matrix
+
+
+def get_rerank_projection(
+    rerank_dicts: dict,
+    embedder: "Embedder",
+    embedding_cache: Optional["EmbeddingCache"] = None,
+) -> Optional["np.ndarray"]:
+    """
+    the vector projecting an item embedding to its rerank score, read from the
+    `embedding_json` of the `rerank` config or computed from its likes and dislikes
 
-    def decorator(
-        func: Callable[[], List["InfoItem"]],
-    ) -> Callable[[], List["InfoItem"]]:
-        @functools.wraps(func)
-        def retry_calling() -> List["InfoItem"]:
-            retries = 0
-            while retries < max_retries:
-                try:
-                    # Compute the current delay
-                    delay = base_delay * (factor**retries)
-                    if jitter:
-                        delay += random.uniform(0, 1)  # Add jitter
-
-                    # If the function accepts 'timeout', bind the computed delay
-                    sig = inspect.signature(func)
-                    if (
-                        "timeout" in sig.parameters
-                        and sig.parameters["timeout"].default is None
-                    ):
-                        return func(timeout=delay)
-                    else:
-                        return func()
-                except Exception as e:
-                    retries += 1
-                    if retries >= max_retries:
-                        url = sig.parameters.get("url", "bad url")
-                        return [
-                            {
-                                "title": url,
-                                "content": f"fail to fetch, please visited the url manually.",
-                                "links": [{"source": url}],
-                                "pub_datetime": datetime.now(),
-                                "tags": [],
-                            }
-                        ]
-                    logger.info(
-                        f"Fail in the try {retries}/{max_retries} in {delay:.2f} seconds..."
-                    )
-                    if not (
-                        "timeout" in sig.parameters
-                        and sig.parameters["timeout"].default is None
-                    ):
-                        ## only sleep if no timeout
-                        time.sleep(delay)
-
-        return retry_calling
-
-    return decorator
+    :return: None if there is no rerank config
+    """
+    import numpy as np
+
+    if not rerank_dicts:
+        return None
+    if rerank_dicts.get("embedding_json"):
+        with open(rerank_dicts["embedding_json"], "r") as f:
+            rerank_proj_embed = json.load(f)
+        if isinstance(rerank_proj_embed, dict):
+            rerank_proj_embed = rerank_proj_embed["embedding"]
+        return np.array(rerank_proj_embed)
+
+    likes = rerank_dicts.get("likes", [])  # type: List[str]
+    dislikes = rerank_dicts.get("dislikes", []) # type: List[str]
+
+    n_likes = len(likes)
+    n_dislikes = len(dislikes)
+    proj_proto_texts = likes + dislikes
+    proj_proto_embeddings = get_embeddings(
+        proj_proto_texts, embedder, embedding_cache
+    )
+    # average_score = sum_pos query .* pos_embed / n_pos - sum_neg query .* neg_embed / n_neg
+    #               = (sum_pos pos_embed / n_pos) .* query - (sum_neg neg_embed / n_neg) .* query
+    #               = (sum_pos pos_embed / n_pos - sum_neg neg_embed / n_neg) .* query
+    #               =   ----  rerank_proj_embed     ----                      .* query
+    avg_pos_proto_embed = np.mean(proj_proto_embeddings[:n_likes], axis=0) if n_likes > 0 else np.zeros(embedder.dim)
+    avg_neg_proto_embed = np.mean(proj_proto_embeddings[n_likes:], axis=0) if n_dislikes > 0 else np.zeros(embedder.dim)
+    return avg_pos_proto_embed - avg_neg_proto_embed
 
 
 def main(args: "argparse.Namespace"):
+    ## the heavy dependencies are only imported by a build, not by the other commands
+    import numpy as np
+    import yaml
+
+    from infiv.http import close_client, configure_client
+    from infiv.parsing import configure_parse_pool, configure_parser, shutdown_parse_pool
+    from infiv.pipeline import run_pipeline
+    from infiv.rank import rank_items, score_items
+    from infiv.render import render_digest
+    from infiv.retry import FETCH_FAILED_TAG, RetryScheduler
+    from infiv.utils import configure_html_converter, get_host
+
     src_config = args.src_config
     with open(src_config, "r") as f:
         src_config_data = yaml.load(f, Loader=yaml.FullLoader)
     max_thread = getattr(args, "threads", 4)
 
-    ## 1. fetch data
+    build_start = datetime.now()
+    metrics = reset_metrics()
+    metrics.set("infiv_build_start_timestamp_seconds", build_start.timestamp())
+    stages = metrics.laps("infiv_stage_seconds", "stage")
+
+    ## the deadline of the build counts from its start
+    retry_settting = src_config_data.get("retry", {})  # type: dict
+    scheduler = RetryScheduler(
+        max_retries=retry_settting.get("max_retries", 3),
+        base_delay=retry_settting.get("base_delay", 10),
+        factor=retry_settting.get("factor", 2),
+        jitter=retry_settting.get("jitter", True),
+        max_delay=retry_settting.get("max_delay", 120),
+        deadline=retry_settting.get("deadline"),
+        source_budget=retry_settting.get("source_budget"),
+        failure_threshold=retry_settting.get("failure_threshold", 3),
+        reset_timeout=retry_settting.get("reset_timeout", 300),
+    )
+    configure_html_converter(**src_config_data.get("markdown", {}))
+    parser_config = src_config_data.get("parser", {})  # type: dict
+    configure_parser(parser_config.get("backend", "html.parser"))
+    ## after the parser and the markdown converter, the workers of the parse pool are set up like them
+    configure_parse_pool(parser_config.get("processes"), markdown=src_config_data.get("markdown", {}))
+
+    ## 1. fetch data, the spider modules are only imported when their sources are scheduled
     sources = src_config_data["sources"]
-    fetch_funcs = [
-        bind_params(
-            import_function_by_full_path(source["func"]),
-            {"url": source.get("url", ""), **source.get("kwargs", {})},
+    errors = validate_sources(sources)
+    if errors:
+        raise ValueError(f"Invalid sources in {src_config}:\n" + "\n".join(errors))
+    source_keys = [f"{source['func']}:{source.get('url', '')}" for source in sources]
+    ## the host of a source selects its concurrency limit and circuit breaker, e.g. export.arxiv.org for `cs.CV`
+    source_hosts = [get_spider(source["func"]).host or get_host(source.get("url", "")) for source in sources]
+
+    ## EXPIRED_DAYTIME overrides the high-water mark of every source, e.g. to catch up
+    state_config = src_config_data.get("state", {})  # type: dict
+    if state_config.get("enable", True):
+        state_store = StateStore(
+            path=state_config.get("path", "./.cache/state.sqlite"),
+            initial_days=state_config.get("initial_days", 1),
+            max_age_days=state_config.get("max_age_days", 90),
         )
-        for source in sources
-    ]
+        source_states = [state_store.source(key, since=env_expired_datetime()) for key in source_keys]
+    else:
+        state_store = None
+        source_states = [SourceState(key, env_expired_datetime(), set()) for key in source_keys]
 
-    retry_settting = src_config_data.get("retry", {})
+    http_client = configure_client(
+        **{"validator_cache": "./.cache/http.sqlite", **src_config_data.get("http", {})}
+    )
     fetch_funcs = [
-        retry_with_timeout_decorator(
-            max_retries=retry_settting.get("max_retries", 3),
-            base_delay=retry_settting.get("base_delay", 10),
-            factor=retry_settting.get("factor", 2),
-            jitter=retry_settting.get("jitter", True),
-        )(func)
-        for func in fetch_funcs
+        LazySource(
+            get_spider(source["func"]),
+            functools.partial(
+                bind_params,
+                kwargs_dict={"url": source.get("url", ""), **source.get("kwargs", {})},
+                injected={"client": http_client.for_source(key), "state": state},
+            ),
+        )
+        for source, state, key in zip(sources, source_states, source_keys)
     ]
 
-    with ThreadPoolExecutor(max_workers=max_thread) as executor:
-        fetch_results = list(executor.map(lambda func: func(), fetch_funcs))  # type: List[List["InfoItem"]]
-
-    ## flatten the fetch results
-    flattened_results = []  # type: List["InfoItem"]
-    for fetch_result, source in zip(fetch_results, sources):
-        subject = source.get("subject", "unclass")  # type: str
-        for item in fetch_result:
-            item["subject"] = subject
-        flattened_results += fetch_result
-
-    ## if set EXPIRED_DAYTIME, filter out the expired items
-    if "EXPIRED_DAYTIME" in os.environ:
-        expired_datetime = datetime.strptime(os.environ["EXPIRED_DAYTIME"], r"%Y/%m/%d %H:%M")
-        flattened_results = [
-            item for item in flattened_results if item["pub_datetime"] > expired_datetime
-        ]
-
-    ## 2. get embedding from google gemini
-    if not getattr(args, "use_embed", False):
-        embeddings = None
-    elif "GOOGLE_API_KEY" not in os.environ:
-        assert False, "GOOGLE_API_KEY not found in env, can't get llm embedding"
-    else:
-        import google.generativeai as genai
-
-        genai.configure(transport="rest")  # TODO: test speed https vs grpc
-        get_embedding_funcs = [
-            functools.partial(
-                genai.embed_content,
-                model="models/embedding-001",
-                content=item["title"],
-                task_type="clustering",
+    ## 2. the embedder, the items are embedded as they come out of the filter
+    embedder = None  # type: Optional[Embedder]
+    embedding_cache = None  # type: Optional[EmbeddingCache]
+    if getattr(args, "use_embed", False):
+        embedder = load_embedder(src_config_data)
+        embedding_cache = load_embedding_cache(src_config_data, embedder)
+
+    stages.lap("config")
+
+    ## fetch, filter out the expired and delivered items and embed the rest in a stream,
+    ## the items of the failed sources are kept to show them in the digest
+    def keep(index: int, table: "ItemTable") -> "np.ndarray":
+        state = source_states[index]
+        failed = table.has_tag(FETCH_FAILED_TAG)
+        item_ids = table.item_ids()
+        not_seen = np.fromiter((not state.is_seen(id_) for id_ in item_ids), dtype=bool, count=len(table))
+        return failed | (table.published_after(state.since) & not_seen)
+
+    fetch_config = src_config_data.get("fetch", {})  # type: dict
+    pipeline_config = src_config_data.get("pipeline", {})  # type: dict
+    try:
+        table = run_pipeline(
+            fetch_funcs,
+            urls=[source.get("url", "") for source in sources],
+            keys=source_keys,
+            subjects=[source.get("subject", "unclass") for source in sources],
+            keep=keep,
+            embed=functools.partial(get_embeddings, embedder=embedder, cache=embedding_cache) if embedder is not None else None,
+            max_workers=fetch_config.get("max_workers", max(max_thread, len(fetch_funcs))),
+            per_host_limit=fetch_config.get("per_host_limit", 4),
+            host_limits=fetch_config.get("host_limits", {}),
+            scheduler=scheduler,
+            queue_size=pipeline_config.get("queue_size", 16),
+            batch_size=pipeline_config.get("batch_size", 256),
+            hosts=source_hosts,
+        )
+    finally:
+        shutdown_parse_pool()
+        http_client.log_stats()
+        close_client()
+    metrics.set(
+        "infiv_stage_items",
+        sum(metrics.get("infiv_source_items", source=key, stage="fetched") for key in set(source_keys)),
+        stage="fetch",
+    )
+    stages.lap("fetch")
+
+    delivered = table  # before merging, to record the items of each source
+    for key in set(source_keys):
+        metrics.set("infiv_source_items", int(table.from_source(key).sum()), source=key, stage="new")
+    metrics.set("infiv_stage_items", len(table), stage="filter")
+    stages.lap("filter")
+
+    ## merge the near duplicates from different sources, by embedding or by title minhash
+    merge_config = src_config_data.get("merge", {})  # type: dict
+    if merge_config.get("enable", True) and len(table):
+        from infiv.merge import cluster_by_embedding, cluster_by_minhash
+
+        if table.embeddings is not None:
+            labels = cluster_by_embedding(
+                table.embeddings,
+                threshold=merge_config.get("threshold", 0.95),
+                block_size=merge_config.get("block_size", 512),
+                sources=table.source_codes,
             )
-            for item in flattened_results
-        ]
-        get_embedding_funcs = [
-            retry_with_timeout_decorator(
-                max_retries=3,
-                base_delay=60 / 1200,  # 1500 RPM at peak
-                factor=2,
-                jitter=True,
-            )(func)
-            for func in get_embedding_funcs
-        ]  # TODO: a bit abuse, refactor it or retry decorator. since the retry decorator typing to return a function return List[ItemInfo]
-
-        with ThreadPoolExecutor(max_workers=max_thread) as executor:
-            embeddings = list(executor.map(lambda func: func(), get_embedding_funcs))
-
-        embeddings = [
-            e_dict["embedding"] if isinstance(e_dict, dict) else [0.0] * 768
-            for e_dict in embeddings
-        ]
-        embeddings = np.array(embeddings)
-
-        ## get rerank embedding
-        rerank_dicts = src_config_data.get("rerank", {})  # type: dict
-        if rerank_dicts:
-            if rerank_dicts.get("embedding_json"):
-                with open(rerank_dicts["embedding_json"], "r") as f:
-                    rerank_proj_embed = json.load(f)
-                if isinstance(rerank_proj_embed, dict):
-                    rerank_proj_embed = rerank_proj_embed["embedding"]
-                rerank_proj_embed = np.array(rerank_proj_embed)
-            else:             
-                likes = rerank_dicts.get("likes", [])  # type: List[str]
-                dislikes = rerank_dicts.get("dislikes", []) # type: List[str]
-                
-                n_likes = len(likes)
-                n_dislikes = len(dislikes)
-                proj_proto_texts = likes + dislikes
-                get_embedding_funcs = [
-                    functools.partial(
-                        genai.embed_content,
-                        model="models/embedding-001",
-                        content=text,
-                        task_type="clustering",
-                    )
-                    for text in proj_proto_texts
-                ]
-                get_embedding_funcs = [
-                    retry_with_timeout_decorator(
-                        max_retries=3,
-                        base_delay=60 / 1200,  # 1500 RPM at peak
-                        factor=2,
-                        jitter=True,
-                    )(func)
-                    for func in get_embedding_funcs
-                ]
-
-                with ThreadPoolExecutor(max_workers=max_thread) as executor:
-                    proj_proto_embeddings = list(executor.map(lambda func: func(), get_embedding_funcs))
-                
-                proj_proto_embeddings = [
-                    e_dict["embedding"] if isinstance(e_dict, dict) else [0.0] * 768
-                    for e_dict in proj_proto_embeddings
-                ]
-                proj_proto_embeddings = np.array(proj_proto_embeddings)
-                # average_score = sum_pos query .* pos_embed / n_pos - sum_neg query .* neg_embed / n_neg
-                #               = (sum_pos pos_embed / n_pos) .* query - (sum_neg neg_embed / n_neg) .* query
-                #               = (sum_pos pos_embed / n_pos - sum_neg neg_embed / n_neg) .* query
-                #               =   ----  rerank_proj_embed     ----                      .* query
-                avg_pos_proto_embed = np.mean(proj_proto_embeddings[:n_likes], axis=0) if n_likes > 0 else np.zeros(768)
-                avg_neg_proto_embed = np.mean(proj_proto_embeddings[n_likes:], axis=0) if n_dislikes > 0 else np.zeros(768)
-                rerank_proj_embed = avg_pos_proto_embed - avg_neg_proto_embed
         else:
-            rerank_proj_embed = None        
-    ## 3. output markdown
-    ### TODO: dump to jinja2 template markdown
-    n = len(flattened_results)
-    ## result md
-    md_sections = [
-        f"# Daily News\n\nGenerated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} \n\nWe have {n} news from different sources."
-    ]
-    subject_group_indices = list(range(n))
-    subject_group_indices.sort(key=lambda i: flattened_results[i]["subject"])
-    for subject, indices in itertools.groupby(
-        subject_group_indices, key=lambda i: flattened_results[i]["subject"]
-    ):
-        indices = list(indices)
-        if embeddings is not None and rerank_proj_embed is not None:
-            indices = sorted(indices, key=lambda i: embeddings[i,:] @ rerank_proj_embed, reverse=True)
-        md_sections.append(f"## {subject}")
-        for index in indices:
-            item = flattened_results[index]
-            section_content = f"### {item['title']}"
-            ## insert links
-            section_content += "\n"
-            for i, link in enumerate(item["links"]):
-                if isinstance(link, str):
-                    section_content += f"[{link}]({link}); "
-                elif isinstance(link, dict):
-                    alt_text = next(iter(link.keys()))
-                    section_content += f"[{alt_text}]({link[alt_text]})"
-
-                if i < len(item["links"]) - 1:
-                    section_content += " "
-            ## insert time
-            section_content += (
-                f"\n\n{item['pub_datetime'].strftime(r'%Y/%m/%d %H:%M')} GTM"
+            labels = cluster_by_minhash(
+                table.title.tolist(),
+                threshold=merge_config.get("minhash_threshold", 0.8),
+                sources=table.source_codes,
             )
+        table = table.merge(labels)
+    metrics.set("infiv_stage_items", len(table), stage="merge")
+    stages.lap("merge")
 
-            ## insert content
-            section_content += "\n\n"
-            content = item["content"]
-            # This may break the markdown structure
-            # if len(content) >= 5000:
-            #     content = content[:5000] + "..."
-            
-            section_content += content
-
-            md_sections.append(section_content)
+    ## 3. output markdown
+    ## rank: group by subject, sort by the rerank score and keep the top_k of each subject
+    ## the items are embedded in the stream of the fetch, see `infiv_stage_busy_seconds{stage="embed"}`
+    rerank_dicts = src_config_data.get("rerank", {}) or {}  # type: dict
+    scores = None
+    if embedder is not None:
+        rerank_proj_embed = get_rerank_projection(rerank_dicts, embedder, embedding_cache)
+        if embedding_cache is not None:
+            embedding_cache.evict()
+            embedding_cache.close()
+        if table.embeddings is not None:
+            scores = table.score = score_items(table.embeddings, rerank_proj_embed)
+    order = rank_items(table.subject_names(), scores, rerank_dicts.get("top_k"))
+    metrics.set("infiv_stage_items", len(order), stage="rank")
+    stages.lap("rank")
 
     ## 4. ai summary if needed
     # TODO:
 
-    ## 5. dump
+    ## 5. dump, streamed section by section
+    render_config = src_config_data.get("render", {})  # type: dict
     with open("output.md", "wt") as f:
-        f.write("\n\n".join(md_sections))
+        render_digest(
+            table,
+            order,
+            f,
+            template_path=render_config.get("template"),
+            bytecode_cache_dir=render_config.get("bytecode_cache_dir", "./.cache/jinja2"),
+        )
 
     logger.info("Dump result markdown at output.md")
+    stages.lap("render")
+
+    ## 6. record the delivered items, a failed source restarts from its old high-water mark next time
+    ## but the items it delivered before failing are not delivered again
+    if state_store is not None:
+        delivered_failed = delivered.has_tag(FETCH_FAILED_TAG)
+        for key in set(source_keys):
+            from_source = delivered.from_source(key)
+            high_water = None if delivered_failed[from_source].any() else build_start
+            state_store.commit(key, high_water, delivered.take(from_source & ~delivered_failed))
+        state_store.close()
+    stages.lap("state")
+
+    ## 7. archive the items as rendered, to re-render them with `python -m infiv rerender`,
+    ## and append the new ones to the search index, not the placeholders of the failed sources
+    archive_config = src_config_data.get("archive", {})  # type: dict
+    if archive_config.get("enable", True):
+        from infiv.archive.index import SearchIndex
+        from infiv.archive.items import ItemArchive
+
+        archive_path = archive_config.get("path", "./.cache/archive")
+        part = ItemArchive(os.path.join(archive_path, "items")).write(
+            table, build_start, model=embedder.model if embedder is not None else None
+        )
+        logger.info(f"Archive {len(table)} items at {part}")
+
+        search_index = SearchIndex(archive_path)
+        n_archived = search_index.add(
+            table.filter(~table.has_tag(FETCH_FAILED_TAG)),
+            model=embedder.model if embedder is not None else None,
+            archived=build_start,
+        )
+        logger.info(f"Index {n_archived} new items, {len(search_index)} in the search index")
+        search_index.close()
+        metrics.set("infiv_stage_items", n_archived, stage="archive")
+    stages.lap("archive")
+
+    ## 8. metrics of the run, the history file lives in the build cache to compare the daily runs
+    metrics.set("infiv_build_duration_seconds", stages.total())
+    metrics_config = src_config_data.get("metrics", {})  # type: dict
+    if metrics_config.get("enable", True):
+        metrics.write(
+            json_path=metrics_config.get("json", "metrics.json"),
+            prometheus_path=metrics_config.get("prometheus", "metrics.prom"),
+            history_path=metrics_config.get("history", "./.cache/metrics-history.jsonl"),
+            history_max_days=metrics_config.get("history_max_days", 90),
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+class DiskCache:
+    """
+    A small thread-safe key-value store in sqlite, values are pickled.
+
+    :param path: path of the sqlite file
+    :param max_age_days: entries not updated for this many days are dropped at opening, None to keep forever
+    """
+
+    def __init__(self, path: str, max_age_days: Optional[float] = 30.0):
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        if max_age_days is not None:
+            self._conn.execute(
+                "DELETE FROM cache WHERE updated < ?", (time.time() - max_age_days * 24 * 3600,)
+            )
+        self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row is not None else default
+
+    def set(self, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, updated) VALUES (?, ?, ?)",
+                (key, blob, time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
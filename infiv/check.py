@@ -0,0 +1,51 @@
+"""
+Validate a source config without running the build.
+
+Only the registry of `infiv.spiders` and the yaml loader are imported: the
+spider modules are read with `ast` instead of being imported, so a config is
+checked in milliseconds and without the cookies of the spiders being scheduled.
+"""
+import importlib.util
+import logging
+import sys
+
+from infiv.spiders import validate_sources
+
+logger = logging.getLogger(__name__)
+
+
+def validate_config(config: dict) -> list:
+    """
+    :return: the errors of the config, empty if it is valid
+    """
+    if not isinstance(config.get("sources"), list):
+        return ["sources: missing or not a list"]
+    errors = validate_sources(config["sources"])
+    embedder_func = config.get("embedder", {}).get("func")
+    if embedder_func:
+        module = embedder_func.rpartition(".")[0]
+        if importlib.util.find_spec(module) is None:
+            errors.append(f"embedder: cannot find the module of {embedder_func}")
+    return errors
+
+
+def main(args):
+    import yaml
+
+    src_config = getattr(args, "src_config", "./configs/source.yaml")
+    with open(src_config, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    errors = validate_config(config)
+    for error in errors:
+        logger.error(error)
+    if errors:
+        sys.exit(1)
+    logger.info(f"{src_config}: {len(config['sources'])} sources are valid")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src_config", type=str, default="./configs/source.yaml")
+    main(parser.parse_args())
@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from infiv.vectors import VectorFile
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_cache_key(model: str, task_type: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{task_type}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache.
+
+    The index lives in a sqlite table (content hash -> row) and the vectors
+    live in a memory-mapped float32 matrix next to it, so a lookup only
+    touches the rows it needs. The rows of the evicted vectors are listed in
+    `free_rows` and reused before the matrix grows past its `next_row`.
+
+    :param path: directory to store `index.sqlite` and `vectors.f32`
+    :param dim: dimension of the cached embeddings
+    :param max_items: keep at most this many vectors, least recently used are evicted first
+    :param max_age_days: evict vectors not used for this many days
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int = 768,
+        max_items: int = 200000,
+        max_age_days: float = 30.0,
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.max_items = max_items
+        self.max_age_days = max_age_days
+
+        ## used by the embed stage of the pipeline and then by the build, one thread at a time
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                row INTEGER UNIQUE NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY);
+            """
+        )
+        stored_dim = self._get_meta("dim")
+        if stored_dim is not None and int(stored_dim) != dim:
+            ## the vectors file is shaped by dim, a new embedding model can't share it
+            logger.warning(
+                f"Embedding cache dim changed {stored_dim} -> {dim}, drop the old cache at {path}"
+            )
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.execute("DELETE FROM free_rows")
+            self._set_meta("capacity", "0")
+            self._set_meta("next_row", "0")
+        self._set_meta("dim", str(dim))
+        if self._get_meta("next_row") is None:
+            ## a cache of an older version, list its free rows once
+            used_rows = {row for (row,) in self._conn.execute("SELECT row FROM embeddings")}
+            next_row = max(used_rows) + 1 if used_rows else 0
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO free_rows (row) VALUES (?)",
+                [(row,) for row in range(next_row) if row not in used_rows],
+            )
+            self._set_meta("next_row", str(next_row))
+        self._conn.commit()
+
+        self._vector_file = VectorFile(
+            os.path.join(path, "vectors.f32"), dim, int(self._get_meta("capacity") or 0)
+        )
+
+    def _get_meta(self, name: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, name: str, value: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def _grow(self, min_capacity: int):
+        if self._vector_file.grow(min_capacity):
+            self._set_meta("capacity", str(self._vector_file.capacity))
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _rows(self, keys: Sequence[str]) -> Dict[str, int]:
+        """
+        :return: the rows of the cached keys
+        """
+        rows = {}  # type: Dict[str, int]
+        for i in range(0, len(keys), 500):  # keep under the sqlite variable limit
+            chunk = list(keys[i:i + 500])
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(
+                self._conn.execute(
+                    f"SELECT key, row FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+            )
+        return rows
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        :return: a dict of the cached keys to their vectors, missing keys are absent
+        """
+        if self._vector_file.array is None or not keys:
+            return {}
+        rows = self._rows(keys)
+        if rows:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in rows],
+            )
+            self._conn.commit()
+        return {key: np.array(self._vector_file.array[row]) for key, row in rows.items()}
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        cached = self._rows(list(items))
+        items = {key: vec for key, vec in items.items() if key not in cached}
+        if not items:
+            return
+        ## the rows of the evicted vectors first, then new rows at the end of the matrix
+        free_rows = [
+            row for (row,) in self._conn.execute("SELECT row FROM free_rows ORDER BY row LIMIT ?", (len(items),))
+        ]
+        if free_rows:
+            self._conn.execute("DELETE FROM free_rows WHERE row <= ?", (free_rows[-1],))
+        next_row = int(self._get_meta("next_row") or 0)
+        n_new = len(items) - len(free_rows)
+        if n_new > 0:
+            free_rows += range(next_row, next_row + n_new)
+            self._set_meta("next_row", str(next_row + n_new))
+            self._grow(next_row + n_new)
+
+        now = time.time()
+        records = []
+        for (key, vec), row in zip(items.items(), free_rows):
+            self._vector_file.array[row] = np.asarray(vec, dtype=np.float32)
+            records.append((key, row, now, now))
+        self._vector_file.flush()
+        self._conn.executemany(
+            "INSERT INTO embeddings (key, row, created, last_used) VALUES (?, ?, ?, ?)", records
+        )
+        self._conn.commit()
+
+    def evict(self) -> int:
+        """
+        drop the vectors older than `max_age_days` and then the least recently
+        used ones above `max_items`. The rows are reused by later `put_many`.
+
+        :return: the number of evicted vectors
+        """
+        before = len(self)
+        if self.max_age_days is not None:
+            expired_time = time.time() - self.max_age_days * 24 * 3600
+            self._conn.execute(
+                "INSERT INTO free_rows (row) SELECT row FROM embeddings WHERE last_used < ?", (expired_time,)
+            )
+            self._conn.execute("DELETE FROM embeddings WHERE last_used < ?", (expired_time,))
+        if self.max_items is not None:
+            least_used = self._conn.execute(
+                "SELECT key, row FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_items,)
+            ).fetchall()
+            self._conn.executemany("INSERT INTO free_rows (row) VALUES (?)", [(row,) for _, row in least_used])
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in least_used])
+        self._conn.commit()
+        n_evicted = before - len(self)
+        if n_evicted:
+            logger.info(f"Evict {n_evicted} embeddings from cache {self.path}")
+        return n_evicted
+
+    def close(self):
+        self._vector_file.close()
+        self._conn.close()
@@ -0,0 +1,96 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from infiv.metrics import get_metrics
+from infiv.ratelimit import RateLimiter
+from infiv.retry import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class Embedder:
+    """
+    Base class of the text embedders used by `build --use_embed`.
+
+    Subclasses implement `embed_batch`; `embed` splits the texts into batches,
+    sends them under the shared rate limit and stacks the vectors in the input order.
+    A failed batch is retried after an exponential backoff with jitter, e.g. on
+    a 429 or a 5xx, and a batch failing `max_retries` times gets zero vectors.
+
+    :param model: model name, part of the embedding cache key
+    :param task_type: task type, part of the embedding cache key
+    :param dim: dimension of the embedding vectors
+    :param batch_size: max number of texts per request
+    :param rpm: requests per minute limit, None for no limit
+    :param tpm: tokens per minute limit, None for no limit
+    :param max_workers: number of batches in flight
+    :param max_retries: retries of a failed batch
+    :param retry_base_delay: backoff after the first failed try of a batch in seconds, doubled at each try
+    :param retry_max_delay: cap of the backoff
+    """
+
+    def __init__(
+        self,
+        model: str,
+        task_type: str = "clustering",
+        dim: int = 768,
+        batch_size: int = 100,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        retry_base_delay: float = 1.0,
+        retry_max_delay: float = 30.0,
+    ):
+        self.model = model
+        self.task_type = task_type
+        self.dim = dim
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.rate_limiter = RateLimiter(rpm=rpm, tpm=tpm)
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    @staticmethod
+    def count_tokens(texts: List[str]) -> int:
+        ## rough estimation, ~4 characters per token
+        return sum(len(text) // 4 + 1 for text in texts)
+
+    def _embed_batch_with_retry(self, texts: List[str]) -> np.ndarray:
+        metrics = get_metrics()
+        metrics.inc("infiv_embed_texts_total", len(texts), model=self.model)
+        for retries in range(1, self.max_retries + 1):
+            self.rate_limiter.acquire(self.count_tokens(texts))
+            start = time.perf_counter()
+            try:
+                return np.asarray(self.embed_batch(texts), dtype=np.float32).reshape(len(texts), self.dim)
+            except Exception as e:
+                logger.info(f"Fail to embed a batch of {len(texts)} in the try {retries}/{self.max_retries}: {e}")
+            finally:
+                ## the latency of the request itself, the wait of the rate limit excluded
+                metrics.observe("infiv_embed_batch_seconds", time.perf_counter() - start, model=self.model)
+            if retries < self.max_retries:
+                metrics.inc("infiv_embed_retries_total", model=self.model)
+                ## the rate limit alone would let the retries of a throttled batch go in a burst
+                time.sleep(backoff_delay(retries, self.retry_base_delay, max_delay=self.retry_max_delay))
+        metrics.inc("infiv_embed_failures_total", model=self.model)
+        return np.zeros((len(texts), self.dim), dtype=np.float32)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        :return: a float32 array of shape (len(texts), dim)
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._embed_batch_with_retry, batches))
+        return np.concatenate(results, axis=0)
@@ -0,0 +1,24 @@
+import hashlib
+from typing import List
+
+import numpy as np
+
+from infiv.embedders import Embedder
+
+
+class FakeEmbedder(Embedder):
+    """
+    deterministic random unit vectors seeded by the text hash, no network.
+    A stand-in of the real embedders for testing and benchmarking.
+    """
+
+    def __init__(self, dim: int = 768, batch_size: int = 100, **kwargs):
+        super().__init__(model="fake", dim=dim, batch_size=batch_size, **kwargs)
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dim)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
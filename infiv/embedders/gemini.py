@@ -0,0 +1,51 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from infiv.embedders import Embedder
+
+
+class GeminiEmbedder(Embedder):
+    """
+    embedding from google gemini api, need GOOGLE_API_KEY in env.
+    """
+
+    def __init__(
+        self,
+        model: str = "models/embedding-001",
+        task_type: str = "clustering",
+        dim: int = 768,
+        batch_size: int = 100,  # the api limit of batchEmbedContents
+        rpm: Optional[float] = 1500,
+        tpm: Optional[float] = None,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        retry_base_delay: float = 1.0,
+        retry_max_delay: float = 30.0,
+    ):
+        assert "GOOGLE_API_KEY" in os.environ, "GOOGLE_API_KEY not found in env, can't get llm embedding"
+        super().__init__(
+            model=model,
+            task_type=task_type,
+            dim=dim,
+            batch_size=batch_size,
+            rpm=rpm,
+            tpm=tpm,
+            max_workers=max_workers,
+            max_retries=max_retries,
+            retry_base_delay=retry_base_delay,
+            retry_max_delay=retry_max_delay,
+        )
+        import google.generativeai as genai
+
+        genai.configure(transport="rest")  # TODO: test speed https vs grpc
+        self._genai = genai
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        result = self._genai.embed_content(
+            model=self.model,
+            content=texts,
+            task_type=self.task_type,
+        )
+        return np.array(result["embedding"])
@@ -0,0 +1,172 @@
+"""
+An offline embedder running on the CPU with NumPy only.
+
+The texts are turned into hashed character n-grams, weighted by a sublinear
+term frequency (times an optional IDF fitted beforehand) and sent through a
+sparse random projection to `dim` dimensions, so no model file, network or api
+key is needed. The n-grams of a whole batch are hashed at once on the code
+points of the concatenated texts. Character n-grams work for any language,
+including the titles without spaces between the words.
+
+The vectors only capture the surface of the texts: near duplicate titles get a
+cosine similarity close to 1 and titles sharing words score higher than the
+unrelated ones, enough for the merge and the likes/dislikes rerank.
+"""
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from infiv.embedders import Embedder
+
+logger = logging.getLogger(__name__)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    the splitmix64 finalizer, spreads the bits of uint64 hashes
+    """
+    values = values.astype(np.uint64, copy=True)
+    with np.errstate(over="ignore"):
+        values ^= values >> np.uint64(30)
+        values *= np.uint64(0xBF58476D1CE4E5B9)
+        values ^= values >> np.uint64(27)
+        values *= np.uint64(0x94D049BB133111EB)
+        values ^= values >> np.uint64(31)
+    return values
+
+
+class HashingEmbedder(Embedder):
+    """
+    hashed character n-grams, TF-IDF weighted and randomly projected, no network.
+
+    :param dim: dimension of the embedding vectors
+    :param ngram_range: min and max length of the character n-grams
+    :param n_features: number of hash buckets of the n-grams, the size of the IDF vector
+    :param density: non-zero entries of each bucket in the projection matrix
+    :param idf_path: a `.npy` file of `n_features` IDF weights, see `fit_idf`, None for no IDF
+    :param seed: seed of the hash and projection constants, changing it changes all the vectors
+    :param batch_size: texts encoded at once
+    """
+
+    def __init__(
+        self,
+        dim: int = 256,
+        ngram_range: Tuple[int, int] = (2, 4),
+        n_features: int = 1 << 20,
+        density: int = 4,
+        idf_path: Optional[str] = None,
+        seed: int = 0,
+        batch_size: int = 1024,
+        **kwargs,
+    ):
+        kwargs.setdefault("max_workers", 1)
+        min_n, max_n = ngram_range
+        super().__init__(
+            ## every parameter changing the vectors is part of the embedding cache key
+            model=f"local-hashing-d{dim}-n{min_n}{max_n}-f{n_features}-s{density}-seed{seed}"
+            + (f"-idf{idf_path}" if idf_path else ""),
+            task_type="clustering",
+            dim=dim,
+            batch_size=batch_size,
+            **kwargs,
+        )
+        self.ngram_range = (min_n, max_n)
+        self.n_features = n_features
+        self.density = density
+
+        rng = np.random.default_rng(seed)
+        ## one odd multiplier per position of an n-gram
+        self._multipliers = rng.integers(1, 1 << 63, size=max_n, dtype=np.uint64) | np.uint64(1)
+        self._projection_salt = rng.integers(1, 1 << 63, size=density, dtype=np.uint64)
+
+        self.idf = None  # type: Optional[np.ndarray]
+        if idf_path:
+            self.idf = np.load(idf_path).astype(np.float32)
+            assert self.idf.shape == (n_features,), f"{idf_path} has {self.idf.shape} weights, {n_features} are expected"
+
+    ## features
+
+    def _code_points(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: the code points of the normalized texts joined by a 0 separator, and the row of each code point (-1 for the separators)
+        """
+        normalized = [" ".join(text.lower().split()) for text in texts]
+        normalized = [f" {text} " if text else "" for text in normalized]
+        codes = np.frombuffer("\0".join(normalized).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.array([len(text) for text in normalized], dtype=np.int64)
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths + 1)[:len(codes)]
+        rows[np.cumsum(lengths + 1)[:-1] - 1] = -1
+        return codes, rows
+
+    def features(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        the bag of hashed n-grams of each text.
+
+        :return: (rows, buckets, counts), the count of each n-gram bucket in each text, sorted by row
+        """
+        codes, rows = self._code_points(texts)
+        keys = []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if len(codes) < n:
+                break
+            n_windows = len(codes) - n + 1
+            hashes = np.full(n_windows, np.uint64(n), dtype=np.uint64)
+            with np.errstate(over="ignore"):
+                for j in range(n):
+                    hashes += codes[j:j + n_windows] * self._multipliers[j]
+            ## a window is valid if it starts and ends in the same text, the separator is in no text
+            start_rows = rows[:n_windows]
+            valid = (start_rows >= 0) & (start_rows == rows[n - 1:])
+            buckets = (_mix(hashes[valid]) % np.uint64(self.n_features)).astype(np.int64)
+            keys.append(start_rows[valid] * self.n_features + buckets)
+        if not keys:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+        return keys // self.n_features, keys % self.n_features, counts
+
+    def fit_idf(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        the smoothed IDF of each bucket over a corpus, e.g. the titles of the past digests.
+        Save it with `np.save` and pass the file as `idf_path`.
+        """
+        _, buckets, _ = self.features(texts)
+        document_frequency = np.bincount(buckets, minlength=self.n_features)
+        return (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    ## embedding
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        rows, buckets, counts = self.features(texts)
+        weights = 1 + np.log(counts.astype(np.float32))
+        if self.idf is not None:
+            weights *= self.idf[buckets]
+
+        ## sparse random projection: each bucket adds +-w to `density` pseudo random dimensions
+        vectors = np.zeros(len(texts) * self.dim, dtype=np.float64)
+        for salt in self._projection_salt:
+            mixed = _mix(buckets.astype(np.uint64) ^ salt)
+            dims = (mixed % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(mixed >> np.uint64(63), -1.0, 1.0)
+            vectors += np.bincount(rows * self.dim + dims, weights=weights * signs, minlength=len(vectors))
+        vectors = vectors.reshape(len(texts), self.dim).astype(np.float32)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+if __name__ == "__main__":
+    ## fit the IDF on a corpus of one text per line
+    import argparse
+
+    parser = argparse.ArgumentParser(description="fit the IDF weights of HashingEmbedder")
+    parser.add_argument("corpus", type=str, help="a text file, one text per line")
+    parser.add_argument("--output", type=str, default="idf.npy")
+    parser.add_argument("--n_features", type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    with open(args.corpus, "r") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+    np.save(args.output, HashingEmbedder(n_features=args.n_features).fit_idf(corpus))
+    print(f"Dump the IDF of {len(corpus)} texts at {args.output}")
@@ -0,0 +1,217 @@
+"""
+The process-wide pooled HTTP client shared by the spiders.
+
+Spiders get the client through `bind_params` (a `client` parameter) and fall
+back to `get_client()`, so the connections to a same host are kept alive and
+reused across sources.
+"""
+import copy
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from infiv.cache import DiskCache
+from infiv.metrics import get_metrics
+from infiv.parsing import run_parser
+
+logger = logging.getLogger(__name__)
+
+## gzip/deflate always, br when brotli is installed and urllib3 can decode it
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+T = TypeVar("T")
+
+
+def wire_bytes(resp: requests.Response) -> int:
+    """
+    :return: the bytes of the body of a read response as sent over the wire, i.e. before decompression
+    """
+    try:
+        return resp.raw.tell()
+    except (AttributeError, ValueError):
+        ## e.g. a response not backed by urllib3
+        content_length = resp.headers.get("Content-Length")
+        return int(content_length) if content_length and content_length.isdigit() else len(resp.content)
+
+
+class HttpClient:
+    """
+    A `requests.Session` with keep-alive connection pools.
+
+    :param pool_maxsize: default max number of kept-alive connections per host
+    :param host_pool_sizes: per-host override of `pool_maxsize`, e.g. {"localhost:1200": 32}
+    :param pool_block: block when the pool of a host is exhausted rather than opening a throw-away connection
+    :param headers: default headers of every request
+    :param validator_cache: path of the sqlite file caching ETag/Last-Modified and parsed bodies for `conditional_get`, None to disable
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        host_pool_sizes: Optional[Dict[str, int]] = None,
+        pool_block: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        validator_cache: Optional[str] = None,
+    ):
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self.session.headers.update(headers or {})
+
+        default_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount("http://", default_adapter)
+        self.session.mount("https://", default_adapter)
+        for host, size in (host_pool_sizes or {}).items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, pool_block=pool_block)
+            self.session.mount(f"http://{host}", adapter)
+            self.session.mount(f"https://{host}", adapter)
+
+        self._lock = threading.Lock()
+        self._bytes = defaultdict(int)  # type: Dict[str, int]
+        self.validator_cache = DiskCache(validator_cache) if validator_cache else None
+        self.source = None  # type: Optional[str]
+
+    def for_source(self, source: str) -> "HttpClient":
+        """
+        a view of the client sharing its connections and caches, with the requests counted to `source` in the metrics
+        """
+        view = copy.copy(self)
+        view.source = source
+        return view
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        resp = self.session.get(url, **kwargs)
+        n_bytes = wire_bytes(resp) if not kwargs.get("stream", False) else 0
+        with self._lock:
+            self._bytes[urlparse(url).netloc] += n_bytes
+        if self.source is not None:
+            metrics = get_metrics()
+            metrics.inc("infiv_source_requests_total", source=self.source)
+            metrics.inc("infiv_source_bytes_total", n_bytes, source=self.source)
+        return resp
+
+    def conditional_get(self, url: str, parse: Callable[[bytes], T], **kwargs) -> T:
+        """
+        GET `url` and return `parse(resp.content)`, parsed by `infiv.parsing.run_parser`.
+
+        With a validator cache, the ETag/Last-Modified of the last response are sent as
+        `If-None-Match`/`If-Modified-Since` and the cached parse result is reused on 304.
+
+        :raise RuntimeError: if the status code is neither 200 nor 304
+        """
+        if self.validator_cache is None:
+            resp = self.get(url, **kwargs)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Failed to fetch {url}; {resp.status_code}, {resp.content=}")
+            return run_parser(parse, resp.content)
+
+        ## the parse result depends on the parse function, so it is part of the key
+        key = f"{parse.__module__}.{parse.__qualname__}\0{url}"
+        cached = self.validator_cache.get(key)  # type: Optional[dict]
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        resp = self.get(url, headers=headers, **kwargs)
+        if resp.status_code == 304 and cached is not None:
+            logger.debug(f"{url} not modified, reuse the cached parse")
+            return cached["parsed"]
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to fetch {url}; {resp.status_code}, {resp.content=}")
+
+        parsed = run_parser(parse, resp.content)
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.validator_cache.set(
+                key, {"etag": etag, "last_modified": last_modified, "parsed": parsed}
+            )
+        elif cached is not None:
+            self.validator_cache.delete(key)
+        return parsed
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: per-host `requests`, new `connections`, `reused` connections and received `bytes` (as sent, compressed)
+        """
+        stats = defaultdict(lambda: {"requests": 0, "connections": 0, "reused": 0, "bytes": 0})
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                stats[host]["requests"] += pool.num_requests
+                stats[host]["connections"] += pool.num_connections
+                stats[host]["reused"] += max(0, pool.num_requests - pool.num_connections)
+        with self._lock:
+            for host, n_bytes in self._bytes.items():
+                stats[host]["bytes"] += n_bytes
+        return dict(stats)
+
+    def log_stats(self):
+        """
+        log the per-host stats and record them in the metrics
+        """
+        metrics = get_metrics()
+        for host, host_stats in sorted(self.stats().items()):
+            metrics.set("infiv_http_requests_total", host_stats["requests"], host=host)
+            metrics.set("infiv_http_connections_total", host_stats["connections"], host=host)
+            metrics.set("infiv_http_bytes_total", host_stats["bytes"], host=host)
+            logger.info(
+                f"{host}: {host_stats['requests']} requests over {host_stats['connections']} connections "
+                f"({host_stats['reused']} reused), {host_stats['bytes']} bytes"
+            )
+
+    def close(self):
+        self.session.close()
+        if self.validator_cache is not None:
+            self.validator_cache.close()
+
+
+_client = None  # type: Optional[HttpClient]
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+    the process-wide client, created with the default settings at the first call
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def configure_client(**kwargs) -> HttpClient:
+    """
+    replace the process-wide client by a new one built with `kwargs` of `HttpClient`
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = HttpClient(**kwargs)
+        return _client
+
+
+def close_client():
+    """
+    close the process-wide client, its connections and validator cache; the next `get_client()` creates a new one
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
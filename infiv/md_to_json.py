@@ -1,30 +1,86 @@
+import glob
 import json
+import os
 from datetime import datetime, timezone
-import re
+from typing import Iterator, List
+
+## the body limit of a github issue is 65535 characters, keep some margin
+MAX_BODY_CHARS = 65000
+
+
+def split_sections(lines: Iterator[str], max_chars: int = MAX_BODY_CHARS) -> Iterator[str]:
+    """
+    Split the markdown lines into parts of at most `max_chars` characters in a single pass.
+
+    Parts are only cut before a heading line (outside code blocks), so each
+    `###` item stays in one part. A single section longer than `max_chars`
+    is cut at line boundaries, and a single line longer than it is hard cut.
+    Only the current part and section are held in memory.
+    """
+    part = []  # type: List[str]
+    part_len = 0
+    section = []  # type: List[str]
+    section_len = 0
+    in_code_block = False
+
+    def close_section():
+        nonlocal part, part_len, section, section_len
+        if part_len + section_len > max_chars and part:
+            yield "".join(part)
+            part, part_len = [], 0
+        part += section
+        part_len += section_len
+        section, section_len = [], 0
+
+    for line in lines:
+        if line.startswith("```"):
+            in_code_block = not in_code_block
+        if line.startswith("#") and not in_code_block:
+            yield from close_section()
+
+        while len(line) > max_chars:  # a single giant line
+            yield from close_section()
+            if part:
+                yield "".join(part)
+                part, part_len = [], 0
+            yield line[:max_chars]
+            line = line[max_chars:]
+
+        if section_len + len(line) > max_chars:
+            ## the section alone is over the limit, emit it piece by piece
+            yield from close_section()
+            if part:
+                yield "".join(part)
+                part, part_len = [], 0
+        section.append(line)
+        section_len += len(line)
+
+    yield from close_section()
+    if part:
+        yield "".join(part)
+
+
 def main(args):
-    with open("output.md", "r") as f:
-        md_string = f.read()
-        ## cutting at 60k characters and keep the section with head level 3
-        ## find all head level 3
-        if len(md_string) > 65535:
-            head_level_3_pattern = re.compile(r"^### (.+)$", re.MULTILINE)
-            head_level_3_list = head_level_3_pattern.finditer(md_string)
-            cutting_index = 0
-            for match in head_level_3_list:
-                cutting_index = match.start()
-                if match.end() > 60000:
-                    md_string = md_string[:cutting_index]
-                    break
-        ## do the cutting at nearest to 60k characters
-
-    with open("output.json", "w") as f:
-        time_string = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
-        data_dict = {
-            "title": f"Daily News @ {time_string}",
-            "body": md_string,
-            "labels": ["report"]
-        }
-        json.dump(data_dict, f)
+    input_path = getattr(args, "input", "output.md")
+    max_chars = getattr(args, "max_chars", MAX_BODY_CHARS)
+    time_string = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
+
+    for stale_path in glob.glob("output-*.json"):
+        os.remove(stale_path)
+
+    ## 1. count the parts, the titles need the total
+    with open(input_path, "r") as f:
+        n_parts = sum(1 for _ in split_sections(f, max_chars))
+
+    ## 2. split again and write each part once, only one part is held in memory
+    with open(input_path, "r") as f:
+        for i, body in enumerate(split_sections(f, max_chars), start=1):
+            title = f"Daily News @ {time_string}"
+            if n_parts > 1:
+                title += f" ({i}/{n_parts})"
+            with open(f"output-{i}.json", "w") as part_f:
+                json.dump({"title": title, "body": body, "labels": ["report"]}, part_f)
+
 
 if __name__ == "__main__":
     import argparse
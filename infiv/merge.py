@@ -0,0 +1,150 @@
+"""
+Merge the near-duplicate items from different sources into one entry.
+
+With embeddings, the items are clustered by cosine similarity computed in row
+blocks of the similarity matrix. Without them, a MinHash/LSH over the character
+shingles of the titles is used instead. Either way the pairs above the threshold
+are joined into connected components with vectorized label propagation. Two
+items of a same source are never paired, e.g. the issues of a weekly digest.
+"""
+import logging
+import re
+import zlib
+from collections import defaultdict
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_NON_WORD_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def connected_components(n: int, pairs_i: np.ndarray, pairs_j: np.ndarray) -> np.ndarray:
+    """
+    :return: the component label of each node, the smallest node index in its component
+    """
+    labels = np.arange(n)
+    if len(pairs_i) == 0:
+        return labels
+    while True:
+        pair_min = np.minimum(labels[pairs_i], labels[pairs_j])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, pairs_i, pair_min)
+        np.minimum.at(new_labels, pairs_j, pair_min)
+        new_labels = new_labels[new_labels]  # pointer jumping
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def cluster_by_embedding(
+    embeddings: np.ndarray,
+    threshold: float = 0.95,
+    block_size: int = 512,
+    sources: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    :param embeddings: (n, dim) item embeddings, zero rows (failed embedding) are never merged
+    :param threshold: min cosine similarity of the near duplicates
+    :param block_size: number of rows of the similarity matrix computed at once
+    :param sources: the source code of each item, the items of a same source are never merged; None to not check
+    :return: the cluster label of each item
+    """
+    n = embeddings.shape[0]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normed = np.divide(embeddings, norms, out=np.zeros_like(embeddings, dtype=np.float32), where=norms > 0)
+    normed = normed.astype(np.float32, copy=False)
+
+    pairs_i, pairs_j = [], []
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        ## only the upper triangle, columns from `start`
+        sims = normed[start:end] @ normed[start:].T
+        sims[:, :end - start] = np.triu(sims[:, :end - start], k=1)
+        rows, cols = np.nonzero(sims >= threshold)
+        rows, cols = rows + start, cols + start
+        if sources is not None:
+            cross_source = sources[rows] != sources[cols]
+            rows, cols = rows[cross_source], cols[cross_source]
+        pairs_i.append(rows)
+        pairs_j.append(cols)
+    pairs_i = np.concatenate(pairs_i) if pairs_i else np.zeros(0, dtype=np.int64)
+    pairs_j = np.concatenate(pairs_j) if pairs_j else np.zeros(0, dtype=np.int64)
+    return connected_components(n, pairs_i, pairs_j)
+
+
+def _shingles(title: str, k: int) -> np.ndarray:
+    """
+    :return: the hashes of the character shingles, empty for a title without any word
+    """
+    text = _NON_WORD_PATTERN.sub(" ", title.lower()).strip()
+    if not text:
+        return np.zeros(0, dtype=np.uint64)
+    grams = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+    return np.array([zlib.crc32(gram.encode("utf-8")) for gram in grams], dtype=np.uint64)
+
+
+def cluster_by_minhash(
+    titles: List[str],
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    bands: int = 16,
+    shingle_size: int = 3,
+    seed: int = 0,
+    sources: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    cluster the titles with estimated jaccard similarity of their character shingles.
+
+    :param threshold: min estimated jaccard similarity of the near duplicates
+    :param num_perm: number of hash permutations of the signatures
+    :param bands: number of LSH bands, `num_perm` must be divisible by it
+    :param sources: the source code of each title, the titles of a same source are never merged; None to not check
+    :return: the cluster label of each title, the titles without any word are never merged
+    """
+    n = len(titles)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    signatures = np.empty((n, num_perm), dtype=np.uint64)
+    has_words = np.ones(n, dtype=bool)
+    for i, title in enumerate(titles):
+        shingles = _shingles(title, shingle_size)
+        if len(shingles) == 0:
+            has_words[i] = False
+            continue
+        ## a * x + b wraps around in uint64, good enough as a hash family
+        signatures[i] = ((a[:, None] * shingles[None, :] + b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+    candidates = np.flatnonzero(has_words)
+
+    rows_per_band = num_perm // bands
+    pairs_i, pairs_j = [], []
+    for band in range(bands):
+        buckets = defaultdict(list)
+        band_signatures = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for i, key in zip(candidates.tolist(), map(bytes, band_signatures[candidates])):
+            buckets[key].append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            members = np.array(members)
+            if sources is None:
+                heads = members[:1]
+            else:
+                ## the first member of each source, its items are only compared to the other sources
+                heads = members[np.unique(sources[members], return_index=True)[1]]
+            for head in heads.tolist():
+                others = members[members > head]
+                if sources is not None:
+                    others = others[sources[others] != sources[head]]
+                similarity = (signatures[others] == signatures[head]).mean(axis=1)
+                matched = others[similarity >= threshold]
+                pairs_i.append(np.full(len(matched), head))
+                pairs_j.append(matched)
+    pairs_i = np.concatenate(pairs_i) if pairs_i else np.zeros(0, dtype=np.int64)
+    pairs_j = np.concatenate(pairs_j) if pairs_j else np.zeros(0, dtype=np.int64)
+    return connected_components(n, pairs_i, pairs_j)
+
@@ -0,0 +1,287 @@
+"""
+Metrics of a build run.
+
+A process-wide registry of counters, gauges and histograms with labels, fed by
+the build stages, the retry wrapper of the sources, the http client and the
+embedders. At the end of a build the registry is written as `metrics.json`, as
+a Prometheus textfile (for the node_exporter textfile collector) and appended
+as one line to a history file kept in the build cache, so the daily runs can be
+compared; the lines of the builds older than `history_max_days` are dropped.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+## latency buckets in seconds, from 10 ms to 2 min
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+## name -> (type, help) of the known metrics
+DESCRIPTIONS = {
+    "infiv_build_start_timestamp_seconds": ("gauge", "Unix time of the start of the build"),
+    "infiv_build_duration_seconds": ("gauge", "Wall time of the whole build"),
+    "infiv_stage_seconds": ("gauge", "Wall time of each build stage"),
+    "infiv_stage_busy_seconds": ("gauge", "Time spent by the streamed stages on their items, overlapping the fetch"),
+    "infiv_stage_items": ("gauge", "Number of items coming out of each build stage"),
+    "infiv_source_seconds": ("gauge", "Wall time of fetching each source, retries included"),
+    "infiv_source_items": ("gauge", "Number of items of each source, fetched and new after filtering"),
+    "infiv_source_retries_total": ("counter", "Retries of each source"),
+    "infiv_source_failures_total": ("counter", "Sources failing after all their retries"),
+    "infiv_source_requests_total": ("counter", "HTTP requests sent by each source"),
+    "infiv_source_bytes_total": ("counter", "HTTP response bytes received by each source, compressed as sent"),
+    "infiv_parse_seconds": ("gauge", "Wall time of the spider parsers, waited for in the parse pool or run in the fetching threads"),
+    "infiv_http_requests_total": ("counter", "HTTP requests per host"),
+    "infiv_http_connections_total": ("counter", "New HTTP connections per host"),
+    "infiv_http_bytes_total": ("counter", "HTTP response bytes per host, compressed as sent"),
+    "infiv_embed_batch_seconds": ("histogram", "Latency of each embedding request"),
+    "infiv_embed_texts_total": ("counter", "Texts sent to the embedder"),
+    "infiv_embed_retries_total": ("counter", "Retries of the embedding requests"),
+    "infiv_embed_failures_total": ("counter", "Embedding batches failing after all their retries"),
+    "infiv_embed_cache_hits_total": ("counter", "Texts whose embedding is found in the embedding cache"),
+    "infiv_embed_cache_misses_total": ("counter", "Texts embedded by the embedder"),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """
+    the count of each bucket, the sum and the count of the observations
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """
+    A thread-safe registry of labeled counters, gauges and histograms.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}  # type: Dict[str, Dict[LabelKey, float]]
+        self._histograms = {}  # type: Dict[str, Dict[LabelKey, Histogram]]
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            samples = self._values.setdefault(name, {})
+            samples[key] = samples.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            if key not in histograms:
+                histograms[key] = Histogram(buckets)
+            histograms[key].observe(value)
+
+    def get(self, name: str, default: float = 0.0, **labels) -> float:
+        with self._lock:
+            return self._values.get(name, {}).get(_label_key(labels), default)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        add the wall time of the block to the gauge `name`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(name, time.perf_counter() - start, **labels)
+
+    def laps(self, name: str, label: str) -> "Laps":
+        """
+        time the consecutive stages of a run, see `Laps`
+        """
+        return Laps(self, name, label)
+
+    ## export
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            result = {}
+            for name in sorted(set(self._values) | set(self._histograms)):
+                metric_type, help_text = DESCRIPTIONS.get(name, ("untyped", ""))
+                samples = [
+                    {"labels": dict(key), "value": value}
+                    for key, value in self._values.get(name, {}).items()
+                ]
+                samples += [
+                    {
+                        "labels": dict(key),
+                        "buckets": {_format_value(bound): count for bound, count in histogram.cumulative()},
+                        "sum": histogram.sum,
+                        "count": histogram.count,
+                    }
+                    for key, histogram in self._histograms.get(name, {}).items()
+                ]
+                result[name] = {"type": metric_type, "help": help_text, "samples": samples}
+            return result
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._values) | set(self._histograms)):
+                metric_type, help_text = DESCRIPTIONS.get(name, ("untyped", ""))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(
+        self,
+        json_path: Optional[str] = "metrics.json",
+        prometheus_path: Optional[str] = "metrics.prom",
+        history_path: Optional[str] = None,
+        history_max_days: Optional[float] = 90.0,
+    ):
+        """
+        :param json_path: path of the full metrics in json, None to skip
+        :param prometheus_path: path of the Prometheus textfile, None to skip
+        :param history_path: path of a JSON lines file the metrics are appended to, None to skip
+        :param history_max_days: drop the lines of the history older than this many days, None to keep them all
+        """
+        metrics = self.to_dict()
+        if json_path:
+            _atomic_write(json_path, json.dumps({"created_at": time.time(), "metrics": metrics}, indent=2))
+            logger.info(f"Dump metrics at {json_path}")
+        if prometheus_path:
+            ## the textfile collector may read at any time, never expose a half written file
+            _atomic_write(prometheus_path, self.to_prometheus())
+        if history_path:
+            line = json.dumps({"created_at": time.time(), "metrics": metrics}, separators=(",", ":")) + "\n"
+            _append_history(history_path, line, history_max_days)
+
+
+class Laps:
+    """
+    record the wall time since the previous lap into the gauge `name`,
+    labeled by `label`, e.g. `laps.lap("fetch")` at the end of the fetch stage
+    """
+
+    def __init__(self, metrics: Metrics, name: str, label: str):
+        self.metrics = metrics
+        self.name = name
+        self.label = label
+        self.start = self._last = time.perf_counter()
+
+    def lap(self, value: str) -> float:
+        now = time.perf_counter()
+        elapsed, self._last = now - self._last, now
+        self.metrics.inc(self.name, elapsed, **{self.label: value})
+        return elapsed
+
+    def total(self) -> float:
+        return time.perf_counter() - self.start
+
+
+def _append_history(path: str, line: str, max_days: Optional[float]):
+    """
+    append a line to the history, rewritten without its expired lines when there are some
+    """
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    if max_days is not None and os.path.exists(path):
+        expired_time = time.time() - max_days * 24 * 3600
+        with open(path, "r") as f:
+            lines = f.readlines()
+        kept = [old_line for old_line in lines if _created_at(old_line) >= expired_time]
+        if len(kept) < len(lines):
+            _atomic_write(path, "".join(kept) + line)
+            return
+    with open(path, "a") as f:
+        f.write(line)
+
+
+def _created_at(line: str) -> float:
+    try:
+        return float(json.loads(line)["created_at"])
+    except (ValueError, KeyError, TypeError):
+        return 0.0  # a broken line, e.g. of an interrupted write
+
+
+def _atomic_write(path: str, content: str):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """
+    the process-wide metrics registry
+    """
+    return _metrics
+
+
+def reset_metrics() -> Metrics:
+    """
+    replace the process-wide registry by an empty one, e.g. at the start of a build
+    """
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
@@ -0,0 +1,183 @@
+"""
+The html parsing layer shared by the spiders.
+
+The BeautifulSoup backend is configurable (lxml / html5 / builtin) and each
+spider declares the subtrees it needs as simple selectors (`tag`, `.class`,
+`#id` and their combinations like `div.a.b`). Only those subtrees are built,
+with a `SoupStrainer`, instead of the tree of the whole page.
+
+The spiders fetch the pages in threads but parse them with `run_parser`: each
+spider exposes its pure parsers, `bytes -> items` functions of its module like
+`infiv.spiders.zhihu.answer_extract`, which run in a process pool when one is
+configured, so the parsing (BeautifulSoup, markdownify, feedparser) is not
+serialized on the GIL and a large build uses all the cores.
+"""
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional, Sequence, Tuple, TypeVar, Union
+
+from infiv.metrics import get_metrics
+
+if TYPE_CHECKING:
+    import bs4
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BACKEND_ALIASES = {
+    "builtin": "html.parser",
+    "html.parser": "html.parser",
+    "lxml": "lxml",
+    "html5": "html5lib",
+    "html5lib": "html5lib",
+}
+
+_backend = "html.parser"
+_pool = None  # type: Optional[ProcessPoolExecutor]
+_simple_selector_pattern = re.compile(r"([#.]?)([\w-]+)")
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    :return: the BeautifulSoup feature name of `backend`, the builtin parser if it is not installed
+    """
+    feature = BACKEND_ALIASES.get(backend, backend)
+    if feature == "html.parser":
+        return feature
+    try:
+        __import__(feature)
+    except ImportError:
+        logger.warning(f"{feature} is not installed, fall back to html.parser")
+        return "html.parser"
+    return feature
+
+
+def configure_parser(backend: str = "html.parser"):
+    """
+    set the default backend of `parse_html`, one of lxml / html5 / builtin
+    """
+    global _backend
+    _backend = resolve_backend(backend)
+
+
+def _parse_simple_selector(selector: str) -> Tuple[Optional[str], Optional[str], Tuple[str, ...]]:
+    tag, element_id, classes = None, None, []
+    for prefix, name in _simple_selector_pattern.findall(selector):
+        if prefix == "#":
+            element_id = name
+        elif prefix == ".":
+            classes.append(name)
+        else:
+            tag = name
+    return tag, element_id, tuple(classes)
+
+
+def strainer(selectors: Sequence[str]) -> "bs4.SoupStrainer":
+    """
+    a `SoupStrainer` keeping the elements matching any of the simple `selectors`, with their subtrees
+    """
+    from bs4 import SoupStrainer
+
+    parsed = [_parse_simple_selector(selector) for selector in selectors]
+
+    def match(name: str, attrs: dict) -> bool:
+        attrs = attrs or {}
+        element_classes = attrs.get("class", "")
+        if isinstance(element_classes, str):
+            element_classes = element_classes.split()
+        for tag, element_id, classes in parsed:
+            if tag is not None and name != tag:
+                continue
+            if element_id is not None and attrs.get("id") != element_id:
+                continue
+            if any(cls not in element_classes for cls in classes):
+                continue
+            return True
+        return False
+
+    return SoupStrainer(match)
+
+
+def parse_html(
+    content: Union[bytes, str],
+    parse_only: Optional[Sequence[str]] = None,
+    backend: Optional[str] = None,
+) -> "bs4.BeautifulSoup":
+    """
+    :param content: the html
+    :param parse_only: the simple selectors of the subtrees to build, None for the whole page
+    :param backend: override the configured backend
+    """
+    from bs4 import BeautifulSoup
+
+    feature = resolve_backend(backend) if backend is not None else _backend
+    if parse_only is None or feature == "html5lib":  # html5lib always builds the whole tree
+        return BeautifulSoup(content, feature)
+    return BeautifulSoup(content, feature, parse_only=strainer(parse_only))
+
+
+## the parse pool
+
+
+def _init_worker(backend: str, markdown: dict):
+    ## a worker parses with the settings of the build
+    from infiv.utils import configure_html_converter
+
+    configure_parser(backend)
+    configure_html_converter(**markdown)
+
+
+def configure_parse_pool(processes: Optional[int] = None, markdown: Optional[dict] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    replace the parse pool by one of `processes` workers, set up with the current
+    parser backend and the `markdown` kwargs of `infiv.utils.configure_html_converter`.
+
+    :param processes: None for the number of cpus, 0 (or a single cpu) to parse in the calling threads
+    :return: the pool, None if the parsers run in the calling threads
+    """
+    global _pool
+    shutdown_parse_pool()
+    if processes is None:
+        processes = os.cpu_count() or 1
+        processes = processes if processes > 1 else 0
+    if processes <= 0:
+        return None
+    ## the workers are not forked from the build, which runs threads
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    _pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(_backend, dict(markdown or {})),
+    )
+    return _pool
+
+
+def shutdown_parse_pool():
+    """
+    stop the parse pool, the parsers then run in the calling threads
+    """
+    global _pool
+    if _pool is not None:
+        ## a source given up at the deadline may still wait for a parse, do not wait for it
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def run_parser(parse: Callable[..., T], content: bytes, *args) -> T:
+    """
+    run a pure parser of a spider on a fetched page, in the parse pool if there is one.
+
+    :param parse: a module level function, pickled to the workers by its name
+    :param content: the page, and `args` the other picklable arguments of `parse`
+    """
+    with get_metrics().timer("infiv_parse_seconds", parser=f"{parse.__module__}.{parse.__qualname__}"):
+        pool = _pool
+        if pool is None:
+            return parse(content, *args)
+        return pool.submit(parse, content, *args).result()
@@ -0,0 +1,341 @@
+"""
+The streaming pipeline of a build.
+
+The sources run as tasks of one event loop, and the build does not wait
+for the slowest of them: the items flow through the filter and embed stages
+as soon as a source gives them
+
+    sources --(batch queue)--> filter --(table queue)--> embed --> collected table
+
+A source may return a list of items, or be a generator or an async generator
+yielding items (or lists of items) incrementally, e.g.
+`infiv.spiders.arxiv.iter_info`. Both queues are bounded, so a source running
+ahead of the stages waits instead of piling its items up in memory, and the
+items dropped by the filter are freed as they come.
+
+At the build deadline of the `RetryScheduler` the sources still running are
+given up and the build goes on with the items arrived so far. Merging, ranking
+and rendering need all the items, they run once on the collected table.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from infiv.metrics import get_metrics
+from infiv.retry import failed_items
+from infiv.table import Categories, ItemTable
+from infiv.utils import get_host
+
+if TYPE_CHECKING:
+    from infiv.retry import RetryScheduler
+    from infiv.types import InfoItem
+
+logger = logging.getLogger(__name__)
+
+
+def _as_batch(value) -> List["InfoItem"]:
+    """
+    a source yields either an item or a list of items
+    """
+    return [value] if isinstance(value, dict) else list(value)
+
+
+class _IteratorPump:
+    """
+    Drain a sync iterator in a worker thread into a bounded buffer read by the event loop.
+
+    An item is seen by the loop as soon as it is yielded, the thread waits while
+    `max_items` items are buffered, and the iterator is closed by the thread
+    running it once it is exhausted or stopped.
+    """
+
+    def __init__(self, iterator: Iterator, loop: asyncio.AbstractEventLoop, max_items: int = 256):
+        self.iterator = iterator
+        self.loop = loop
+        self.max_items = max_items
+        self._buffer = []  # type: List[InfoItem]
+        self._done = False
+        self._stopped = False
+        self._error = None  # type: Optional[Exception]
+        self._cond = threading.Condition()
+        self._ready = asyncio.Event()
+
+    def _notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # the loop is closed, the source is given up at the deadline
+
+    def run(self):
+        try:
+            for value in self.iterator:
+                batch = _as_batch(value)
+                with self._cond:
+                    while len(self._buffer) >= self.max_items and not self._stopped:
+                        self._cond.wait()
+                    if self._stopped:
+                        break
+                    self._buffer.extend(batch)
+                self._notify()
+        except Exception as e:
+            self._error = e
+        finally:
+            close = getattr(self.iterator, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self._done = True
+            self._notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    async def chunks(self) -> AsyncIterator[List["InfoItem"]]:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            with self._cond:
+                chunk, self._buffer = self._buffer, []
+                done = self._done
+                self._cond.notify_all()
+            if chunk:
+                yield chunk
+            if done:
+                if self._error is not None:
+                    raise self._error
+                return
+
+
+async def iter_source(
+    func: Callable[..., object],
+    executor: Optional[Executor] = None,
+    chunk_size: int = 256,
+    kwargs: Optional[dict] = None,
+) -> AsyncIterator[List["InfoItem"]]:
+    """
+    iterate the items of a source in batches, whatever its kind.
+
+    a coroutine function or a sync function returning a list gives a single
+    batch, an async generator is iterated in the event loop and a sync function
+    returning an iterator (e.g. a generator) is drained in the `executor` by an `_IteratorPump`.
+    """
+    kwargs = kwargs or {}
+    if inspect.isasyncgenfunction(func):
+        async for value in func(**kwargs):
+            yield _as_batch(value)
+        return
+    if inspect.iscoroutinefunction(func):
+        yield _as_batch(await func(**kwargs))
+        return
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(executor, functools.partial(func, **kwargs))
+    if isinstance(result, (list, tuple)):
+        yield list(result)
+        return
+    pump = _IteratorPump(iter(result), loop, chunk_size)
+    running = loop.run_in_executor(executor, pump.run)
+    try:
+        async for chunk in pump.chunks():
+            yield chunk
+    finally:
+        pump.stop()
+        if not running.done():
+            running.cancel()  # not started yet, e.g. at the deadline
+
+
+def run_pipeline(
+    fetch_funcs: Sequence[Callable[..., object]],
+    urls: Sequence[str],
+    keys: Sequence[str],
+    subjects: Sequence[str],
+    keep: Callable[[int, ItemTable], np.ndarray],
+    embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+    max_workers: int = 4,
+    per_host_limit: int = 4,
+    host_limits: Optional[Dict[str, int]] = None,
+    scheduler: Optional["RetryScheduler"] = None,
+    queue_size: int = 16,
+    batch_size: int = 256,
+    hosts: Optional[Sequence[str]] = None,
+) -> ItemTable:
+    """
+    fetch, filter and embed the items of all the sources in a stream.
+
+    :param fetch_funcs: the source functions without arguments, see `iter_source` for their kinds,
+        or lazy sources with a `resolve()` giving the function when the source is scheduled, see `infiv.spiders.LazySource`
+    :param urls: the url of each source, used to group the sources by host
+    :param keys: the key of each source, the `source` of its items
+    :param subjects: the subject of the items of each source
+    :param keep: the mask of the items to keep, given the index of the source and a table of its items
+    :param embed: the embedding matrix of a list of texts, None to not embed
+    :param max_workers: number of threads for the sync source functions
+    :param per_host_limit: max number of sources running against a same host
+    :param host_limits: per-host override of `per_host_limit`
+    :param scheduler: retry the sources with it, None to call each source once and let it raise
+    :param queue_size: max batches waiting in each queue
+    :param batch_size: max items of a batch, pulled from a generator or sent to the embedder at once
+    :param hosts: the host of each source, overriding the host of its url, see `infiv.spiders.SpiderSpec.host`
+    :return: the kept items in the order of the sources, embedded if `embed` is given
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    ## the embedder gets its own thread, a slow source never delays it
+    embed_executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        return asyncio.run(_run_pipeline_async(
+            fetch_funcs, urls, keys, subjects, keep, embed, executor, embed_executor,
+            per_host_limit, host_limits or {}, scheduler, queue_size, batch_size,
+            hosts or [get_host(url) for url in urls],
+        ))
+    finally:
+        ## a sync source given up at the deadline may still be running, do not wait for it
+        executor.shutdown(wait=False, cancel_futures=True)
+        embed_executor.shutdown(wait=True)
+
+
+async def _run_pipeline_async(
+    fetch_funcs: Sequence[Callable[..., object]],
+    urls: Sequence[str],
+    keys: Sequence[str],
+    subjects: Sequence[str],
+    keep: Callable[[int, ItemTable], np.ndarray],
+    embed: Optional[Callable[[List[str]], np.ndarray]],
+    executor: Executor,
+    embed_executor: Executor,
+    per_host_limit: int,
+    host_limits: Dict[str, int],
+    scheduler: Optional["RetryScheduler"],
+    queue_size: int,
+    batch_size: int,
+    hosts: Sequence[str],
+) -> ItemTable:
+    metrics = get_metrics()
+    loop = asyncio.get_running_loop()
+    batches = asyncio.Queue(maxsize=queue_size)  # type: asyncio.Queue[Optional[Tuple[int, List[InfoItem]]]]
+    tables = asyncio.Queue(maxsize=queue_size)  # type: asyncio.Queue[Optional[Tuple[int, ItemTable]]]
+    subject_categories, source_categories, tag_categories = Categories(), Categories(), Categories()
+    collected = []  # type: List[Tuple[int, ItemTable]]
+    semaphores = {}  # type: Dict[str, asyncio.Semaphore]
+    for host in hosts:
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(host_limits.get(host, per_host_limit))
+
+    def produce(index: int, func: Callable[..., object]):
+        @functools.wraps(func)
+        async def run(**kwargs) -> List["InfoItem"]:
+            n_sent = 0
+            try:
+                async for batch in iter_source(func, executor, batch_size, kwargs):
+                    await batches.put((index, batch))
+                    n_sent += len(batch)
+            except Exception as e:
+                if n_sent == 0:
+                    raise  # nothing is sent yet, the scheduler may retry it
+                ## a retry would send the same items again, keep them and mark the source as failed
+                logger.warning(f"{keys[index]} fails after {n_sent} items: {e!r}")
+                return failed_items(urls[index], repr(e))
+            return []
+
+        return run
+
+    async def fetch_one(index: int):
+        async with semaphores[hosts[index]]:
+            logger.debug(f"Start fetching {urls[index]}")
+            func = fetch_funcs[index]
+            if hasattr(func, "resolve"):
+                ## a lazy source, its module is imported only now and in a worker thread
+                try:
+                    func = await loop.run_in_executor(executor, func.resolve)
+                except Exception as e:
+                    if scheduler is None:
+                        raise
+                    logger.warning(f"{keys[index]} fails to load: {e!r}")
+                    await batches.put((index, failed_items(urls[index], repr(e))))
+                    return
+            run = produce(index, func)
+            if scheduler is not None:
+                run = scheduler.wrap(run, urls[index], keys[index], host=hosts[index])
+            ## the placeholder of a failed source
+            rest = await run()
+            if rest:
+                await batches.put((index, rest))
+            logger.debug(f"Finish fetching {urls[index]}")
+
+    async def fetch_all():
+        await asyncio.gather(*[fetch_one(index) for index in range(len(fetch_funcs))])
+        await batches.put(None)
+
+    async def filter_stage():
+        while True:
+            entry = await batches.get()
+            if entry is None:
+                break
+            index, batch = entry
+            with metrics.timer("infiv_stage_busy_seconds", stage="filter"):
+                metrics.inc("infiv_source_items", len(batch), source=keys[index], stage="fetched")
+                table = ItemTable.from_items(
+                    batch,
+                    subject=subjects[index],
+                    source=keys[index],
+                    subjects=subject_categories,
+                    sources=source_categories,
+                    tags=tag_categories,
+                )
+                table = table.filter(keep(index, table))
+            if len(table):
+                await tables.put((index, table))
+        await tables.put(None)
+
+    async def embed_stage():
+        done = False
+        while not done:
+            pending = [await tables.get()]
+            ## take all the waiting tables at once, up to a batch
+            while pending[-1] is not None and sum(len(table) for _, table in pending) < batch_size and not tables.empty():
+                pending.append(tables.get_nowait())
+            if pending[-1] is None:
+                done = True
+                pending.pop()
+            if not pending:
+                continue
+            if embed is not None:
+                with metrics.timer("infiv_stage_busy_seconds", stage="embed"):
+                    texts = [title for _, table in pending for title in table.title.tolist()]
+                    vectors = await loop.run_in_executor(embed_executor, embed, texts)
+                start = 0
+                for _, table in pending:
+                    table.embeddings = vectors[start:start + len(table)]
+                    start += len(table)
+            collected.extend(pending)
+
+    tasks = [
+        asyncio.ensure_future(fetch_all()),
+        asyncio.ensure_future(filter_stage()),
+        asyncio.ensure_future(embed_stage()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        ## a failed stage would block the others on a full queue
+        for task in tasks:
+            task.cancel()
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            raise result
+
+    ## back to the order of the sources, the batches of a source arrive in order
+    collected.sort(key=lambda entry: entry[0])
+    result = ItemTable.concat([table for _, table in collected]) if collected else ItemTable.empty(
+        subjects=subject_categories, sources=source_categories, tags=tag_categories
+    )
+    if embed is not None and result.embeddings is None:
+        result.embeddings = await loop.run_in_executor(embed_executor, embed, [])
+    return result
@@ -0,0 +1,49 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+def score_items(embeddings: np.ndarray, rerank_proj_embed: np.ndarray) -> np.ndarray:
+    """
+    the rerank score of all items in one matrix-vector product
+    """
+    return embeddings @ np.asarray(rerank_proj_embed, dtype=embeddings.dtype)
+
+
+def rank_items(
+    subjects: List[str],
+    scores: Optional[np.ndarray] = None,
+    top_k: Optional[int] = None,
+) -> np.ndarray:
+    """
+    group the items by subject (in alphabetical order) and sort each group by score.
+
+    :param subjects: the subject of each item
+    :param scores: the score of each item, None to keep the input order in a subject
+    :param top_k: keep at most `top_k` items per subject
+    :return: the item indices in the output order
+    """
+    subject_names, codes = np.unique(np.asarray(subjects, dtype=object), return_inverse=True)
+    n = len(subjects)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if top_k is None:
+        if scores is None:
+            order = np.argsort(codes, kind="stable")
+        else:
+            order = np.lexsort((-scores, codes))
+        return order
+
+    ## only the top_k of each subject are sorted, the rest are dropped by argpartition
+    orders = []
+    group_sorted = np.argsort(codes, kind="stable")
+    group_bounds = np.searchsorted(codes[group_sorted], np.arange(len(subject_names) + 1))
+    for start, end in zip(group_bounds[:-1], group_bounds[1:]):
+        indices = group_sorted[start:end]
+        if scores is not None:
+            if len(indices) > top_k:
+                indices = indices[np.argpartition(-scores[indices], top_k - 1)[:top_k]]
+            indices = indices[np.argsort(-scores[indices], kind="stable")]
+        orders.append(indices[:top_k])
+    return np.concatenate(orders)
@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    :param rate_per_minute: refill rate of the bucket
+    :param capacity: max tokens the bucket holds, default to one second worth of rate
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, n: float = 1.0):
+        """
+        block until `n` tokens are taken. Request more than the capacity is
+        allowed and just waits for the bucket to be full.
+        """
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    requests-per-minute and tokens-per-minute limits shared by all the
+    threads calling a same api.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+
+    def acquire(self, n_tokens: float = 0.0):
+        if self.request_bucket is not None:
+            self.request_bucket.acquire(1)
+        if self.token_bucket is not None and n_tokens > 0:
+            self.token_bucket.acquire(n_tokens)
+
+
+class HostBudget:
+    """
+    The politeness budget of a host, used as a context manager around each request:
+    at most `max_in_flight` requests at a time and at least `min_interval`
+    seconds between the starts of two requests.
+    """
+
+    def __init__(self, max_in_flight: int = 4, min_interval: float = 0.0):
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self) -> "HostBudget":
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+
+_host_budgets = {}  # type: Dict[str, HostBudget]
+_host_budgets_lock = threading.Lock()
+
+
+def get_host_budget(host: str, max_in_flight: int = 4, min_interval: float = 0.0) -> HostBudget:
+    """
+    the process-wide budget of `host`, the settings of the first call win
+    """
+    with _host_budgets_lock:
+        if host not in _host_budgets:
+            _host_budgets[host] = HostBudget(max_in_flight, min_interval)
+        return _host_budgets[host]
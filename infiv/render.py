@@ -0,0 +1,100 @@
+"""
+Render the digest markdown from a jinja2 template.
+
+The template is compiled once per process and its bytecode is cached on disk
+across runs. `template.generate` yields the output chunk by chunk while the
+subject groups are produced lazily, so the digest is streamed to the writable
+rather than joined into one string.
+"""
+import functools
+import itertools
+import os
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+if TYPE_CHECKING:
+    import jinja2
+
+    from infiv.types import InfoItem
+
+DEFAULT_TEMPLATE = "digest.md.j2"
+
+
+def md_links(links: List[Union[str, dict]]) -> str:
+    """
+    the links of an item as markdown, `[text](url)` separated by spaces
+    """
+    link_strs = []
+    for link in links:
+        if isinstance(link, str):
+            link_strs.append(f"[{link}]({link}); ")
+        elif isinstance(link, dict):
+            alt_text = next(iter(link.keys()))
+            link_strs.append(f"[{alt_text}]({link[alt_text]})")
+        else:
+            link_strs.append("")
+    return " ".join(link_strs)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(template_path: Optional[str] = None, bytecode_cache_dir: Optional[str] = "./.cache/jinja2") -> "jinja2.Template":
+    """
+    :param template_path: path of a custom template, None for the builtin one
+    :param bytecode_cache_dir: where to cache the compiled template between runs, None to disable
+    """
+    import jinja2
+
+    if template_path is None:
+        loader = jinja2.PackageLoader("infiv", "templates")
+        template_name = DEFAULT_TEMPLATE
+    else:
+        loader = jinja2.FileSystemLoader(os.path.dirname(os.path.abspath(template_path)))
+        template_name = os.path.basename(template_path)
+
+    bytecode_cache = None
+    if bytecode_cache_dir is not None:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+
+    env = jinja2.Environment(
+        loader=loader,
+        bytecode_cache=bytecode_cache,
+        autoescape=False,  # markdown
+        undefined=jinja2.StrictUndefined,
+    )
+    env.filters["md_links"] = md_links
+    return env.get_template(template_name)
+
+
+def group_by_subject(items: List["InfoItem"], order: Iterable[int]) -> Iterator[Tuple[str, Iterator["InfoItem"]]]:
+    """
+    lazily yield (subject, items) of the items in `order`, which is already grouped by subject
+    """
+    ordered_items = (items[index] for index in order)
+    for subject, group in itertools.groupby(ordered_items, key=lambda item: item["subject"]):
+        yield subject, group
+
+
+def render_digest(
+    items: List["InfoItem"],
+    order: Iterable[int],
+    out: TextIO,
+    n: Optional[int] = None,
+    template_path: Optional[str] = None,
+    bytecode_cache_dir: Optional[str] = "./.cache/jinja2",
+    generated_at: Optional[datetime] = None,
+):
+    """
+    stream the digest of the `items` in `order` to the writable `out`.
+
+    :param n: the number of items shown in the header, default to the length of `order`
+    """
+    order = list(order)
+    template = get_template(template_path, bytecode_cache_dir)
+    stream = template.generate(
+        generated_at=generated_at or datetime.now(),
+        n=len(order) if n is None else n,
+        groups=group_by_subject(items, order),
+    )
+    for chunk in stream:
+        out.write(chunk)
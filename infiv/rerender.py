@@ -0,0 +1,92 @@
+"""
+Re-render the digests of the past builds from the item archive, without network.
+
+Each archived build of the date range is ranked again with the `rerank` config
+and rendered with the `render` config, as `{output_dir}/{date}-{time}.md`.
+With `--rerank` the scores are computed again from the archived embeddings,
+e.g. after changing the likes and dislikes, with the embeddings of the likes and
+dislikes read from the embedding cache; all the builds must be embedded by the
+configured embedder. Otherwise the archived scores are kept.
+"""
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def main(args):
+    import numpy as np
+    import yaml
+
+    from infiv.archive.items import ItemArchive
+    from infiv.rank import rank_items, score_items
+    from infiv.render import render_digest
+
+    src_config = getattr(args, "src_config", "./configs/source.yaml")
+    with open(src_config, "r") as f:
+        src_config_data = yaml.load(f, Loader=yaml.FullLoader)
+    archive_path = src_config_data.get("archive", {}).get("path", "./.cache/archive")
+    rerank_dicts = src_config_data.get("rerank", {}) or {}  # type: dict
+    render_config = src_config_data.get("render", {})  # type: dict
+
+    parts = ItemArchive(os.path.join(archive_path, "items")).parts(args.since, args.until)
+    if not parts:
+        logger.error(f"No archived build in {archive_path} from {args.since} until {args.until}")
+        sys.exit(1)
+
+    rerank_proj_embed = None
+    if args.rerank:
+        from infiv.build import get_rerank_projection, load_embedder, load_embedding_cache
+
+        embedder = load_embedder(src_config_data)
+        ## the scores are only computed again from the embeddings of the same model
+        mismatched = [part for part in parts if part.model != embedder.model]
+        if mismatched:
+            logger.error(
+                f"Cannot rerank {len(mismatched)} archived builds not embedded by {embedder.model}, "
+                f"e.g. {mismatched[0].path} embedded by {mismatched[0].model}; "
+                f"rerender them without --rerank or with their embedder"
+            )
+            sys.exit(1)
+        ## the likes and dislikes are usually in the embedding cache, no request is needed
+        embedding_cache = load_embedding_cache(src_config_data, embedder)
+        try:
+            rerank_proj_embed = get_rerank_projection(rerank_dicts, embedder, embedding_cache)
+        finally:
+            if embedding_cache is not None:
+                embedding_cache.close()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    for part in parts:
+        table = part.table()
+        if rerank_proj_embed is not None:
+            table.score = score_items(table.embeddings, rerank_proj_embed)
+        scores = None if np.isnan(table.score).all() else table.score
+        order = rank_items(table.subject_names(), scores, rerank_dicts.get("top_k"))
+
+        output = os.path.join(args.output_dir, f"{part.built_at:%Y-%m-%d}-{os.path.basename(part.path)}.md")
+        with open(output, "wt") as f:
+            render_digest(
+                table,
+                order,
+                f,
+                template_path=render_config.get("template"),
+                bytecode_cache_dir=render_config.get("bytecode_cache_dir", "./.cache/jinja2"),
+                generated_at=part.built_at,
+            )
+        logger.debug(f"Dump {len(order)} items at {output}")
+    logger.info(f"Re-render {len(parts)} digests in {args.output_dir} in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src_config", type=str, default="./configs/source.yaml")
+    parser.add_argument("--since", type=str, default=None)
+    parser.add_argument("--until", type=str, default=None)
+    parser.add_argument("--output_dir", type=str, default="./digests")
+    parser.add_argument("--rerank", action="store_true", default=False)
+    main(parser.parse_args())
@@ -0,0 +1,230 @@
+"""
+The retry scheduler of the sources.
+
+Every attempt of a source runs as a task of the event loop of `infiv.pipeline`:
+a sync source occupies a worker thread only while it is actually fetching, the
+backoff between the attempts is an `asyncio.sleep` and the signature of the
+source is inspected once. All the attempts are bounded by the build deadline
+and by the budget of the source, and the failures of the sources of a same
+host trip its circuit breaker, so the other sources of a dead host fail fast
+instead of waiting for their own timeouts.
+"""
+import asyncio
+import inspect
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+
+from infiv.metrics import get_metrics
+from infiv.utils import get_host
+
+if TYPE_CHECKING:
+    from infiv.types import InfoItem
+
+logger = logging.getLogger(__name__)
+
+FETCH_FAILED_TAG = "fetch failed"
+
+
+def failed_items(url: str, reason: str) -> List["InfoItem"]:
+    """
+    the placeholder of a failed source, tagged so that it keeps its state for the next build
+    """
+    return [
+        {
+            "title": url or "bad url",
+            "content": f"fail to fetch ({reason}), please visited the url manually.",
+            "links": [{"source": url}],
+            "pub_datetime": datetime.now(),
+            "tags": [FETCH_FAILED_TAG],
+        }
+    ]
+
+
+def backoff_delay(
+    attempt: int, base_delay: float, factor: float = 2, max_delay: float = 120, jitter: bool = True,
+) -> float:
+    """
+    the exponential backoff after the failed `attempt` (from 1), capped by `max_delay`,
+    with up to one second of random jitter so the retries of concurrent calls spread out
+    """
+    delay = min(max_delay, base_delay * factor ** (attempt - 1))
+    if jitter:
+        delay += random.uniform(0, 1)
+    return delay
+
+
+class CircuitBreaker:
+    """
+    The breaker of a host.
+
+    It opens after `failure_threshold` consecutive failed attempts, then every
+    attempt fails fast until `reset_timeout` seconds later, when a single trial
+    attempt is let through (half open): its success closes the breaker and its
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None  # type: Optional[float]
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class RetryScheduler:
+    """
+    Retry the sources with exponential backoff under a build deadline.
+
+    :param max_retries: max attempts of a source
+    :param base_delay: backoff after the first failed attempt in seconds, also the timeout of the first attempt of the sources taking a `timeout`
+    :param factor: growth of the backoff
+    :param jitter: add up to one second of random jitter to the backoff
+    :param max_delay: cap of the backoff
+    :param deadline: seconds from the start of the scheduler after which every source gives up, None for no deadline
+    :param source_budget: max seconds of a single source, None for no limit
+    :param failure_threshold: consecutive failures of a host opening its circuit breaker
+    :param reset_timeout: seconds before an open breaker lets a trial attempt through
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 10,
+        factor: float = 2,
+        jitter: bool = True,
+        max_delay: float = 120,
+        deadline: Optional[float] = None,
+        source_budget: Optional[float] = None,
+        failure_threshold: int = 3,
+        reset_timeout: float = 300,
+    ):
+        self.max_retries = max(1, max_retries)
+        self.base_delay = base_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.max_delay = max_delay
+        self.source_budget = source_budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.deadline = time.monotonic() + deadline if deadline is not None else None
+        self._breakers = {}  # type: Dict[str, CircuitBreaker]
+        self._lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def remaining(self) -> Optional[float]:
+        """
+        :return: seconds before the build deadline, None for no deadline
+        """
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def backoff(self, attempt: int) -> float:
+        return backoff_delay(attempt, self.base_delay, self.factor, self.max_delay, self.jitter)
+
+    def wrap(
+        self,
+        func: Callable[..., Awaitable[List["InfoItem"]]],
+        url: str = "",
+        source: Optional[str] = None,
+        host: Optional[str] = None,
+    ) -> Callable[[], Awaitable[List["InfoItem"]]]:
+        """
+        :param func: the coroutine function of the source, e.g. the producer of `infiv.pipeline.run_pipeline`
+        :param url: the url of the source
+        :param source: the label of the source in the metrics, default to the function name
+        :param host: the host selecting the circuit breaker, default to the host of `url`
+        :return: the coroutine function running the attempts, it never raises but returns the failed items
+        """
+        source = source or getattr(func, "__name__", repr(func))
+        ## the timeout of the sources taking one grows with the backoff instead of sleeping
+        timeout_param = inspect.signature(func).parameters.get("timeout")
+        bind_timeout = timeout_param is not None and timeout_param.default is None
+        host = host or get_host(url)
+        breaker = self.breaker(host)
+
+        async def run() -> List["InfoItem"]:
+            metrics = get_metrics()
+            start = time.monotonic()
+            source_deadline = start + self.source_budget if self.source_budget is not None else None
+            if self.deadline is not None:
+                source_deadline = self.deadline if source_deadline is None else min(source_deadline, self.deadline)
+            reason = "unknown"
+            try:
+                for attempt in range(1, self.max_retries + 1):
+                    remaining = source_deadline - time.monotonic() if source_deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        reason = "deadline exceeded"
+                        break
+                    if not breaker.allow():
+                        reason = f"circuit open for {host}"
+                        break
+                    if attempt > 1:
+                        metrics.inc("infiv_source_retries_total", source=source)
+
+                    delay = self.backoff(attempt)
+                    try:
+                        if bind_timeout:
+                            attempt_timeout = delay if remaining is None else min(delay, remaining)
+                            call = func(timeout=attempt_timeout)
+                        else:
+                            call = func()
+                        result = await asyncio.wait_for(call, remaining)
+                    except Exception as e:
+                        breaker.record_failure()
+                        reason = "deadline exceeded" if isinstance(e, asyncio.TimeoutError) else repr(e)
+                        logger.info(f"{source} fails in the try {attempt}/{self.max_retries}: {reason}")
+                        if attempt == self.max_retries:
+                            break
+                        if not bind_timeout:
+                            ## wait in the event loop, the worker thread is free for the other sources
+                            if remaining is not None:
+                                delay = min(delay, max(0.0, source_deadline - time.monotonic()))
+                            await asyncio.sleep(delay)
+                    else:
+                        breaker.record_success()
+                        return result
+
+                metrics.inc("infiv_source_failures_total", source=source)
+                logger.warning(f"{source} fails: {reason}")
+                return failed_items(url, reason)
+            finally:
+                metrics.inc("infiv_source_seconds", time.monotonic() - start, source=source)
+
+        run.__name__ = getattr(func, "__name__", "run")
+        return run
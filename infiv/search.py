@@ -0,0 +1,66 @@
+"""
+Search the items of the past builds in the archive.
+
+A keyword query is answered by the inverted index alone. A semantic query is
+embedded by the embedder of the source config, which must be the model the
+vectors of the archive come from.
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+from infiv.archive.index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+
+def main(args):
+    import yaml
+
+    src_config = getattr(args, "src_config", "./configs/source.yaml")
+    with open(src_config, "r") as f:
+        src_config_data = yaml.load(f, Loader=yaml.FullLoader)
+    archive_config = src_config_data.get("archive", {})  # type: dict
+    path = archive_config.get("path", "./.cache/archive")
+    if not os.path.exists(os.path.join(path, "index.sqlite")):
+        logger.error(f"No search index at {path}, it is written by `python -m infiv build`")
+        sys.exit(1)
+
+    search_index = SearchIndex(path)
+    filters = {"since": args.since, "until": args.until, "subject": args.subject}
+    start = time.perf_counter()
+    if args.semantic:
+        from infiv.build import load_embedder
+
+        embedder = load_embedder(src_config_data)
+        if search_index.model != embedder.model:
+            logger.error(f"The vectors of {path} are from {search_index.model}, not from the embedder {embedder.model}")
+            sys.exit(1)
+        results = search_index.search_vectors(embedder.embed([args.query])[0], args.top_k, **filters)
+    else:
+        results = search_index.search_keywords(args.query, args.top_k, **filters)
+    logger.info(f"{len(results)} results out of {len(search_index)} items in {(time.perf_counter() - start) * 1000:.1f} ms")
+    search_index.close()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    for rank, result in enumerate(results, start=1):
+        print(f"{rank:>3}. {result['title']}  [{result['score']:.3f}]")
+        print(f"     {result['pub_datetime'][:10]} | {result['subject']} | {result['url'] or result['source']}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", type=str)
+    parser.add_argument("--src_config", type=str, default="./configs/source.yaml")
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--semantic", action="store_true", default=False)
+    parser.add_argument("--since", type=str, default=None)
+    parser.add_argument("--until", type=str, default=None)
+    parser.add_argument("--subject", type=str, default=None)
+    parser.add_argument("--json", action="store_true", default=False)
+    main(parser.parse_args())
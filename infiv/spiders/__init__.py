@@ -1 +1,194 @@
+"""
+The registry of the source functions.
 
+A source config names its function by the full path, e.g.
+`infiv.spiders.arxiv.iter_info`, or by the name a third-party package
+registers it under in the `infiv.spiders` entry point group. The spiders of
+this package are listed in `SPIDERS` with the environment variables and the
+optional packages they need.
+
+A config is resolved and validated without importing any spider module: the
+signature of a source function is read from the source code of its module
+with `ast`. The module itself is only imported when its source is scheduled,
+by `LazySource.resolve`.
+"""
+import ast
+import functools
+import importlib
+import importlib.util
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "infiv.spiders"
+
+
+class SpiderSpec:
+    """
+    A source function known by its path, not imported yet.
+
+    :param path: full path of the function, `package.module.function`
+    :param env: environment variables it needs, e.g. a login cookie
+    :param requires: top level modules it needs, e.g. the optional `feedparser`
+    :param host: the host it actually requests, when the url of its sources does not name it,
+        e.g. `export.arxiv.org` for a category like `cs.CV`; None for the host of the url
+    """
+
+    def __init__(
+        self, path: str, env: Sequence[str] = (), requires: Sequence[str] = (), host: Optional[str] = None,
+    ):
+        self.path = path
+        self.module, _, self.name = path.rpartition(".")
+        self.env = tuple(env)
+        self.requires = tuple(requires)
+        self.host = host
+
+    def __repr__(self) -> str:
+        return f"SpiderSpec({self.path!r})"
+
+    def load(self) -> Callable:
+        module = importlib.import_module(self.module)
+        return getattr(module, self.name)
+
+    def parameters(self) -> Optional[Tuple[List[str], List[str], bool]]:
+        """
+        the signature of the function read from its source code
+
+        :return: (required parameters, optional parameters, whether it takes `**kwargs`),
+            None if the function is not defined by a top level `def` of a python file, e.g. built by a decorator
+        """
+        spec = importlib.util.find_spec(self.module)
+        if spec is None or not spec.origin or not spec.origin.endswith(".py"):
+            return None
+        node = _module_functions(spec.origin).get(self.name)
+        if node is None:
+            return None
+
+        args = node.args
+        positional = args.posonlyargs + args.args
+        n_required = len(positional) - len(args.defaults)
+        required = [arg.arg for arg in positional[:n_required]]
+        optional = [arg.arg for arg in positional[n_required:]]
+        for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+            (required if default is None else optional).append(arg.arg)
+        return required, optional, args.kwarg is not None
+
+    def validate(self, kwargs: Dict[str, object]) -> List[str]:
+        """
+        check a source config against the function, as `infiv.build.bind_params` binds it
+
+        :param kwargs: the config of the source, with its url
+        :return: the errors, empty if the source can run
+        """
+        errors = [f"{self.path} needs {var} in env" for var in self.env if var not in os.environ]
+        errors += [
+            f"{self.path} needs the package {module}, please install it"
+            for module in self.requires
+            if importlib.util.find_spec(module) is None
+        ]
+        try:
+            parameters = self.parameters()
+        except (ImportError, ValueError) as e:
+            return errors + [f"cannot find the module of {self.path}: {e!r}"]
+        if parameters is None:
+            if importlib.util.find_spec(self.module) is None:
+                errors.append(f"cannot find the module of {self.path}")
+            else:
+                logger.debug(f"Signature of {self.path} is unknown, it is checked when the source is scheduled")
+            return errors
+
+        required, optional, var_kwargs = parameters
+        missing = [param for param in required if param not in kwargs]
+        if missing:
+            errors.append(f"Missing required arguments: {', '.join(missing)} for func {self.path}")
+        unused = set(kwargs) - set(required) - set(optional)
+        if unused and not var_kwargs:
+            for param in sorted(unused):
+                logger.warning(f"Unused kwargs: {param} in func {self.path}")
+        return errors
+
+
+@functools.lru_cache(maxsize=None)
+def _module_functions(path: str) -> Dict[str, ast.AST]:
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    return {
+        node.name: node
+        for node in tree.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+
+
+## the spiders of this package
+SPIDERS = {
+    spec.path: spec
+    for spec in [
+        SpiderSpec("infiv.spiders.arxiv.get_info", host="export.arxiv.org"),
+        SpiderSpec("infiv.spiders.arxiv.iter_info", host="export.arxiv.org"),
+        SpiderSpec("infiv.spiders.bioxriv.get_info"),
+        SpiderSpec("infiv.spiders.bioxriv.iter_info"),
+        SpiderSpec("infiv.spiders.zhihu.get_info", env=("ZHIHU_COOKIE",)),
+        SpiderSpec("infiv.spiders.bilibili.get_info", env=("BILIBILI_COOKIE",)),
+        SpiderSpec("infiv.spiders.rsshub.default.get_info", requires=("feedparser",)),
+        SpiderSpec("infiv.spiders.rsshub.cool_paper_arxiv.get_info", requires=("feedparser",)),
+    ]
+}  # type: Dict[str, SpiderSpec]
+
+
+def get_spider(func: str) -> SpiderSpec:
+    """
+    :param func: the `func` of a source config, a full path or the name of an entry point
+    """
+    if func in SPIDERS:
+        return SPIDERS[func]
+    if "." in func:
+        return SpiderSpec(func)
+
+    ## a plain name is looked up in the installed packages, only then
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name == func:
+            return SpiderSpec(f"{entry_point.module}.{entry_point.attr}")
+    raise KeyError(f"unknown spider {func}, neither a full path nor an entry point of {ENTRY_POINT_GROUP}")
+
+
+def validate_sources(sources: Sequence[dict]) -> List[str]:
+    """
+    :param sources: the `sources` of a config
+    :return: the errors of all the sources, each prefixed by the index of its source
+    """
+    errors = []
+    for index, source in enumerate(sources):
+        if "func" not in source:
+            errors.append(f"sources[{index}]: missing func")
+            continue
+        try:
+            spec = get_spider(source["func"])
+        except KeyError as e:
+            errors.append(f"sources[{index}]: {e.args[0]}")
+            continue
+        kwargs = {"url": source.get("url", ""), **source.get("kwargs", {})}
+        errors += [f"sources[{index}]: {error}" for error in spec.validate(kwargs)]
+    return errors
+
+
+class LazySource:
+    """
+    A source whose function is imported and bound when the source is scheduled.
+
+    :param spec: the source function
+    :param bind: bind the config of the source to the loaded function, e.g. a partial of `infiv.build.bind_params`
+    """
+
+    def __init__(self, spec: SpiderSpec, bind: Callable[[Callable], Callable]):
+        self.spec = spec
+        self.bind = bind
+
+    def __repr__(self) -> str:
+        return f"LazySource({self.spec.path!r})"
+
+    def resolve(self) -> Callable:
+        return self.bind(self.spec.load())
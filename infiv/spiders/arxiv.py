@@ -1,28 +1,36 @@
-import os
-import random
-import time
-from datetime import datetime
-from typing import TYPE_CHECKING, List
+import io
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Iterator, List, Optional
 
-import feedparser
-import requests
-
-from infiv.utils import strcut_time_to_datetime
+from infiv.http import get_client
+from infiv.ratelimit import TokenBucket
+from infiv.state import env_expired_datetime, item_id
 
 if TYPE_CHECKING:
-    from infiv.types import InfoItem, RSSFeedDict
-
-expired_datetime = os.environ.get("EXPIRED_DAYTIME", None)
-if expired_datetime is not None:
-    try:
-        expired_datetime = datetime.strptime(expired_datetime, r"%Y/%m/%d")
-    except ValueError:
-        expired_datetime = datetime.strptime(expired_datetime, r"%Y/%m/%d %H:%M")
-
-def _convert_entry_to_info_item(entry: List["RSSFeedDict"]) -> "InfoItem":
-    title = entry["title"].replace("\n", " ")
-    abstract = entry["summary"]
-    link = entry["link"]
+    from infiv.http import HttpClient
+    from infiv.state import SourceState
+    from infiv.types import InfoItem
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+## arxiv asks for no more than 1 request every 3 seconds, shared by all the arxiv sources
+## the host of the API, the breaker and the concurrency limit of the arxiv sources are keyed by it, see `infiv.spiders.SPIDERS`
+API_HOST = "export.arxiv.org"
+API_MIN_INTERVAL = 3.0
+_api_bucket = TokenBucket(rate_per_minute=60 / API_MIN_INTERVAL, capacity=1)
+
+
+def _convert_entry_to_info_item(entry: ET.Element) -> "InfoItem":
+    title = entry.findtext(f"{ATOM}title", "").strip().replace("\n", " ")
+    abstract = entry.findtext(f"{ATOM}summary", "").strip()
+    link = entry.findtext(f"{ATOM}id", "")
+    for link_element in entry.iterfind(f"{ATOM}link"):
+        if link_element.get("rel") == "alternate":
+            link = link_element.get("href", link)
+            break
     arxiv_number = link.split("/")[-1]
     abs_link = f"https://arxiv.org/abs/{arxiv_number}"
     html_link = f"https://arxiv.org/html/{arxiv_number}"
@@ -37,43 +45,96 @@ def _convert_entry_to_info_item(entry: List["RSSFeedDict"]) -> "InfoItem":
             {"pdf": pdf_link},
             {"kimi": kimi_link},
         ],
-        "pub_datetime": strcut_time_to_datetime(entry["published_parsed"]),
+        "pub_datetime": datetime.strptime(entry.findtext(f"{ATOM}published"), r"%Y-%m-%dT%H:%M:%SZ"),
         "tags": []
     }  # type: InfoItem
 
     return result
 
 
-def get_info(url: str, timeout: float=60.0) -> List["InfoItem"]:
+def _fetch_page(client: "HttpClient", url: str, timeout: float) -> bytes:
+    _api_bucket.acquire()
+    resp = client.get(url, timeout=timeout)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Failed to fetch arxiv api; {resp.status_code}, {resp.content=}")
+    return resp.content
+
+
+def iter_info(
+    url: str,
+    timeout: float=60.0,
+    client: Optional["HttpClient"] = None,
+    state: Optional["SourceState"] = None,
+    num_items_per_query: int = 1000,
+) -> Iterator["InfoItem"]:
+    """
+    yield the new items of an arxiv category page by page.
+
+    Each page is parsed incrementally with `iterparse` and its entries are freed
+    once converted. As soon as the header of a page tells there are more
+    results, the next page is requested in the background under the api rate
+    limit, so the download of a page overlaps the parsing of the previous one.
+    """
+    client = client or get_client()
     if "/" in url:
         # formatter like
         # https://arxiv.org/list/cs.CV/recent?skip=87&show=50
         cat = url.split("/")[4]
     else:
         cat = url
-    num_items_per_query = 1000
-    responses = []
+    expired_datetime = state.since if state is not None else env_expired_datetime()
+    if expired_datetime is None:
+        expired_datetime = datetime.now() - timedelta(days=1)
     now_datetime = datetime.now()
 
     ## YYYYMMDDTTTT
     expired_datetime_str = expired_datetime.strftime(r"%Y%m%d%H%M")
     now_datetime_str = now_datetime.strftime(r"%Y%m%d%H%M")
 
-    for i in range(0, 1000):  # has a upper limit
-        start = i * num_items_per_query
-        url = f'http://export.arxiv.org/api/query?search_query=cat:{cat}+AND+submittedDate:[{expired_datetime_str}+TO+{now_datetime_str}]&sortBy=lastUpdatedDate&sortOrder=descending&start={start}&max_results={num_items_per_query}'
+    def page_url(start: int) -> str:
+        return f'http://{API_HOST}/api/query?search_query=cat:{cat}+AND+submittedDate:[{expired_datetime_str}+TO+{now_datetime_str}]&sortBy=lastUpdatedDate&sortOrder=descending&start={start}&max_results={num_items_per_query}'
 
-        data = requests.get(url, timeout=timeout).content.decode('utf-8')
-        data = feedparser.parse(data)
-        if len(data['entries']) == 0:
-            break
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_page = prefetcher.submit(_fetch_page, client, page_url(0), timeout)  # type: Optional[Future]
+        for i in range(0, 1000):  # has a upper limit
+            if next_page is None:
+                break
+            start = i * num_items_per_query
+            page_content = next_page.result()
+            next_page = None
+
+            n_entries = 0
+            n_new = 0
+            for _, element in ET.iterparse(io.BytesIO(page_content), events=("end",)):
+                if element.tag == f"{OPENSEARCH}totalResults":
+                    if start + num_items_per_query < int(element.text or 0):
+                        next_page = prefetcher.submit(
+                            _fetch_page, client, page_url(start + num_items_per_query), timeout
+                        )
+                elif element.tag == f"{ATOM}entry":
+                    n_entries += 1
+                    item = _convert_entry_to_info_item(element)
+                    element.clear()
+                    if state is not None and state.is_seen(item_id(item)):
+                        continue
+                    n_new += 1
+                    yield item
+            del page_content
+
+            if n_entries == 0 or n_new == 0:
+                ## empty page, or the whole page is delivered in the previous builds and so are the older pages
+                if next_page is not None:
+                    next_page.cancel()
+                break
 
-        responses.extend(data['entries'])
 
-        time.sleep(random.random() * 10 + 1)
-    
-    info_items = [_convert_entry_to_info_item(entry) for entry in responses]
-    return info_items
+def get_info(
+    url: str,
+    timeout: float=60.0,
+    client: Optional["HttpClient"] = None,
+    state: Optional["SourceState"] = None,
+) -> List["InfoItem"]:
+    return list(iter_info(url, timeout, client, state))
 
 
 if __name__ == '__main__':
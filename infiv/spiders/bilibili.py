@@ -1,33 +1,58 @@
 import os
-import random
-import time
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import TYPE_CHECKING, List
-
-import bs4
-import requests
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
+from infiv.cache import DiskCache
+from infiv.http import get_client
+from infiv.parsing import parse_html, run_parser
+from infiv.ratelimit import get_host_budget
 from infiv.utils import html_to_info_item_markdown
 
 if TYPE_CHECKING:
+    from infiv.http import HttpClient
+    from infiv.state import SourceState
     from infiv.types import InfoItem
 
 
-assert "BILIBILI_COOKIE" in os.environ, "This function needs BILIBILI_COOKIE to get the info, please login BILIBILI web and f12 -> console -> type `document.cookie` to get the login infomation"
 headers = {
     'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36',
     'Sec-Ch-Ua-Platform': "Linux",
     'Sec-Ch-Ua-Mobile': "?0",
-    'Cookie': os.environ["BILIBILI_COOKIE"],
     'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8,zh-TW;q=0.7,ja;q=0.6,ak;q=0.5'
 }
 
-def get_page(url: str, single_page_timeout: float=10.) -> "InfoItem":
-    resp = requests.get(url, headers=headers, timeout=single_page_timeout)
-    if resp.status_code != 200:
-        raise RuntimeError("cannot fetch bilibili page, please check your cookie")
-    soup = bs4.BeautifulSoup(resp.content, "html.parser")
-    
+
+def get_headers() -> Dict[str, str]:
+    """
+    the request headers with the login cookie, checked when the spider runs instead of at import
+    """
+    assert "BILIBILI_COOKIE" in os.environ, "This function needs BILIBILI_COOKIE to get the info, please login BILIBILI web and f12 -> console -> type `document.cookie` to get the login infomation"
+    return {**headers, "Cookie": os.environ["BILIBILI_COOKIE"]}
+
+## the only subtrees built from the pages
+PAGE_PARSE_ONLY = ("h1.video-title", "a.up-name", "div.pubdate-ip-text", "span.desc-info-text")
+LISTING_PARSE_ONLY = ("h3.bili-video-card__info--tit",)
+
+VIDEO_URL_PREFIX = "https://www.bilibili.com/video/"
+BILIBILI_HOST = "www.bilibili.com"
+_bvid_pattern = re.compile(r"/video/(BV[0-9A-Za-z]+)")
+
+
+def video_url_of(bvid: str) -> str:
+    """
+    the canonical url of a video, the id of its item whatever url it is recommended under
+    """
+    return f"{VIDEO_URL_PREFIX}{bvid}"
+
+
+def parse_page(content: bytes) -> dict:
+    """
+    the title and the summary of a video page
+    """
+    soup = parse_html(content, PAGE_PARSE_ONLY)
+
     title = soup.select_one("h1.video-title").text.strip()
     author = soup.select_one('a[class~="up-name"]').text.strip()
     pub_datetime = soup.select_one('div.pubdate-ip-text').text.strip()
@@ -35,42 +60,118 @@ def get_page(url: str, single_page_timeout: float=10.) -> "InfoItem":
     desc = html_to_info_item_markdown(desc.prettify()) if desc is not None else ""
 
     summary = f"{author} post at {pub_datetime}\n\n {desc}"
+    return {"title": title, "content": summary}
+
+
+def get_page(
+    url: str,
+    single_page_timeout: float=10.,
+    client: Optional["HttpClient"] = None,
+    cache: Optional[DiskCache] = None,
+) -> "InfoItem":
+    """
+    :param cache: the parsed pages of the previous runs, the title and description of a video never change
+    """
+    match = _bvid_pattern.search(url)
+    cache_key = match.group(1) if match else url
+    ## e.g. without the query string, so the delivered video is known under any url
+    item_url = video_url_of(match.group(1)) if match else url
+    parsed = cache.get(cache_key) if cache is not None else None
+    if parsed is None:
+        client = client or get_client()
+        with get_host_budget(BILIBILI_HOST):
+            resp = client.get(url, headers=get_headers(), timeout=single_page_timeout)
+        if resp.status_code != 200:
+            raise RuntimeError("cannot fetch bilibili page, please check your cookie")
+        parsed = run_parser(parse_page, resp.content)
+        if cache is not None:
+            cache.set(cache_key, parsed)
 
     return {
-        "title": title,
-        "content": summary,
+        "title": parsed["title"],
+        "content": parsed["content"],
         "pub_datetime": datetime.now(),  # refresh every time to avoid filtering
         "tags": [],
-        "links": [{"bilibili": url}]
+        "links": [{"bilibili": item_url}]
     }
-    
 
-def get_info(url: str, single_page_timeout: float=10., max_items: int = 10) -> List["InfoItem"]:
-    all_recommands = []  # type: List[bs4.Tag]
-    while len(all_recommands) < max_items:
-        resp = requests.get(url, headers=headers, timeout=single_page_timeout)
+
+def parse_listing(content: bytes) -> List[Tuple[str, str]]:
+    """
+    :return: the (video id, url) of the videos recommended on the home page, in order
+    """
+    soup = parse_html(content, LISTING_PARSE_ONLY)
+    videos = []
+    for item in soup.select('h3.bili-video-card__info--tit'):
+        link = item.select_one("a")
+        video_url = link.attrs.get('href', '') if link is not None else ''
+        ## filter out video skip adv
+        match = _bvid_pattern.search(video_url)
+        if not video_url.startswith(VIDEO_URL_PREFIX) or match is None:
+            continue
+        videos.append((match.group(1), video_url))
+    return videos
+
+
+def collect_recommands(
+    url: str,
+    single_page_timeout: float=10.,
+    max_items: int = 10,
+    client: Optional["HttpClient"] = None,
+    state: Optional["SourceState"] = None,
+    max_listing_requests: int = 10,
+) -> List[str]:
+    """
+    refresh the home page until `max_items` distinct videos are recommended.
+
+    :return: the video urls, deduplicated by the video id and without the delivered ones
+    """
+    client = client or get_client()
+    video_urls = {}  # type: Dict[str, str]  # bvid -> url, in the recommended order
+    for _ in range(max_listing_requests):
+        if len(video_urls) >= max_items:
+            break
+        with get_host_budget(BILIBILI_HOST):
+            resp = client.get(url, headers=get_headers(), timeout=single_page_timeout)
         if resp.status_code != 200:
             raise RuntimeError("cannot fetch bilibili page, please check your cookie")
-        soup = bs4.BeautifulSoup(resp.content, "html.parser")
-        recommand_items = soup.select('h3.bili-video-card__info--tit')
-        ## filter out video skip adv
-        video_urls = [item.select_one("a").attrs['href'] for item in recommand_items]
-        recommand_items = [
-            item for item, video_url in zip(recommand_items, video_urls)
-            if video_url.startswith("https://www.bilibili.com/video/")
-        ]
-        all_recommands += recommand_items
-        time.sleep(random.uniform(0.5, 1.5))
-    all_recommands = all_recommands[:max_items]
-
-    video_urls = [item.select_one("a").attrs['href'] for item in all_recommands]
-    
-    results = []
-    for video_url in video_urls:
-        results.append(get_page(video_url)) 
-        time.sleep(random.uniform(0.5, 1.5))
-    return results
+        for bvid, video_url in run_parser(parse_listing, resp.content):
+            ## the full url is the id of the videos delivered before the canonical urls
+            if state is not None and (state.is_seen(video_url_of(bvid)) or state.is_seen(video_url)):
+                continue
+            video_urls.setdefault(bvid, video_url)
+    return list(video_urls.values())[:max_items]
+
+
+def get_info(
+    url: str,
+    single_page_timeout: float=10.,
+    max_items: int = 10,
+    client: Optional["HttpClient"] = None,
+    state: Optional["SourceState"] = None,
+    max_in_flight: int = 4,
+    min_interval: float = 0.5,
+    cache_path: Optional[str] = "./.cache/bilibili.sqlite",
+) -> List["InfoItem"]:
+    """
+    :param max_in_flight: max concurrent requests to bilibili
+    :param min_interval: min seconds between the starts of two requests to bilibili
+    :param cache_path: the sqlite file caching the parsed video pages across runs, None to disable
+    """
+    client = client or get_client()
+    get_host_budget(BILIBILI_HOST, max_in_flight, min_interval)  # the first settings win
+    video_urls = collect_recommands(url, single_page_timeout, max_items, client, state)
+
+    cache = DiskCache(cache_path) if cache_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            return list(executor.map(
+                lambda video_url: get_page(video_url, single_page_timeout, client, cache),
+                video_urls,
+            ))
+    finally:
+        if cache is not None:
+            cache.close()
 
 if __name__ == '__main__':
     print(get_info("https://www.bilibili.com/"))        
-
@@ -1,36 +1,35 @@
-import random
-import os
 import re
-import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import TYPE_CHECKING, List, Optional
-
-import requests
-from bs4 import BeautifulSoup
+from typing import TYPE_CHECKING, Iterator, List, Optional
 
+from infiv.http import get_client
+from infiv.parsing import parse_html, run_parser
+from infiv.ratelimit import get_host_budget
+from infiv.state import env_expired_datetime
 from infiv.utils import html_to_info_item_markdown
 
 if TYPE_CHECKING:
+    from infiv.http import HttpClient
+    from infiv.state import SourceState
     from infiv.types import InfoItem
 
+BIORXIV_HOST = "www.biorxiv.org"
 
-expired_datetime = os.environ.get("EXPIRED_DAYTIME", None)
-if expired_datetime is not None:
-    try:
-        expired_datetime = datetime.strptime(expired_datetime, r"%Y/%m/%d")
-    except ValueError:
-        expired_datetime = datetime.strptime(expired_datetime, r"%Y/%m/%d %H:%M")
-
+## the only subtrees built from the pages
+ARTICLE_PARSE_ONLY = ("#abstract-1", "div.sidebar-right-wrapper")
+LISTING_PARSE_ONLY = ("div.highwire-article-citation",)
 
-def extract_article_info(url: str, single_resq_timout: float = 60.) -> Optional["InfoItem"]:
-    resp = requests.get(url, timeout=single_resq_timout)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Failed to fetch  content; {resp.status_code}, {resp.content=}")
-    soup = BeautifulSoup(resp.content, "html.parser")
+def parse_article(content: bytes) -> "InfoItem":
+    """
+    the abstract and the post date of an article page, the title and links are filled by the listing
+    """
+    soup = parse_html(content, ARTICLE_PARSE_ONLY)
     abstract = soup.select_one("#abstract-1").prettify()
     abstract = html_to_info_item_markdown(abstract).strip()
 
-    post_at_str = soup.select_one("#block-system-main > div > div > div > div > div.sidebar-right-wrapper.grid-10.omega > div > div > div.panel-pane.pane-custom.pane-1 > div").text
+    post_at_str = soup.select_one("div.sidebar-right-wrapper.grid-10.omega > div > div > div.panel-pane.pane-custom.pane-1 > div").text
 
     pattern = r'(?i)(january|february|march|april|may|june|july|august|september|october|november|december) (\d{1,2}), (\d{4})'
     match = re.search(pattern, post_at_str)
@@ -44,61 +43,176 @@ def extract_article_info(url: str, single_resq_timout: float = 60.) -> Optional[
         pub_datetime = datetime(int(year), month, int(day), 23, 59, 59)
     else:
         pub_datetime = datetime.now()
-    
-    if expired_datetime is None or pub_datetime > expired_datetime:
-        result = {
-            "title": "",
-            "content": abstract,
-            "pub_datetime": pub_datetime,
-            "links": [],
-            "tags": [],
-        }
-    else:
-        result = None
-    return result
-    
 
-def extract_page_info(url: str, single_resq_timout: float = 60.) -> List["InfoItem"]:
-    
-    resp = requests.get(url, timeout=single_resq_timout)
+    return {
+        "title": "",
+        "content": abstract,
+        "pub_datetime": pub_datetime,
+        "links": [],
+        "tags": [],
+    }
+
+
+def extract_article_info(
+    url: str,
+    single_resq_timout: float = 60.,
+    client: Optional["HttpClient"] = None,
+    expired_datetime: Optional[datetime] = None,
+) -> Optional["InfoItem"]:
+    """
+    :return: the article info, None if it is published before `expired_datetime`
+    """
+    client = client or get_client()
+    resp = client.get(url, timeout=single_resq_timout)
     if resp.status_code != 200:
         raise RuntimeError(f"Failed to fetch  content; {resp.status_code}, {resp.content=}")
-    soup = BeautifulSoup(resp.content, "html.parser")
-    
-    results = []
+    result = run_parser(parse_article, resp.content)
+    if expired_datetime is None or result["pub_datetime"] > expired_datetime:
+        return result
+    return None
+
+
+def parse_listing(content: bytes) -> List[dict]:
+    """
+    :return: the title, link and pdf link of the articles on a listing page, newest first
+    """
+    soup = parse_html(content, LISTING_PARSE_ONLY)
+
+    overviews = []
     paper_overviews = soup.select("div.highwire-article-citation.highwire-citation-type-highwire-article")
     for paper_overview in paper_overviews:
         title = paper_overview.select_one("span.highwire-cite-title").text.strip()
         article_url_suffix = paper_overview.select_one("a.highwire-cite-linked-title").attrs["href"]
-        link = f"https://www.biorxiv.org{article_url_suffix}"
-        pdf_link = f"https://www.biorxiv.org{article_url_suffix}.full.pdf"
-        time_start = datetime.now()
-        article_result = extract_article_info(link, single_resq_timout)
-        time_end = datetime.now()
-        if article_result is None:
-            break
-        delta_sec = (time_end - time_start).total_seconds()
-        sleep_time = max(0, single_resq_timout - delta_sec) * random.uniform(0.1, 0.7)
-        article_result["title"] = title
-        article_result["links"].append({"biorxiv": link})
-        article_result["links"].append({"pdf": pdf_link})
-        results.append(article_result)
-        time.sleep(sleep_time)
-    
-    return results
-
-def get_info(url: str, single_resq_timout: float = 10., max_items=100) -> List["InfoItem"]:
-    page_num = 0
-    results = []  # type: List["InfoItem"]
-    while len(results) < max_items:
-        page_url = f"{url}?page={page_num}"
-        page_results = extract_page_info(page_url, single_resq_timout)
-        if len(page_results) < 10:  # no more
-            results += page_results
-            break  # expired
-        page_num += 1
-
-    return results
+        overviews.append({
+            "title": title,
+            "link": f"https://www.biorxiv.org{article_url_suffix}",
+            "pdf_link": f"https://www.biorxiv.org{article_url_suffix}.full.pdf",
+        })
+    return overviews
+
+
+def extract_listing(
+    url: str,
+    single_resq_timout: float = 60.,
+    client: Optional["HttpClient"] = None,
+) -> List[dict]:
+    """
+    :return: the title, link and pdf link of the articles on a listing page, newest first
+    """
+    client = client or get_client()
+    with get_host_budget(BIORXIV_HOST):
+        resp = client.get(url, timeout=single_resq_timout)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Failed to fetch  content; {resp.status_code}, {resp.content=}")
+    return run_parser(parse_listing, resp.content)
+
+
+def iter_info(
+    url: str,
+    single_resq_timout: float = 10.,
+    max_items=100,
+    client: Optional["HttpClient"] = None,
+    state: Optional["SourceState"] = None,
+    max_in_flight: int = 4,
+    min_interval: float = 1.0,
+    max_pages: Optional[int] = None,
+) -> Iterator["InfoItem"]:
+    """
+    yield the new articles of a collection, newest first.
+
+    The article pages are fetched concurrently under the politeness budget of
+    the host, and the next listing page is prefetched while the articles of the
+    current one are fetched. As soon as a fetch finds an expired article, the
+    outstanding fetches of the articles listed after it are cancelled, and no
+    more fetch is submitted after a delivered one, since all the following ones
+    are older.
+
+    :param max_in_flight: max concurrent requests to biorxiv, shared by all the biorxiv sources
+    :param min_interval: min seconds between the starts of two requests to biorxiv
+    :param max_pages: max listing pages, None for no limit
+    """
+    client = client or get_client()
+    get_host_budget(BIORXIV_HOST, max_in_flight, min_interval)  # the first settings win
+    expired_datetime = state.since if state is not None else env_expired_datetime()
+    stopped = threading.Event()
+    ## the listing position of the first expired article found by a fetch, the newer ones are still fetched
+    expired_position = [float("inf")]
+    expired_lock = threading.Lock()
+    ## a fetch skipped after the stop, not to be mistaken for an expired article (None)
+    cancelled = object()
+
+    def fetch_article(position: int, link: str) -> Optional["InfoItem"]:
+        if stopped.is_set() or position > expired_position[0]:
+            return cancelled
+        with get_host_budget(BIORXIV_HOST):
+            if stopped.is_set() or position > expired_position[0]:
+                return cancelled
+            article = extract_article_info(link, single_resq_timout, client, expired_datetime)
+        if article is None:
+            with expired_lock:
+                expired_position[0] = min(expired_position[0], position)
+        return article
+
+    n_items = 0
+    n_submitted = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight + 1) as executor:
+        page_num = 0
+        listing = executor.submit(extract_listing, f"{url}?page={page_num}", single_resq_timout, client)  # type: Optional[Future]
+        pending = []
+        try:
+            while listing is not None and n_items < max_items:
+                overviews = listing.result()
+                listing = None
+                page_num += 1
+                if len(overviews) >= 10 and (max_pages is None or page_num < max_pages):
+                    ## a full page, there may be more
+                    listing = executor.submit(extract_listing, f"{url}?page={page_num}", single_resq_timout, client)
+
+                pending = []
+                reached_seen = False
+                for overview in overviews[:max_items - n_items]:
+                    if state is not None and state.is_seen(overview["link"]):
+                        ## delivered in the previous builds, so are the older ones,
+                        ## but the newer ones already submitted are still collected
+                        reached_seen = True
+                        break
+                    pending.append((overview, executor.submit(fetch_article, n_submitted, overview["link"])))
+                    n_submitted += 1
+
+                for overview, article in pending:
+                    article_result = article.result()
+                    if article_result is None or article_result is cancelled:  # expired
+                        stopped.set()
+                        break
+                    article_result["title"] = overview["title"]
+                    article_result["links"].append({"biorxiv": overview["link"]})
+                    article_result["links"].append({"pdf": overview["pdf_link"]})
+                    n_items += 1
+                    yield article_result
+
+                if reached_seen:
+                    stopped.set()
+                if stopped.is_set():
+                    break
+        finally:
+            ## cancel the outstanding work, the running ones see `stopped` and return early
+            stopped.set()
+            if listing is not None:
+                listing.cancel()
+            for _, article in pending:
+                article.cancel()
+
+
+def get_info(
+    url: str,
+    single_resq_timout: float = 10.,
+    max_items=100,
+    client: Optional["HttpClient"] = None,
+    state: Optional["SourceState"] = None,
+    max_in_flight: int = 4,
+    min_interval: float = 1.0,
+) -> List["InfoItem"]:
+    return list(iter_info(url, single_resq_timout, max_items, client, state, max_in_flight, min_interval))
 
 if __name__ == '__main__':
     url = "https://www.biorxiv.org/collection/biochemistry"
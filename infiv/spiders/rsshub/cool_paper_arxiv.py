@@ -1,26 +1,24 @@
-from typing import TYPE_CHECKING, List
-
-import feedparser
-import requests
-from bs4 import BeautifulSoup
+from typing import TYPE_CHECKING, List, Optional
 
+from infiv.http import get_client
+from infiv.parsing import parse_html
 from infiv.utils import strcut_time_to_datetime
 
 if TYPE_CHECKING:
+    from infiv.http import HttpClient
     from infiv.types import InfoItem, RSSPageDict
 
 
 def _extract_abstract(rss_summary: str) -> str:
-    soup = BeautifulSoup(rss_summary, "html.parser")
+    soup = parse_html(rss_summary, ("p",))
     paragraphs = soup.find_all("p")
     abstract = '\n\n'.join([p.text for p in paragraphs])  # to a single markdown
     return abstract
 
-def get_info(url: str, timeout: float=60.0) -> List["InfoItem"]:
-    resp = requests.get(url, timeout=timeout)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Failed to fetch rsshub cool papers arxiv content; {resp.status_code}, {resp.content=}")
-    content = feedparser.parse(resp.content)  # type: RSSPageDict
+def parse_feed(feed_content: bytes) -> List["InfoItem"]:
+    import feedparser
+
+    content = feedparser.parse(feed_content)  # type: RSSPageDict
 
     ##
     info_items = []  # type: List["InfoItem"]
@@ -53,6 +51,12 @@ def get_info(url: str, timeout: float=60.0) -> List["InfoItem"]:
     return info_items
 
 
+def get_info(url: str, timeout: float=60.0, client: Optional["HttpClient"] = None) -> List["InfoItem"]:
+    client = client or get_client()
+    ## the unchanged feed (304) reuses the parse of the last run
+    return client.conditional_get(url, parse_feed, timeout=timeout)
+
+
 if __name__ == "__main__":
     import os
     from urllib.parse import urljoin
@@ -1,19 +1,18 @@
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Optional
 
-import feedparser
-import requests
 from datetime import datetime
 
+from infiv.http import get_client
 from infiv.utils import strcut_time_to_datetime, html_to_info_item_markdown
 
 if TYPE_CHECKING:
+    from infiv.http import HttpClient
     from infiv.types import InfoItem, RSSPageDict
 
-def get_info(url: str, timeout: float = 60.) -> List["InfoItem"]:
-    resp = requests.get(url, timeout=timeout)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Failed to fetch rsshub cool papers arxiv content; {resp.status_code}, {resp.content=}")
-    content = feedparser.parse(resp.content)  # type: RSSPageDict
+def parse_feed(feed_content: bytes) -> List["InfoItem"]:
+    import feedparser
+
+    content = feedparser.parse(feed_content)  # type: RSSPageDict
     
     return [
         {
@@ -29,6 +28,11 @@ def get_info(url: str, timeout: float = 60.) -> List["InfoItem"]:
         for entry in content["entries"]
     ]
 
+def get_info(url: str, timeout: float = 60., client: Optional["HttpClient"] = None) -> List["InfoItem"]:
+    client = client or get_client()
+    ## the unchanged feed (304) reuses the parse of the last run
+    return client.conditional_get(url, parse_feed, timeout=timeout)
+
 if __name__ == "__main__":
     import os
     from urllib.parse import urljoin
@@ -1,28 +1,41 @@
 import os
 import random
 import time
-from typing import TYPE_CHECKING, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 from datetime import datetime
 
-import bs4
-import requests
-
+from infiv.http import get_client
+from infiv.parsing import parse_html, run_parser
 from infiv.utils import html_to_info_item_markdown
 
 if TYPE_CHECKING:
+    import bs4
+
+    from infiv.http import HttpClient
     from infiv.types import InfoItem
 
-assert "ZHIHU_COOKIE" in os.environ, "This function needs ZHIHU_COOKIE to get the info, please login zhihu web and f12 -> console -> type `document.cookie` to get the login infomation"
 headers = {
     'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36',
     'Sec-Ch-Ua-Platform': "Linux",
     'Sec-Ch-Ua-Mobile': "?0",
-    'Cookie': os.environ["ZHIHU_COOKIE"],
     'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8,zh-TW;q=0.7,ja;q=0.6,ak;q=0.5'
 }
 
+
+def get_headers() -> Dict[str, str]:
+    """
+    the request headers with the login cookie, checked when the spider runs instead of at import
+    """
+    assert "ZHIHU_COOKIE" in os.environ, "This function needs ZHIHU_COOKIE to get the info, please login zhihu web and f12 -> console -> type `document.cookie` to get the login infomation"
+    return {**headers, "Cookie": os.environ["ZHIHU_COOKIE"]}
+
+## the only subtrees built from the pages
+ANSWER_PARSE_ONLY = ("h1.QuestionHeader-title", "div.RichContent")
+ARTICLE_PARSE_ONLY = ("h1.Post-Title", "div.Post-RichTextContainer")
+LISTING_PARSE_ONLY = ("div.ContentItem",)
+
 def answer_extract(content: bytes) -> "InfoItem":
-    soup = bs4.BeautifulSoup(content, "html.parser")
+    soup = parse_html(content, ANSWER_PARSE_ONLY)
     question_title = soup.select_one("h1.QuestionHeader-title").text.strip()
     answer_html = soup.select_one("div.RichContent").prettify()
     answer_md = html_to_info_item_markdown(answer_html)
@@ -38,7 +51,7 @@ def answer_extract(content: bytes) -> "InfoItem":
     }
 
 def article_extract(content: bytes) -> "InfoItem":
-    soup = bs4.BeautifulSoup(content, "html.parser")
+    soup = parse_html(content, ARTICLE_PARSE_ONLY)
     title = soup.select_one("h1.Post-Title").text.strip()
     content_html = soup.select_one("div.Post-RichTextContainer").prettify()
     content_md = html_to_info_item_markdown(content_html)
@@ -54,21 +67,22 @@ def article_extract(content: bytes) -> "InfoItem":
     }
 
 
-def get_page(url: str, single_page_timeout: float=5.) -> Optional["InfoItem"]:
-    resp = requests.get(url, headers=headers, timeout=single_page_timeout)
+def get_page(url: str, single_page_timeout: float=5., client: Optional["HttpClient"] = None) -> Optional["InfoItem"]:
+    client = client or get_client()
+    resp = client.get(url, headers=get_headers(), timeout=single_page_timeout)
     if resp.status_code != 200:
         raise RuntimeError("cannot fetch zhihu page please check your cookie")
     if url.startswith("https://zhuanlan.zhihu.com"):
-        result = article_extract(resp.content)
+        result = run_parser(article_extract, resp.content)
         result["links"].append({"zhihu": url})
         return result
     elif url.startswith("https://www.zhihu.com/question"):
-        result = answer_extract(resp.content)
+        result = run_parser(answer_extract, resp.content)
         result["links"].append({"zhihu": url})
         return result
     return None
 
-def parse_recommand_item(soup: bs4.Tag) -> "InfoItem":
+def parse_recommand_item(soup: "bs4.Tag") -> "InfoItem":
     title_tag = soup.select_one('a[data-za-detail-view-element_name="Title"]')
     title = title_tag.text.strip()
     url = f"https:{title_tag.attrs['href']}"
@@ -83,7 +97,15 @@ def parse_recommand_item(soup: bs4.Tag) -> "InfoItem":
         "links": [{"zhihu": url}]
     }
 
-def get_info(url: str, single_page_timeout: float=5., max_items: int = 10) -> List["InfoItem"]:
+def listing_extract(content: bytes, max_items: Optional[int] = None) -> List["InfoItem"]:
+    """
+    the first `max_items` recommended items of a listing page, None for all of them
+    """
+    soup = parse_html(content, LISTING_PARSE_ONLY)
+    return [parse_recommand_item(item) for item in soup.select('div.ContentItem')[:max_items]]
+
+def get_info(url: str, single_page_timeout: float=5., max_items: int = 10, client: Optional["HttpClient"] = None) -> List["InfoItem"]:
+    client = client or get_client()
     # # fail to do so, this is a js wait need playright
     # page_urls = []
     # while len(page_urls) < max_items:
@@ -105,18 +127,11 @@ def get_info(url: str, single_page_timeout: float=5., max_items: int = 10) -> Li
 
     all_items = []
     while len(all_items) < max_items:
-        resp = requests.get(url, headers=headers, timeout=single_page_timeout)
+        resp = client.get(url, headers=get_headers(), timeout=single_page_timeout)
         if resp.status_code != 200:
             raise RuntimeError("cannot fetch zhihu time line please check your cookie")
-        soup = bs4.BeautifulSoup(resp.content, "html.parser")
-
-        recommand_items = soup.select('div.ContentItem')
-        all_items += recommand_items
-    all_items = all_items[:max_items]
-    
-    results = [parse_recommand_item(item) for item in all_items]
-    
-    return results
+        all_items += run_parser(listing_extract, resp.content, max_items - len(all_items))
+    return all_items[:max_items]
     
 
 if __name__ == '__main__':
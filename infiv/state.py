@@ -0,0 +1,136 @@
+"""
+Per-source incremental state of the builds.
+
+Every source keeps a high-water mark (the start time of its last delivered
+build) and the ids of its delivered items, so the spiders can stop paginating
+at already seen items and the build only parses and embeds the new ones.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Iterable, Optional, Set
+
+if TYPE_CHECKING:
+    from infiv.types import InfoItem
+
+logger = logging.getLogger(__name__)
+
+
+def parse_expired_datetime(expired_datetime: str) -> datetime:
+    """
+    parse the `EXPIRED_DAYTIME` format, "YYYY/MM/DD" or "YYYY/MM/DD HH:MM"
+    """
+    try:
+        return datetime.strptime(expired_datetime, r"%Y/%m/%d")
+    except ValueError:
+        return datetime.strptime(expired_datetime, r"%Y/%m/%d %H:%M")
+
+
+def env_expired_datetime() -> Optional[datetime]:
+    expired_datetime = os.environ.get("EXPIRED_DAYTIME", None)
+    if not expired_datetime:
+        return None
+    return parse_expired_datetime(expired_datetime)
+
+
+def item_id(item: "InfoItem") -> str:
+    """
+    the id of an item, its first link or the hash of its title if it has no link
+    """
+    for link in item["links"]:
+        if isinstance(link, str):
+            return link
+        if isinstance(link, dict) and link:
+            return next(iter(link.values()))
+    return "title:" + hashlib.sha1(item["title"].encode("utf-8")).hexdigest()
+
+
+class SourceState:
+    """
+    the state of a single source handed to the spider.
+
+    :param since: only the items published after it are new, None for no limit
+    """
+
+    def __init__(self, key: str, since: Optional[datetime], seen_ids: Set[str]):
+        self.key = key
+        self.since = since
+        self._seen_ids = seen_ids
+
+    def is_seen(self, item_id: str) -> bool:
+        return item_id in self._seen_ids
+
+
+class StateStore:
+    """
+    sqlite store of the source states.
+
+    :param path: path of the sqlite file
+    :param initial_days: `since` of a source never delivered is this many days ago
+    :param max_age_days: forget the seen ids older than this many days
+    """
+
+    def __init__(self, path: str = "./.cache/state.sqlite", initial_days: float = 1.0, max_age_days: float = 90.0):
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.initial_days = initial_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (key TEXT PRIMARY KEY, high_water REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS seen (
+                key TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (key, item_id)
+            );
+            """
+        )
+        self._conn.execute("DELETE FROM seen WHERE seen_at < ?", (time.time() - max_age_days * 24 * 3600,))
+        self._conn.commit()
+
+    def high_water(self, key: str) -> Optional[datetime]:
+        with self._lock:
+            row = self._conn.execute("SELECT high_water FROM sources WHERE key = ?", (key,)).fetchone()
+        return datetime.fromtimestamp(row[0]) if row is not None else None
+
+    def source(self, key: str, since: Optional[datetime] = None) -> SourceState:
+        """
+        :param since: override the high-water mark of the source, e.g. from `EXPIRED_DAYTIME`
+        """
+        if since is None:
+            since = self.high_water(key)
+        if since is None:
+            since = datetime.now() - timedelta(days=self.initial_days)
+        with self._lock:
+            seen_ids = {row[0] for row in self._conn.execute("SELECT item_id FROM seen WHERE key = ?", (key,))}
+        return SourceState(key, since, seen_ids)
+
+    def commit(self, key: str, high_water: Optional[datetime], items: Iterable["InfoItem"]):
+        """
+        record the delivered items of a source and move its high-water mark
+
+        :param high_water: None to keep the high-water mark, e.g. of a source failing after some items
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seen (key, item_id, seen_at) VALUES (?, ?, ?)",
+                [(key, item_id(item), now) for item in items],
+            )
+            if high_water is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources (key, high_water) VALUES (?, ?)",
+                    (key, high_water.timestamp()),
+                )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,386 @@
+"""
+A columnar table of the items of a build.
+
+The spiders and the renderer deal with `InfoItem` dicts, but a build holds
+tens of thousands of them, so between fetching and rendering they are kept
+column-wise: the subjects, sources and tags are interned into categorical
+codes, the publish times are a `datetime64` column, the texts are object
+columns and the links (and tags) are flat arrays with row offsets. Filtering,
+grouping and sorting are then numpy operations over the columns, and a row is
+only turned back into a dict when it is accessed.
+"""
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from infiv.state import item_id
+
+if TYPE_CHECKING:
+    from infiv.types import InfoItem
+
+_DATETIME_UNIT = "datetime64[us]"
+
+
+class Categories:
+    """
+    interned strings, shared by the tables concatenated together
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names = []  # type: List[str]
+        self._codes = {}  # type: Dict[str, int]
+        for name in names:
+            self.code(name)
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def codes(self, names: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.code(name) for name in names), dtype=np.int32)
+
+    def lookup(self, name: str) -> int:
+        """
+        :return: the code of `name`, -1 if it is not interned
+        """
+        return self._codes.get(name, -1)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.asarray(self.names, dtype=object)[codes] if len(codes) else np.zeros(0, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def _to_naive(value: datetime) -> datetime:
+    ## datetime64 has no timezone, the aware ones are stored in local time like the naive ones
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _ragged_take(offsets: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the new offsets and the positions in the flat array of the rows `indices`
+    """
+    starts = offsets[indices]
+    lengths = offsets[indices + 1] - starts
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    ## position k of the output row r is starts[r] + k
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return new_offsets, positions
+
+
+class ItemTable:
+    """
+    column-wise storage of the items.
+
+    `table[i]` is the `InfoItem` dict of a row, `table[mask]` and
+    `table[indices]` are new tables of the selected rows.
+
+    :param title: object array of the titles
+    :param content: object array of the markdown contents
+    :param pub_datetime: `datetime64[us]` array of the publish times
+    :param subject_codes: codes of the subjects in `subjects`
+    :param source_codes: codes of the sources in `sources`
+    :param tag_offsets: the tags of row i are `tag_codes[tag_offsets[i]:tag_offsets[i + 1]]`
+    :param tag_codes: codes of the tags in `tags`
+    :param link_offsets: the links of row i are at `link_offsets[i]:link_offsets[i + 1]`
+    :param link_names: object array of the link texts, None for the plain url links
+    :param link_urls: object array of the link urls
+    :param score: the rerank scores, nan if not scored
+    :param embeddings: (n, dim) embedding matrix, None if not embedded
+    """
+
+    def __init__(
+        self,
+        title: np.ndarray,
+        content: np.ndarray,
+        pub_datetime: np.ndarray,
+        subject_codes: np.ndarray,
+        source_codes: np.ndarray,
+        tag_offsets: np.ndarray,
+        tag_codes: np.ndarray,
+        link_offsets: np.ndarray,
+        link_names: np.ndarray,
+        link_urls: np.ndarray,
+        score: Optional[np.ndarray] = None,
+        embeddings: Optional[np.ndarray] = None,
+        subjects: Optional[Categories] = None,
+        sources: Optional[Categories] = None,
+        tags: Optional[Categories] = None,
+    ):
+        self.title = title
+        self.content = content
+        self.pub_datetime = pub_datetime
+        self.subject_codes = subject_codes
+        self.source_codes = source_codes
+        self.tag_offsets = tag_offsets
+        self.tag_codes = tag_codes
+        self.link_offsets = link_offsets
+        self.link_names = link_names
+        self.link_urls = link_urls
+        self.score = score if score is not None else np.full(len(title), np.nan)
+        self.embeddings = embeddings
+        self.subjects = subjects if subjects is not None else Categories()
+        self.sources = sources if sources is not None else Categories()
+        self.tags = tags if tags is not None else Categories()
+
+    ## construction
+
+    @classmethod
+    def empty(
+        cls,
+        subjects: Optional[Categories] = None,
+        sources: Optional[Categories] = None,
+        tags: Optional[Categories] = None,
+    ) -> "ItemTable":
+        return cls.from_items([], subjects=subjects, sources=sources, tags=tags)
+
+    @classmethod
+    def from_items(
+        cls,
+        items: Sequence["InfoItem"],
+        subject: Optional[str] = None,
+        source: str = "",
+        subjects: Optional[Categories] = None,
+        sources: Optional[Categories] = None,
+        tags: Optional[Categories] = None,
+    ) -> "ItemTable":
+        """
+        :param subject: the subject of all the items, None to read the `subject` of each item
+        :param source: the source of all the items
+        :param subjects: the categories to intern the subjects into, shared with other tables
+        """
+        subjects = subjects if subjects is not None else Categories()
+        sources = sources if sources is not None else Categories()
+        tags = tags if tags is not None else Categories()
+        n = len(items)
+
+        title = np.empty(n, dtype=object)
+        content = np.empty(n, dtype=object)
+        title[:] = [item["title"] for item in items]
+        content[:] = [item["content"] for item in items]
+        pub_datetime = np.array([_to_naive(item["pub_datetime"]) for item in items], dtype=_DATETIME_UNIT)
+
+        if subject is not None:
+            subject_codes = np.full(n, subjects.code(subject), dtype=np.int32)
+        else:
+            subject_codes = subjects.codes(item.get("subject", "unclass") for item in items)
+        source_codes = np.full(n, sources.code(source), dtype=np.int32)
+
+        tag_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(item["tags"]) for item in items], out=tag_offsets[1:])
+        tag_codes = tags.codes(tag for item in items for tag in item["tags"])
+
+        link_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(item["links"]) for item in items], out=link_offsets[1:])
+        link_names = np.empty(link_offsets[-1], dtype=object)
+        link_urls = np.empty(link_offsets[-1], dtype=object)
+        position = 0
+        for item in items:
+            for link in item["links"]:
+                if isinstance(link, dict):
+                    link_names[position], link_urls[position] = next(iter(link.items()))
+                else:
+                    link_names[position], link_urls[position] = None, link
+                position += 1
+
+        score = np.array([item.get("score", np.nan) for item in items], dtype=np.float64)
+        return cls(
+            title, content, pub_datetime, subject_codes, source_codes,
+            tag_offsets, tag_codes, link_offsets, link_names, link_urls,
+            score=score, subjects=subjects, sources=sources, tags=tags,
+        )
+
+    @classmethod
+    def concat(cls, tables: Sequence["ItemTable"]) -> "ItemTable":
+        """
+        concatenate the tables sharing the same categories
+        """
+        if not tables:
+            return cls.empty()
+        first = tables[0]
+        assert all(
+            table.subjects is first.subjects and table.sources is first.sources and table.tags is first.tags
+            for table in tables
+        ), "only the tables with shared categories can be concatenated"
+
+        def concat_offsets(offsets_list: List[np.ndarray]) -> np.ndarray:
+            shifts = np.cumsum([0] + [offsets[-1] for offsets in offsets_list[:-1]])
+            return np.concatenate([[0]] + [offsets[1:] + shift for offsets, shift in zip(offsets_list, shifts)])
+
+        with_embeddings = [table.embeddings for table in tables if len(table)]
+        if with_embeddings and all(embeddings is not None for embeddings in with_embeddings):
+            embeddings = np.concatenate(with_embeddings)
+        else:
+            embeddings = None
+        return cls(
+            np.concatenate([table.title for table in tables]),
+            np.concatenate([table.content for table in tables]),
+            np.concatenate([table.pub_datetime for table in tables]),
+            np.concatenate([table.subject_codes for table in tables]),
+            np.concatenate([table.source_codes for table in tables]),
+            concat_offsets([table.tag_offsets for table in tables]).astype(np.int64),
+            np.concatenate([table.tag_codes for table in tables]),
+            concat_offsets([table.link_offsets for table in tables]).astype(np.int64),
+            np.concatenate([table.link_names for table in tables]),
+            np.concatenate([table.link_urls for table in tables]),
+            score=np.concatenate([table.score for table in tables]),
+            embeddings=embeddings,
+            subjects=first.subjects,
+            sources=first.sources,
+            tags=first.tags,
+        )
+
+    ## row access
+
+    def __len__(self) -> int:
+        return len(self.title)
+
+    def row(self, index: int) -> "InfoItem":
+        link_start, link_end = self.link_offsets[index], self.link_offsets[index + 1]
+        links = [
+            url if name is None else {name: url}
+            for name, url in zip(self.link_names[link_start:link_end], self.link_urls[link_start:link_end])
+        ]
+        tag_start, tag_end = self.tag_offsets[index], self.tag_offsets[index + 1]
+        item = {
+            "title": self.title[index],
+            "content": self.content[index],
+            "links": links,
+            "pub_datetime": self.pub_datetime[index].astype(datetime),
+            "tags": [self.tags.names[code] for code in self.tag_codes[tag_start:tag_end]],
+            "subject": self.subjects.names[self.subject_codes[index]],
+        }  # type: InfoItem
+        if not np.isnan(self.score[index]):
+            item["score"] = float(self.score[index])
+        return item
+
+    def __getitem__(self, key: Union[int, np.integer, np.ndarray, Sequence[int]]) -> Union["InfoItem", "ItemTable"]:
+        if isinstance(key, (int, np.integer)):
+            return self.row(int(key))
+        return self.take(key)
+
+    def __iter__(self) -> Iterator["InfoItem"]:
+        return (self.row(index) for index in range(len(self)))
+
+    ## vectorized operations
+
+    def take(self, indices: Union[np.ndarray, Sequence[int]]) -> "ItemTable":
+        """
+        the table of the rows `indices` (integer indices or a boolean mask), in that order
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = indices.astype(np.int64, copy=False)
+        tag_offsets, tag_positions = _ragged_take(self.tag_offsets, indices)
+        link_offsets, link_positions = _ragged_take(self.link_offsets, indices)
+        return ItemTable(
+            self.title[indices],
+            self.content[indices],
+            self.pub_datetime[indices],
+            self.subject_codes[indices],
+            self.source_codes[indices],
+            tag_offsets,
+            self.tag_codes[tag_positions],
+            link_offsets,
+            self.link_names[link_positions],
+            self.link_urls[link_positions],
+            score=self.score[indices],
+            embeddings=self.embeddings[indices] if self.embeddings is not None else None,
+            subjects=self.subjects,
+            sources=self.sources,
+            tags=self.tags,
+        )
+
+    def filter(self, mask: np.ndarray) -> "ItemTable":
+        return self.take(mask)
+
+    def subject_names(self) -> np.ndarray:
+        return self.subjects.decode(self.subject_codes)
+
+    def has_tag(self, tag: str) -> np.ndarray:
+        """
+        :return: the mask of the rows tagged with `tag`
+        """
+        code = self.tags.lookup(tag)
+        if code < 0 or len(self.tag_codes) == 0:
+            return np.zeros(len(self), dtype=bool)
+        row_of_tag = np.repeat(np.arange(len(self)), np.diff(self.tag_offsets))
+        mask = np.zeros(len(self), dtype=bool)
+        mask[row_of_tag[self.tag_codes == code]] = True
+        return mask
+
+    def from_source(self, source: str) -> np.ndarray:
+        """
+        :return: the mask of the rows fetched from `source`
+        """
+        return self.source_codes == self.sources.lookup(source)
+
+    def published_after(self, since: Optional[datetime]) -> np.ndarray:
+        """
+        :return: the mask of the rows published after `since`, all rows if it is None
+        """
+        if since is None:
+            return np.ones(len(self), dtype=bool)
+        return self.pub_datetime > np.datetime64(_to_naive(since), "us")
+
+    def item_ids(self) -> np.ndarray:
+        """
+        :return: the `infiv.state.item_id` of each row
+        """
+        ids = np.empty(len(self), dtype=object)
+        has_link = np.diff(self.link_offsets) > 0
+        ids[has_link] = self.link_urls[self.link_offsets[:-1][has_link]]
+        for index in np.flatnonzero(~has_link):
+            ids[index] = item_id({"title": self.title[index], "links": []})
+        return ids
+
+    def merge(self, labels: np.ndarray) -> "ItemTable":
+        """
+        merge the rows of a same cluster into the first one, with the union of their links and tags.
+
+        :param labels: the cluster of each row, labeled by the index of its first row like `infiv.merge.connected_components`
+        """
+        first_rows = np.sort(np.unique(labels, return_index=True)[1])
+        heads = labels[first_rows]
+        merged = self.take(heads)
+        cluster_sizes = np.bincount(labels, minlength=len(self))[heads]
+        if (cluster_sizes == 1).all():
+            return merged
+
+        ## only the links and tags of the merged clusters are rebuilt row by row
+        members = {}  # type: Dict[int, List[int]]
+        for index, label in enumerate(labels.tolist()):
+            members.setdefault(label, []).append(index)
+        links, tags = [], []  # type: List[list], List[list]
+        for head in heads.tolist():
+            head_links, head_tags = [], []
+            seen_links = set()
+            for member in members[head]:
+                for position in range(self.link_offsets[member], self.link_offsets[member + 1]):
+                    link = (self.link_names[position], self.link_urls[position])
+                    if link not in seen_links:
+                        seen_links.add(link)
+                        head_links.append(position)
+                member_tags = self.tag_codes[self.tag_offsets[member]:self.tag_offsets[member + 1]]
+                head_tags += [code for code in member_tags.tolist() if code not in head_tags]
+            links.append(head_links)
+            tags.append(head_tags)
+
+        merged.link_offsets = np.zeros(len(heads) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in links], out=merged.link_offsets[1:])
+        link_positions = np.array([position for row in links for position in row], dtype=np.int64)
+        merged.link_names = self.link_names[link_positions]
+        merged.link_urls = self.link_urls[link_positions]
+        merged.tag_offsets = np.zeros(len(heads) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in tags], out=merged.tag_offsets[1:])
+        merged.tag_codes = np.array([code for row in tags for code in row], dtype=np.int32)
+        return merged
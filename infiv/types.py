@@ -4,13 +4,18 @@ if TYPE_CHECKING:
     from datetime import datetime
     import time
 
-class InfoItem(TypedDict):
+class _InfoItemBase(TypedDict):
     title: str
     links: List[Dict[str, str]]  # list of [text, url]
     content: str  # in markdown format
     pub_datetime: "datetime"
     tags: List[str]
 
+class InfoItem(_InfoItemBase, total=False):
+    ## filled by the build rather than the spiders
+    subject: str  # from the source config
+    score: float  # rerank score, only with embeddings
+
 class HandlerFunc(Protocol):
     def __call__(self, url: str, **kwds: Any) -> InfoItem:
         ...
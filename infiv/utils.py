@@ -1,9 +1,16 @@
-from typing import TYPE_CHECKING, List
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional
 
 if TYPE_CHECKING:
     from datetime import datetime
     import time
 
+logger = logging.getLogger(__name__)
+
 
 def strcut_time_to_datetime(struct_time: "time.struct_time") -> "datetime":
     from datetime import datetime
@@ -16,26 +23,94 @@ def strcut_time_to_datetime(struct_time: "time.struct_time") -> "datetime":
         second=struct_time.tm_sec,
     )
 
+
+def get_host(url: str) -> str:
+    """
+    the host key of a source url, the url itself if it is not a full url, e.g. `cs.CV`.
+
+    The sources hitting a same host share its concurrency limit in `infiv.pipeline`
+    and its circuit breaker in `infiv.retry`.
+    """
+    from urllib.parse import urlparse
+
+    netloc = urlparse(url).netloc
+    return netloc if netloc else url
+
+class HtmlToMarkdownConverter:
+    """
+    Convert html to info item markdown:
+    1. remove all head tag, replace it as a bold text
+    2. remove all the base64 image
+
+    The regexes and the markdownify converter are built once, and the results
+    are kept in a bounded LRU cache keyed by the hash of the html.
+
+    :param backend: the BeautifulSoup parser used by markdownify, e.g. "html.parser" or "lxml"
+    :param cache_size: max number of cached results, 0 to disable
+    """
+
+    _img_pattern = re.compile(r'<img\s+[^>]*src=["\']data:image/[^"\']*["\'][^>]*alt=["\']([^"\']*)["\'][^>]*>', re.IGNORECASE)
+    _heading_pattern = re.compile(r"^#.*$", re.MULTILINE)
+
+    def __init__(self, backend: str = "html.parser", cache_size: int = 4096):
+        from markdownify import MarkdownConverter
+
+        if backend == "lxml":
+            try:
+                import lxml  # noqa: F401
+            except ImportError:
+                logger.warning("lxml is not installed, fall back to html.parser")
+                backend = "html.parser"
+        self.backend = backend
+        self.cache_size = cache_size
+        self._converter = MarkdownConverter(heading_style="ATX")
+        self._cache = OrderedDict()  # type: OrderedDict[bytes, str]
+        self._lock = threading.Lock()
+
+    def _convert(self, html: str) -> str:
+        from bs4 import BeautifulSoup
+
+        html = self._img_pattern.sub(lambda m: f'image: {m.group(1)}', html)
+        markdown = self._converter.convert_soup(BeautifulSoup(html, self.backend))
+        markdown = "\n".join(markdown.splitlines())
+        # 去掉标题的 '#' 和空格，并加粗
+        return self._heading_pattern.sub(lambda m: f"**{m.group(0).lstrip('#').strip()}**", markdown)
+
+    def convert(self, html: str) -> str:
+        if self.cache_size <= 0:
+            return self._convert(html)
+        key = hashlib.blake2b(html.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        markdown = self._convert(html)
+        with self._lock:
+            self._cache[key] = markdown
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return markdown
+
+
+_converter = None  # type: Optional[HtmlToMarkdownConverter]
+
+
+def configure_html_converter(**kwargs) -> HtmlToMarkdownConverter:
+    """
+    replace the converter used by `html_to_info_item_markdown` by one built with `kwargs`
+    """
+    global _converter
+    _converter = HtmlToMarkdownConverter(**kwargs)
+    return _converter
+
+
 def html_to_info_item_markdown(html: str) -> str:
     """
     info item markdown means:
     1. remove all head tag, replace it as a bold text
     2. remove all the base64 image
     """
-    import re
-    from markdownify import markdownify as md
-
-    img_pattern = re.compile(r'<img\s+[^>]*src=["\']data:image/[^"\']*["\'][^>]*alt=["\']([^"\']*)["\'][^>]*>', re.IGNORECASE)
-    html = img_pattern.sub(lambda m: f'image: {m.group(1)}', html)
-
-    markdown = md(html, heading_style="ATX")
-    
-    # handle the 
-    lines = markdown.splitlines()
-    for i, line in enumerate(lines):
-        if line.startswith('#'):  # 检查是否是标题
-            # 去掉标题的 '#' 和空格，并加粗
-            title_text = line.lstrip('#').strip()
-            lines[i] = f"**{title_text}**"  # 加粗标题
-    
-    return "\n".join(lines)
+    global _converter
+    if _converter is None:
+        _converter = HtmlToMarkdownConverter()
+    return _converter.convert(html)
@@ -0,0 +1,56 @@
+"""
+The growable memory-mapped float32 matrices behind the embedding cache and the search index.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+class VectorFile:
+    """
+    A float32 matrix memory-mapped from a file, its rows grown by doubling.
+
+    The owner persists `capacity` next to its index, e.g. in a sqlite meta table,
+    and gives it back when reopening the file.
+
+    :param path: path of the matrix file
+    :param dim: number of columns
+    :param capacity: number of rows of the existing file, 0 for a new one
+    """
+
+    def __init__(self, path: str, dim: int, capacity: int = 0):
+        self.path = path
+        self.dim = dim
+        self.capacity = capacity
+        self.array = None  # type: Optional[np.memmap]
+        self._open()
+
+    def _open(self):
+        self.array = None
+        if self.capacity == 0:
+            return
+        with open(self.path, "ab") as f:
+            f.truncate(self.capacity * self.dim * 4)
+        self.array = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def grow(self, min_capacity: int) -> bool:
+        """
+        :return: whether the capacity changed, to be persisted by the owner
+        """
+        capacity = max(self.capacity, 1024)
+        while capacity < min_capacity:
+            capacity *= 2
+        if capacity == self.capacity:
+            return False
+        self.flush()
+        self.capacity = capacity
+        self._open()
+        return True
+
+    def flush(self):
+        if self.array is not None:
+            self.array.flush()
+
+    def close(self):
+        self.flush()
+        self.array = None
@@ -0,0 +1,43 @@
+from infiv.spiders import bilibili
+from infiv.state import SourceState, item_id
+
+
+class _Response:
+    status_code = 200
+    content = b""
+
+
+class _Client:
+    def get(self, url, **kwargs):
+        return _Response()
+
+
+LISTING = [
+    ("BV1aa", "https://www.bilibili.com/video/BV1aa/?spm_id_from=333.1007"),
+    ("BV1bb", "https://www.bilibili.com/video/BV1bb/"),
+    ("BV1cc", "https://www.bilibili.com/video/BV1cc?p=2"),
+]
+
+
+def test_items_are_identified_by_the_video_id(monkeypatch):
+    monkeypatch.setenv("BILIBILI_COOKIE", "x")
+    monkeypatch.setattr(bilibili, "run_parser", lambda parse, content: {"title": "t", "content": "c"})
+
+    item = bilibili.get_page(LISTING[0][1], client=_Client())
+
+    assert item_id(item) == "https://www.bilibili.com/video/BV1aa"
+
+
+def test_a_delivered_video_is_skipped_under_another_url(monkeypatch):
+    monkeypatch.setenv("BILIBILI_COOKIE", "x")
+    monkeypatch.setattr(bilibili, "run_parser", lambda parse, content: LISTING)
+    state = SourceState("bilibili", since=None, seen_ids={
+        "https://www.bilibili.com/video/BV1aa",  # delivered under another url
+        "https://www.bilibili.com/video/BV1bb/",  # delivered before the canonical urls
+    })
+
+    video_urls = bilibili.collect_recommands(
+        "https://www.bilibili.com/", client=_Client(), state=state, max_listing_requests=1,
+    )
+
+    assert video_urls == [LISTING[2][1]]
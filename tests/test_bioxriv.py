@@ -0,0 +1,50 @@
+import time
+from datetime import datetime
+
+from infiv.spiders import bioxriv
+from infiv.state import SourceState
+
+
+def _overview(i: int) -> dict:
+    link = f"https://www.biorxiv.org/content/{i}"
+    return {"title": f"t{i}", "link": link, "pdf_link": f"{link}.full.pdf"}
+
+
+def test_iter_info_keeps_new_articles_listed_before_a_seen_one(monkeypatch):
+    overviews = [_overview(i) for i in range(5)]
+    monkeypatch.setattr(bioxriv, "extract_listing", lambda url, timeout, client: overviews)
+    monkeypatch.setattr(
+        bioxriv,
+        "extract_article_info",
+        lambda url, timeout, client, expired_datetime: {
+            "title": "", "content": "", "pub_datetime": datetime.now(), "links": [], "tags": [],
+        },
+    )
+    ## the 4th article is delivered in a previous build, so is the 5th
+    state = SourceState("bioxriv", since=None, seen_ids={overviews[3]["link"], overviews[4]["link"]})
+
+    items = list(bioxriv.iter_info("https://www.biorxiv.org/collection/x", client=object(), state=state, min_interval=0.0))
+
+    assert [item["title"] for item in items] == ["t0", "t1", "t2"]
+
+
+def test_iter_info_cancels_the_articles_listed_after_an_expired_one(monkeypatch):
+    overviews = [_overview(i) for i in range(8)]
+    monkeypatch.setattr(bioxriv, "extract_listing", lambda url, timeout, client: overviews)
+    fetched = []
+
+    def extract_article_info(url, timeout, client, expired_datetime):
+        fetched.append(url)
+        if url == overviews[2]["link"]:
+            return None  # expired, so are the older ones
+        time.sleep(0.05)  # the expired one is found while the others are in flight
+        return {"title": "", "content": "", "pub_datetime": datetime.now(), "links": [], "tags": []}
+
+    monkeypatch.setattr(bioxriv, "extract_article_info", extract_article_info)
+
+    items = list(bioxriv.iter_info(
+        "https://www.biorxiv.org/collection/x", client=object(), max_in_flight=1, min_interval=0.0,
+    ))
+
+    assert [item["title"] for item in items] == ["t0", "t1"]
+    assert sorted(fetched) == [overview["link"] for overview in overviews[:3]]
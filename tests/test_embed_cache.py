@@ -0,0 +1,52 @@
+import os
+import time
+
+import numpy as np
+
+from infiv.embed_cache import EmbeddingCache
+
+
+def _vectors(keys, dim=4):
+    return {key: np.full(dim, i + 1, dtype=np.float32) for i, key in enumerate(keys)}
+
+
+def test_put_many_skips_the_cached_keys(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), dim=4)
+    cache.put_many(_vectors(["a", "b"]))
+    cache.put_many({"b": np.zeros(4, dtype=np.float32), "c": np.full(4, 3, dtype=np.float32)})
+
+    got = cache.get_many(["a", "b", "c", "d"])
+
+    assert sorted(got) == ["a", "b", "c"]
+    np.testing.assert_array_equal(got["b"], np.full(4, 2))
+    assert len(cache) == 3
+
+
+def test_evicted_rows_are_reused(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), dim=4, max_items=2, max_age_days=None)
+    cache.put_many(_vectors(["a", "b", "c"]))
+    time.sleep(0.01)
+    cache.get_many(["b", "c"])  # a is the least recently used
+    assert cache.evict() == 1
+
+    cache.put_many(_vectors(["d"]))
+
+    rows = dict(cache._conn.execute("SELECT key, row FROM embeddings").fetchall())
+    assert rows["d"] == 0  # the row of a
+    assert sorted(cache.get_many(["a", "b", "c", "d"])) == ["b", "c", "d"]
+    cache.close()
+
+
+def test_reopen_keeps_the_next_row(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), dim=4)
+    cache.put_many(_vectors(["a", "b"]))
+    cache.close()
+    size = os.path.getsize(tmp_path / "vectors.f32")
+
+    cache = EmbeddingCache(str(tmp_path), dim=4)
+    cache.put_many(_vectors(["c"]))
+
+    rows = dict(cache._conn.execute("SELECT key, row FROM embeddings").fetchall())
+    assert sorted(rows.values()) == [0, 1, 2]
+    assert os.path.getsize(tmp_path / "vectors.f32") == size
+    cache.close()
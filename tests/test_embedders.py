@@ -0,0 +1,41 @@
+import numpy as np
+
+import infiv.embedders
+import infiv.retry
+from infiv.embedders import Embedder
+
+
+class _FlakyEmbedder(Embedder):
+    def __init__(self, n_failures: int, **kwargs):
+        super().__init__(model="flaky", dim=2, **kwargs)
+        self.n_failures = n_failures
+        self.calls = 0
+
+    def embed_batch(self, texts):
+        self.calls += 1
+        if self.calls <= self.n_failures:
+            raise RuntimeError("429 Too Many Requests")
+        return np.ones((len(texts), 2))
+
+
+def test_failed_batches_are_retried_after_an_exponential_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(infiv.embedders.time, "sleep", sleeps.append)
+    monkeypatch.setattr(infiv.retry.random, "uniform", lambda low, high: 0.0)
+    embedder = _FlakyEmbedder(3, max_retries=4, retry_base_delay=1.0, retry_max_delay=3.0)
+
+    vectors = embedder.embed(["a", "b"])
+
+    np.testing.assert_array_equal(vectors, np.ones((2, 2)))
+    assert sleeps == [1.0, 2.0, 3.0]
+
+
+def test_a_batch_failing_every_try_gets_zero_vectors(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(infiv.embedders.time, "sleep", sleeps.append)
+    embedder = _FlakyEmbedder(10, max_retries=2)
+
+    vectors = embedder.embed(["a"])
+
+    np.testing.assert_array_equal(vectors, np.zeros((1, 2)))
+    assert embedder.calls == 2 and len(sleeps) == 1
@@ -0,0 +1,41 @@
+from infiv.md_to_json import split_sections
+
+
+def _lines(text: str) -> list:
+    return text.splitlines(keepends=True)
+
+
+def test_split_sections_cuts_before_a_heading():
+    text = "# title\n### a\naaaa\n### b\nbbbb\n"
+
+    parts = list(split_sections(_lines(text), max_chars=20))
+
+    assert parts == ["# title\n### a\naaaa\n", "### b\nbbbb\n"]
+    assert "".join(parts) == text
+
+
+def test_split_sections_keeps_a_heading_in_a_code_block():
+    text = "### a\n```\n# not a heading\n```\n### b\n"
+
+    parts = list(split_sections(_lines(text), max_chars=30))
+
+    assert parts == ["### a\n```\n# not a heading\n```\n", "### b\n"]
+
+
+def test_split_sections_cuts_a_long_section_at_lines():
+    text = "### a\n" + "x" * 9 + "\n" + "y" * 9 + "\n" + "z" * 9 + "\n"
+
+    parts = list(split_sections(_lines(text), max_chars=20))
+
+    assert all(len(part) <= 20 for part in parts)
+    assert "".join(parts) == text
+    assert all(part.endswith("\n") for part in parts)
+
+
+def test_split_sections_hard_cuts_a_giant_line():
+    text = "### a\n" + "x" * 45 + "\n"
+
+    parts = list(split_sections(_lines(text), max_chars=20))
+
+    assert all(len(part) <= 20 for part in parts)
+    assert "".join(parts) == text
@@ -0,0 +1,32 @@
+import numpy as np
+
+from infiv.merge import cluster_by_embedding, cluster_by_minhash
+
+
+def test_cluster_by_minhash_merges_across_sources_only():
+    titles = ["Weekly digest issue 101", "Weekly digest issue 102", "Weekly digest issue 103", "Weekly digest issue 101"]
+    sources = np.array([0, 0, 0, 1])
+
+    labels = cluster_by_minhash(titles, threshold=0.5, sources=sources)
+
+    assert len(set(labels[:3].tolist())) == 3
+    assert labels[3] == labels[0]
+
+
+def test_cluster_by_minhash_never_merges_titles_without_words():
+    titles = ["", "!!!", "  ", "...", "A real title"]
+
+    labels = cluster_by_minhash(titles, sources=np.arange(len(titles)))
+
+    assert labels.tolist() == list(range(len(titles)))
+
+
+def test_cluster_by_embedding_merges_across_sources_only():
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [1.0, 0.01], [0.0, 1.0]], dtype=np.float32)
+    sources = np.array([0, 0, 1, 1])
+
+    labels = cluster_by_embedding(embeddings, threshold=0.95, block_size=2, sources=sources)
+
+    ## both items of the source 0 match the item of the source 1, the source 0 ones are never paired together
+    assert labels.tolist() == [0, 0, 0, 3]
+    assert cluster_by_embedding(embeddings[:2], sources=sources[:2]).tolist() == [0, 1]
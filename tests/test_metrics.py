@@ -0,0 +1,33 @@
+import json
+import time
+
+from infiv.metrics import Metrics
+
+
+def _history_line(created_at: float) -> str:
+    return json.dumps({"created_at": created_at, "metrics": {}}) + "\n"
+
+
+def test_history_drops_the_expired_lines(tmp_path):
+    path = tmp_path / "cache" / "history.jsonl"
+    path.parent.mkdir()
+    now = time.time()
+    path.write_text(_history_line(now - 10 * 86400) + "broken\n" + _history_line(now - 86400))
+    metrics = Metrics()
+    metrics.inc("infiv_source_retries_total", source="a")
+
+    metrics.write(json_path=None, prometheus_path=None, history_path=str(path), history_max_days=7)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["created_at"] == now - 86400
+    assert lines[1]["metrics"]["infiv_source_retries_total"]["samples"][0]["value"] == 1
+
+
+def test_history_is_appended_without_a_limit(tmp_path):
+    path = tmp_path / "history.jsonl"
+    path.write_text(_history_line(0.0))
+
+    Metrics().write(json_path=None, prometheus_path=None, history_path=str(path), history_max_days=None)
+
+    assert len(path.read_text().splitlines()) == 2
@@ -0,0 +1,32 @@
+import numpy as np
+
+from infiv.rank import rank_items, score_items
+
+
+def test_rank_items_groups_by_subject_and_sorts_by_score():
+    subjects = ["b", "a", "b", "a", "b"]
+    scores = np.array([0.1, 0.5, 0.9, 0.7, 0.3])
+
+    assert rank_items(subjects, scores).tolist() == [3, 1, 2, 4, 0]
+
+
+def test_rank_items_keeps_the_top_k_of_each_subject():
+    subjects = ["b", "a", "b", "a", "b", "c"]
+    scores = np.array([0.1, 0.5, 0.9, 0.7, 0.3, 0.0])
+
+    assert rank_items(subjects, scores, top_k=2).tolist() == [3, 1, 2, 4, 5]
+    assert rank_items(subjects, scores, top_k=1).tolist() == [3, 2, 5]
+
+
+def test_rank_items_without_scores_keeps_the_input_order():
+    subjects = ["b", "a", "b", "a", "b"]
+
+    assert rank_items(subjects).tolist() == [1, 3, 0, 2, 4]
+    assert rank_items(subjects, top_k=2).tolist() == [1, 3, 0, 2]
+    assert rank_items([]).tolist() == []
+
+
+def test_score_items():
+    embeddings = np.array([[1, 0], [0, 1]], dtype=np.float32)
+
+    np.testing.assert_allclose(score_items(embeddings, [2.0, -1.0]), [2.0, -1.0])
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from infiv.retry import FETCH_FAILED_TAG, CircuitBreaker, RetryScheduler
+
+
+def test_circuit_breaker_opens_and_lets_one_trial_through(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    now[0] = 11.0
+    assert breaker.allow()  # the trial
+    assert not breaker.allow()  # only one at a time
+    breaker.record_failure()
+    assert not breaker.allow()  # open again
+
+    now[0] = 22.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def _flaky(n_failures: int, calls: list):
+    async def fetch():
+        calls.append(time.monotonic())
+        if len(calls) <= n_failures:
+            raise RuntimeError("boom")
+        return [{"title": "ok"}]
+
+    return fetch
+
+
+def test_wrap_retries_until_a_success():
+    scheduler = RetryScheduler(max_retries=3, base_delay=0.01, jitter=False)
+    calls = []
+
+    result = asyncio.run(scheduler.wrap(_flaky(2, calls), "http://example.org/feed", "src")())
+
+    assert result == [{"title": "ok"}]
+    assert len(calls) == 3
+
+
+def test_wrap_returns_the_failed_items_after_the_last_retry():
+    scheduler = RetryScheduler(max_retries=2, base_delay=0.01, jitter=False)
+    calls = []
+
+    result = asyncio.run(scheduler.wrap(_flaky(5, calls), "http://example.org/feed", "src")())
+
+    assert len(calls) == 2
+    assert result[0]["tags"] == [FETCH_FAILED_TAG] and "boom" in result[0]["content"]
+
+
+def test_an_open_breaker_fails_the_other_sources_of_the_host_fast():
+    scheduler = RetryScheduler(max_retries=1, base_delay=0.01, failure_threshold=1, jitter=False)
+    first, second, other_host = [], [], []
+
+    asyncio.run(scheduler.wrap(_flaky(5, first), "http://example.org/a")())
+    result = asyncio.run(scheduler.wrap(_flaky(0, second), "http://example.org/b")())
+    asyncio.run(scheduler.wrap(_flaky(0, other_host), "http://example.com/a")())
+
+    assert second == [] and "circuit open for example.org" in result[0]["content"]
+    assert len(other_host) == 1
+
+
+def test_backoff_grows_up_to_the_cap():
+    scheduler = RetryScheduler(base_delay=1, factor=2, max_delay=5, jitter=False)
+
+    assert [scheduler.backoff(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+
+
+def test_wrap_gives_up_at_the_deadline():
+    scheduler = RetryScheduler(max_retries=3, base_delay=0.01, jitter=False, deadline=0.05)
+
+    async def slow():
+        await asyncio.sleep(1)
+        return []
+
+    start = time.monotonic()
+    result = asyncio.run(scheduler.wrap(slow, "http://example.org/a")())
+
+    assert time.monotonic() - start < 0.5
+    assert result[0]["tags"] == [FETCH_FAILED_TAG]
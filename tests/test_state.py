@@ -0,0 +1,62 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from infiv.state import StateStore, item_id
+
+
+def _item(i: int) -> dict:
+    return {"title": f"t{i}", "links": [{"src": f"http://example.org/{i}"}], "pub_datetime": datetime.now()}
+
+
+def test_commit_records_the_items_and_moves_the_high_water_mark(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = StateStore(path, initial_days=2)
+    first = store.source("a")
+    assert abs(first.since - (datetime.now() - timedelta(days=2))) < timedelta(minutes=1)
+
+    built_at = datetime.now().replace(microsecond=0)
+    store.commit("a", built_at, [_item(0), _item(1)])
+    store.close()
+
+    state = StateStore(path).source("a")
+    assert state.since == built_at
+    assert state.is_seen(item_id(_item(0))) and not state.is_seen(item_id(_item(2)))
+
+
+def test_commit_of_a_failed_source_keeps_its_high_water_mark(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = StateStore(path)
+    old = datetime(2026, 1, 1)
+    store.commit("a", old, [_item(0)])
+
+    ## failed after delivering the item 1
+    store.commit("a", None, [_item(1)])
+
+    state = store.source("a")
+    assert state.since == old
+    assert state.is_seen(item_id(_item(0))) and state.is_seen(item_id(_item(1)))
+
+
+
+def test_seen_ids_expire(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = StateStore(path)
+    store.commit("a", datetime.now(), [_item(0), _item(1)])
+    store.close()
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE seen SET seen_at = ? WHERE item_id = ?", (time.time() - 91 * 24 * 3600, item_id(_item(0))))
+    conn.commit()
+    conn.close()
+
+    state = StateStore(path, max_age_days=90).source("a")
+
+    assert not state.is_seen(item_id(_item(0)))
+    assert state.is_seen(item_id(_item(1)))
+
+
+def test_expired_datetime_overrides_the_high_water_mark(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite"))
+    store.commit("a", datetime(2026, 1, 1), [])
+
+    assert store.source("a", since=datetime(2025, 6, 1)).since == datetime(2025, 6, 1)
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from infiv.merge import connected_components
+from infiv.table import Categories, ItemTable
+
+NOW = datetime(2026, 1, 1, 12)
+
+
+def _item(i: int, links=None, tags=None, subject="s") -> dict:
+    return {
+        "title": f"t{i}",
+        "content": f"c{i}",
+        "links": links if links is not None else [{"src": f"http://example.org/{i}"}],
+        "pub_datetime": NOW - timedelta(hours=i),
+        "tags": tags if tags is not None else [],
+        "subject": subject,
+    }
+
+
+def test_rows_round_trip():
+    items = [_item(0, tags=["a", "b"]), _item(1, links=[]), _item(2, links=["http://x/2", {"pdf": "http://x/2.pdf"}])]
+
+    table = ItemTable.from_items(items, source="src")
+
+    assert len(table) == 3
+    assert list(table) == items
+    assert table.from_source("src").all()
+
+
+def test_take_keeps_the_ragged_links_and_tags_of_the_rows():
+    items = [_item(0, tags=["a"]), _item(1, links=[], tags=[]), _item(2, links=["http://x/2", "http://y/2"], tags=["b", "a"])]
+    table = ItemTable.from_items(items)
+    table.embeddings = np.arange(6, dtype=np.float32).reshape(3, 2)
+
+    taken = table.take([2, 0])
+
+    assert list(taken) == [items[2], items[0]]
+    np.testing.assert_array_equal(taken.embeddings, [[4, 5], [0, 1]])
+    assert list(table.take(np.array([False, True, False]))) == [items[1]]
+    assert len(table.take([])) == 0
+
+
+def test_concat_shares_the_categories():
+    subjects, sources, tags = Categories(), Categories(), Categories()
+    first = ItemTable.from_items([_item(0, tags=["a"])], source="x", subjects=subjects, sources=sources, tags=tags)
+    second = ItemTable.from_items([_item(1, tags=["b"])], source="y", subjects=subjects, sources=sources, tags=tags)
+
+    table = ItemTable.concat([first, second])
+
+    assert [item["title"] for item in table] == ["t0", "t1"]
+    assert table.from_source("y").tolist() == [False, True]
+    assert table[1]["tags"] == ["b"]
+
+
+def test_merge_keeps_the_first_row_of_each_cluster_with_the_union_of_links_and_tags():
+    items = [
+        _item(0, tags=["a"]),
+        _item(1),
+        _item(2, links=[{"src": "http://example.org/0"}, {"mirror": "http://mirror/0"}], tags=["b", "a"]),
+    ]
+    table = ItemTable.from_items(items)
+    ## the rows 0 and 2 are duplicates, a label is the index of the first row of its cluster
+    labels = connected_components(3, np.array([2]), np.array([0]))
+    assert labels.tolist() == [0, 1, 0]
+
+    merged = table.merge(labels)
+
+    assert [item["title"] for item in merged] == ["t0", "t1"]
+    assert merged[0]["links"] == [{"src": "http://example.org/0"}, {"mirror": "http://mirror/0"}]
+    assert merged[0]["tags"] == ["a", "b"]
+    assert merged[1] == items[1]
+
+
+def test_merge_without_duplicates_keeps_the_table():
+    table = ItemTable.from_items([_item(i) for i in range(3)])
+
+    assert list(table.merge(np.arange(3))) == list(table)
+
+
+def test_published_after_and_item_ids():
+    table = ItemTable.from_items([_item(0), _item(5, links=[])])
+
+    assert table.published_after(NOW - timedelta(hours=1)).tolist() == [True, False]
+    assert table.published_after(None).tolist() == [True, True]
+    ids = table.item_ids()
+    assert ids[0] == "http://example.org/0" and ids[1].startswith("title:")